@@ -0,0 +1,86 @@
+# app/bootstrap.py
+"""One-time, explicit initialisation of the database and the log files.
+
+Importing a module never touches the database or the disk: the log writer
+is started, the schema and the default users are set up by :func:`bootstrap`,
+called once by the application lifespan (cf. app.main) or by scripts before
+they use the crud functions.
+
+The schema is versioned with SQLite's ``PRAGMA user_version``, which holds
+a fingerprint of the declared schema (tables, columns, indexes, added
+columns, FTS indexes). When it matches, startup costs one pragma read; when
+it does not, the DDL runs inside ``BEGIN IMMEDIATE``, so processes starting
+together serialise on the write lock and all but the first find the version
+already current.
+"""
+
+from __future__ import annotations
+
+import threading
+import zlib
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+# modèles importés pour que SQLModel.metadata les connaisse tous
+from app.models import dialogue, memory, user  # noqa: F401
+from app.memory import db
+from app.memory.fts import TOKENIZER, _INDEXES
+from app.user.crud import ensure_default_users
+from app.utils.logger import logger, start_logging
+
+_lock = threading.Lock()
+_bootstrapped = False
+
+
+def schema_version() -> int:
+    """Fingerprint of the declared schema, as a positive 31-bit ``user_version``."""
+    parts = []
+    for table in SQLModel.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{column.name}:{column.type!r}" for column in table.columns)
+        parts.extend(sorted(f"{index.name}:{[c.name for c in index.columns]}" for index in table.indexes))
+    parts.extend(repr(added) for added in db._ADDED_COLUMNS)
+    parts.extend(f"{name}:{source}:{columns}:{TOKENIZER}" for name, (source, columns) in _INDEXES.items())
+    return zlib.crc32("\n".join(parts).encode()) & 0x7FFFFFFF
+
+
+def stored_version(connection: Connection) -> int:
+    return connection.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def migrate(engine: Optional[Engine] = None) -> bool:
+    """Bring the schema up to date; return whether any DDL was run."""
+    engine = engine or db.engine
+    version = schema_version()
+    with engine.connect() as connection:
+        if stored_version(connection) == version:
+            return False
+        connection.rollback()  # fin de la lecture : BEGIN IMMEDIATE ouvre la transaction
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+        try:
+            if stored_version(connection) == version:  # un autre processus vient de le faire
+                connection.rollback()
+                return False
+            db.init_db(connection)
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    logger.info(f"Schéma de la base mis à jour (version {version})")
+    return True
+
+
+def bootstrap(force: bool = False) -> None:
+    """Start the log writer, migrate the schema and create the default users, once per process."""
+    global _bootstrapped
+    with _lock:
+        if _bootstrapped and not force:
+            return
+        start_logging()
+        migrate()
+        ensure_default_users()
+        _bootstrapped = True
@@ -5,3 +5,65 @@ load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # ex. faux serveur local (app.dialogue.fake_server)
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "64"))  # requêtes simultanées par modèle
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))  # pool HTTP partagé
+OPENAI_RPM = float(os.getenv("OPENAI_RPM", "500"))  # requêtes par minute, 0 = sans limite
+OPENAI_TPM = float(os.getenv("OPENAI_TPM", "10000"))  # tokens par minute, 0 = sans limite
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))  # 429 / 5xx / réseau
+OPENAI_BREAKER_THRESHOLD = int(os.getenv("OPENAI_BREAKER_THRESHOLD", "5"))  # échecs avant ouverture
+OPENAI_BREAKER_COOLDOWN = float(os.getenv("OPENAI_BREAKER_COOLDOWN", "30"))  # secondes
+OPENAI_QUOTA_COOLDOWN = float(os.getenv("OPENAI_QUOTA_COOLDOWN", "300"))  # après insufficient_quota
+
+# Cache des réponses du modèle (cf. app.dialogue.response_cache)
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") not in ("0", "false", "False")
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "1024"))  # entrées en RAM
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))  # secondes
+RESPONSE_CACHE_MAX_ROWS = int(os.getenv("RESPONSE_CACHE_MAX_ROWS", "10000"))
+
+# Utilisateur auquel sont rattachés les souvenirs de dialogue
+DIALOGUE_USER = os.getenv("DIALOGUE_USER", "Noesis")
+
+# Contexte envoyé au modèle
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))  # souvenirs examinés par source
+
+# Recherche vectorielle sur les fragments (cf. app.memory.vector_index)
+FRAGMENT_EMBEDDER = os.getenv("FRAGMENT_EMBEDDER", "hashing").lower()  # hashing (local), openai, none
+FRAGMENT_EMBEDDING_MODEL = os.getenv("FRAGMENT_EMBEDDING_MODEL", "text-embedding-3-small")
+FRAGMENT_EMBEDDING_DIM = int(os.getenv("FRAGMENT_EMBEDDING_DIM", "256"))
+
+# Pensées de fond (cf. app.dialogue.background)
+BACKGROUND_REFRESH_INTERVAL = float(os.getenv("BACKGROUND_REFRESH_INTERVAL", "300"))  # secondes
+BACKGROUND_MAX_SURFACED = int(os.getenv("BACKGROUND_MAX_SURFACED", "3"))  # par contexte
+
+# Mémoire de travail (cf. app.context.working_memory)
+WORKING_MEMORY_CAPACITY = int(os.getenv("WORKING_MEMORY_CAPACITY", "256"))  # entrées gardées en RAM
+WORKING_MEMORY_FLUSH_INTERVAL = float(os.getenv("WORKING_MEMORY_FLUSH_INTERVAL", "5"))  # secondes
+
+# Accès aux souvenirs : last_accessed et renforcement écrits par lots (cf. app.memory.access_tracker)
+ACCESS_FLUSH_INTERVAL = float(os.getenv("ACCESS_FLUSH_INTERVAL", "5"))  # secondes
+ACCESS_MAX_PENDING = int(os.getenv("ACCESS_MAX_PENDING", "1000"))  # lignes en attente avant écriture
+
+# Métriques exposées sur /metrics (cf. app.utils.metrics)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") not in ("0", "false", "False")
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # requêtes SQL journalisées au-delà, 0 = jamais
+
+# Journalisation (cf. app.utils.logger)
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # niveau du journal JSON ; errors.log ne garde que ERROR
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))  # rotation de errors.log
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN", "midnight")  # rotation de arch.jsonl
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "7"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))  # au-delà, les enregistrements sont perdus
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1"))  # part gardée des enregistrements sous WARNING
+
+# Base SQLite des souvenirs
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./arch.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))  # = threadpool d'uvicorn (anyio)
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))  # négatif = KiB, ici 64 Mo
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "5"))  # secondes
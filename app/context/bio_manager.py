@@ -1,13 +1,131 @@
 # app/context/bio_manager.py
 
-from typing import List, TYPE_CHECKING
+import threading
+import weakref
+from typing import List, Optional, Tuple, TYPE_CHECKING
 
-from app.memory.crud import seek_souvenirs
+from app.memory.crud import get_souvenirs_by_keys, subscribe
 
 if TYPE_CHECKING:
     from app.models.memory import Souvenir
 
 
+# Toutes les bios vivantes, pour invalider leur cache quand un souvenir change
+_bios: "weakref.WeakSet[Bio]" = weakref.WeakSet()
+_bios_lock = threading.Lock()
+
+
+class Bio:
+    """
+    Gère dynamiquement une "bio" composée de souvenirs.
+    Chaque souvenir est référencé par sa clé `(souv_id, user_name)` : les
+    `souv_id` sont numérotés par utilisateur.
+
+    Les messages rendus sont gardés en cache : tant qu'aucun souvenir de la
+    bio n'est créé, modifié ou supprimé via app.memory.crud, la bio ne coûte
+    aucune requête.
+    """
+
+    def __init__(self, target: str, user_name: Optional[str] = None):
+        """
+        Initialise une bio pour une cible donnée : "arch" ou "chatgpt".
+        Chaque instance conserve sa propre liste de souvenirs ; `user_name`
+        est l'utilisateur par défaut des souvenirs ajoutés.
+        """
+        self.target = target
+        self.user_name = user_name
+        # Clés (souv_id, user_name) des souvenirs conservés dans la bio
+        self.bio_fragments: List[Tuple[int, str]] = []
+        self._messages: Optional[List[dict]] = None
+        self._generation = 0  # incrémenté à chaque invalidation
+        with _bios_lock:
+            _bios.add(self)
+
+    def append(self, fragment_id: int, user_name: Optional[str] = None):
+        """
+        Ajoute un souvenir à la bio s'il n'y est pas déjà.
+        """
+        key = self._key(fragment_id, user_name)
+        if key not in self.bio_fragments:
+            self.bio_fragments.append(key)
+            self.invalidate()
+
+    def remove(self, fragment_id: int, user_name: Optional[str] = None):
+        """
+        Supprime un souvenir de la bio s'il est présent.
+        """
+        key = self._key(fragment_id, user_name)
+        if key in self.bio_fragments:
+            self.bio_fragments.remove(key)
+            self.invalidate()
+
+    def __contains__(self, key: Tuple[int, str]) -> bool:
+        return key in self.bio_fragments
+
+    def _key(self, fragment_id: int, user_name: Optional[str]) -> Tuple[int, str]:
+        user_name = user_name or self.user_name
+        if user_name is None:
+            raise ValueError("Souvenir de bio sans utilisateur : les souv_id sont numérotés par utilisateur")
+        return fragment_id, user_name
+
+    def invalidate(self):
+        """
+        Oublie les messages rendus ; ils seront relus au prochain usage.
+        """
+        self._generation += 1
+        self._messages = None
+
+    def get_fragments(self) -> List["Souvenir"]:
+        """
+        Retourne les souvenirs correspondants aux IDs de la bio,
+        dans l'ordre d'insertion (une seule requête par clé primaire).
+        """
+        by_key = {(s.souv_id, s.user_name): s for s in get_souvenirs_by_keys(self.bio_fragments)}
+        return [by_key[key] for key in self.bio_fragments if key in by_key]
+
+    def to_context_messages(self) -> List[dict]:
+        """
+        Transforme les souvenirs de bio en messages formatés pour l'API OpenAI.
+        Par exemple, pour Arch : prefixés par [Bio-arch], pour ChatGPT : [Bio-chatgpt].
+        """
+        messages = self._messages
+        if messages is None:
+            generation = self._generation
+            prefix = f"[Bio-{self.target}] "
+            messages = [
+                {"role": "system", "content": prefix + souvenir.content}
+                for souvenir in self.get_fragments()
+            ]
+            # invalidée pendant la lecture : rendu peut-être périmé, pas gardé
+            if generation == self._generation:
+                self._messages = messages
+        # copies : les appelants peuvent modifier leur liste de messages
+        return [dict(message) for message in messages]
+
+
+def _invalidate_bios(souv_id: int, user_name: Optional[str] = None, **_):
+    """Invalide les bios qui référencent le souvenir créé, modifié ou supprimé."""
+    with _bios_lock:
+        bios = list(_bios)
+    for bio in bios:
+        if (souv_id, user_name) in bio:
+            bio.invalidate()
+
+
+def _invalidate_all_bios(tables=frozenset(), **_):
+    """Import en masse : toutes les bios sont relues."""
+    if "souvenir" in tables:
+        with _bios_lock:
+            bios = list(_bios)
+        for bio in bios:
+            bio.invalidate()
+
+
+subscribe("souvenir_created", _invalidate_bios)
+subscribe("souvenir_updated", _invalidate_bios)
+subscribe("souvenir_deleted", _invalidate_bios)
+subscribe("memory_imported", _invalidate_all_bios)
+
 # Exemple d'utilisation (à inclure dans ContextManager ou ailleurs) :
 # bio_arch = Bio("arch")
 # bio_arch.append("uuid-de-fragment")
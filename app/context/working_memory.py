@@ -0,0 +1,275 @@
+# app/context/working_memory.py
+"""Working memory: what is kept at hand for the task in progress.
+
+Entries live in RAM, grouped by task (``used_in_task``), and are written
+to the ``Working_memory`` table behind the caller's back: new entries and
+``last_accessed`` bumps accumulate and are flushed together, every
+``flush_interval`` seconds by a daemon thread, at exit, or on demand.
+The dialogue engine opens a task per request (``task`` parameter of
+``/think``), shows its entries in the context and keeps each exchange in
+it; the application reloads the stored tasks at startup and flushes at
+shutdown.
+
+The store is bounded: past ``capacity`` entries, the least recently used
+ones leave RAM (after being persisted; :meth:`WorkingMemory.load_task`
+brings a task back). Completing a task ("effet passage de porte") drops its
+namespace from RAM and its rows from the table in one operation.
+"""
+
+from __future__ import annotations
+
+import atexit
+import itertools
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import bindparam, delete
+from sqlmodel import select
+
+from app.config import WORKING_MEMORY_CAPACITY, WORKING_MEMORY_FLUSH_INTERVAL
+from app.memory.db import get_session
+from app.models.memory import Working_memory
+from app.utils.logger import logger
+
+
+class WorkingMemory:
+    """Capacity-bounded, task-namespaced, write-behind cache of ``Working_memory``."""
+
+    def __init__(self, capacity: int = WORKING_MEMORY_CAPACITY, flush_interval: float = WORKING_MEMORY_FLUSH_INTERVAL):
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.active_task: Optional[str] = None
+        self._tasks: Dict[str, "OrderedDict[int, Working_memory]"] = {}
+        self._lru: "OrderedDict[int, str]" = OrderedDict()  # clé -> tâche, du moins au plus récent
+        self._keys = itertools.count(1)
+        self._new: Set[int] = set()  # jamais écrites
+        self._touched: Set[int] = set()  # last_accessed à réécrire
+        self._evicted: Dict[int, Working_memory] = {}  # sorties de la RAM avant d'être écrites
+        self._lock = threading.RLock()
+        self._io_lock = threading.Lock()  # une écriture à la fois (flush / complete_task)
+        self._flusher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    # ----- lecture / écriture en mémoire -----
+
+    def begin_task(self, task: str) -> None:
+        """Make ``task`` the task in progress, the one shown in the context."""
+        self.active_task = task
+
+    def open_task(self, task: str) -> None:
+        """:meth:`begin_task`, loading the stored entries of ``task`` if none is in RAM."""
+        with self._lock:
+            in_ram = task in self._tasks
+        if not in_ram:
+            self.load_task(task)
+        self.begin_task(task)
+
+    def remember(self, task: str, content: str) -> Working_memory:
+        """Keep ``content`` for ``task``; it reaches the table at the next flush."""
+        entry = Working_memory(used_in_task=task, content=content, last_accessed=datetime.utcnow())
+        with self._lock:
+            key = next(self._keys)
+            self._tasks.setdefault(task, OrderedDict())[key] = entry
+            self._lru[key] = task
+            self._new.add(key)
+            evicted = self._overflow()
+        self._ensure_flusher()
+        if evicted:
+            self.flush()
+        return entry
+
+    def recall(self, task: Optional[str] = None, touch: bool = True) -> List[Working_memory]:
+        """Entries of ``task`` (the active task by default), oldest first."""
+        task = task if task is not None else self.active_task
+        if task is None:
+            return []
+        now = datetime.utcnow()
+        with self._lock:
+            namespace = self._tasks.get(task)
+            if not namespace:
+                return []
+            if touch:
+                for key, entry in namespace.items():
+                    entry.last_accessed = now
+                    self._lru.move_to_end(key)
+                    if key not in self._new:
+                        self._touched.add(key)
+            return list(namespace.values())
+
+    def tasks(self) -> List[str]:
+        with self._lock:
+            return list(self._tasks)
+
+    def _overflow(self) -> bool:
+        """Evict the least recently used entries beyond ``capacity``.
+
+        Unwritten entries are kept aside until the next flush writes them.
+        """
+        evicted = False
+        while len(self._lru) > self.capacity:
+            key, task = self._lru.popitem(last=False)
+            entry = self._tasks[task].pop(key)
+            if not self._tasks[task]:
+                del self._tasks[task]
+            if key in self._new or key in self._touched:
+                self._evicted[key] = entry
+            evicted = True
+        return evicted
+
+    # ----- persistance -----
+
+    def flush(self) -> int:
+        """Write the pending inserts and ``last_accessed`` updates; return their count."""
+        with self._io_lock:
+            with self._lock:
+                entries = {key: entry for namespace in self._tasks.values() for key, entry in namespace.items()}
+                entries.update(self._evicted)
+                new = {key: entries[key] for key in self._new if key in entries}
+                touched = {key: entries[key] for key in self._touched if key in entries and key not in new}
+                # touchées pendant l'écriture de leur INSERT : BT_id encore inconnu, gardées pour le flush suivant
+                pending = {key: entry for key, entry in touched.items() if entry.BT_id is None}
+                for key in pending:
+                    del touched[key]
+                self._new.clear()
+                self._touched = set(pending)
+                self._evicted = {key: entry for key, entry in pending.items() if key not in self._lru}
+                rows = {
+                    key: Working_memory(
+                        used_in_task=entry.used_in_task, content=entry.content, last_accessed=entry.last_accessed
+                    )
+                    for key, entry in new.items()
+                }
+                updates = [
+                    {"key_id": entry.BT_id, "new_last_accessed": entry.last_accessed} for entry in touched.values()
+                ]
+            if not rows and not updates:
+                return 0
+            try:
+                with get_session(expire_on_commit=False) as session:
+                    session.add_all(rows.values())
+                    if updates:
+                        table = Working_memory.__table__
+                        session.exec(
+                            table.update()
+                            .where(table.c.BT_id == bindparam("key_id"))
+                            .values(last_accessed=bindparam("new_last_accessed")),
+                            params=updates,
+                        )
+                    session.commit()
+            except Exception:
+                with self._lock:  # réessayé au prochain flush
+                    self._new.update(new)
+                    self._touched.update(touched)
+                    for key, entry in {**new, **touched}.items():
+                        if key not in self._lru:
+                            self._evicted[key] = entry
+                raise
+            with self._lock:
+                for key, row in rows.items():
+                    new[key].BT_id = row.BT_id
+            return len(rows) + len(updates)
+
+    def complete_task(self, task: str) -> int:
+        """Forget ``task``: its namespace leaves RAM and its rows the table. Returns the rows deleted."""
+        with self._io_lock:
+            with self._lock:
+                namespace = self._tasks.pop(task, OrderedDict())
+                for key in namespace:
+                    self._lru.pop(key, None)
+                    self._new.discard(key)
+                    self._touched.discard(key)
+                for key in [key for key, entry in self._evicted.items() if entry.used_in_task == task]:
+                    del self._evicted[key]
+                    self._new.discard(key)
+                    self._touched.discard(key)
+                if self.active_task == task:
+                    self.active_task = None
+            with get_session() as session:
+                deleted = session.exec(delete(Working_memory).where(Working_memory.used_in_task == task)).rowcount
+                session.commit()
+        return deleted
+
+    def load_task(self, task: str) -> int:
+        """Bring the stored entries of ``task`` back into RAM; returns how many were loaded."""
+        statement = (
+            select(Working_memory).where(Working_memory.used_in_task == task).order_by(Working_memory.BT_id)
+        )
+        # sous _io_lock : un INSERT en cours d'écriture est soit invisible, soit déjà doté de son BT_id
+        with self._io_lock:
+            with get_session(expire_on_commit=False) as session:
+                stored = list(session.exec(statement))
+            with self._lock:
+                namespace = self._tasks.setdefault(task, OrderedDict())
+                known = {entry.BT_id for entry in namespace.values() if entry.BT_id is not None}
+                known.update(entry.BT_id for entry in self._evicted.values() if entry.BT_id is not None)
+                loaded = 0
+                for entry in stored:
+                    if entry.BT_id in known:
+                        continue
+                    key = next(self._keys)
+                    namespace[key] = entry
+                    self._lru[key] = task
+                    loaded += 1
+                if not namespace:
+                    del self._tasks[task]
+                evicted = self._overflow()
+        if evicted:
+            self.flush()
+        return loaded
+
+    def load_open_tasks(self) -> int:
+        """Bring every stored task back into RAM (startup); returns the entries loaded."""
+        with get_session() as session:
+            tasks = list(session.exec(select(Working_memory.used_in_task).distinct()))
+        return sum(self.load_task(task) for task in tasks if task is not None)
+
+    def clear(self) -> None:
+        """Drop everything from RAM without writing (tests, reloads)."""
+        with self._lock:
+            self._tasks.clear()
+            self._lru.clear()
+            self._new.clear()
+            self._touched.clear()
+            self._evicted.clear()
+            self.active_task = None
+
+    # ----- écriture différée -----
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="working-memory-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture de la mémoire de travail : {e}")
+
+    def start(self) -> int:
+        """Reload the stored tasks; the flushing thread starts with the next entry."""
+        self._stop.clear()
+        return self.load_open_tasks()
+
+    def close(self) -> None:
+        """Stop the flushing thread and write what is pending."""
+        self._stop.set()
+        flusher, self._flusher = self._flusher, None
+        if flusher is not None:
+            flusher.join()
+        self.flush()
+
+
+# Partagée par l'application ; ce qui reste est écrit à la sortie du processus
+working_memory = WorkingMemory()
+atexit.register(working_memory.close)
@@ -0,0 +1,233 @@
+# app/dialogue/background.py
+"""Background thoughts: open tasks kept in mind and surfaced when relevant.
+
+:class:`BackgroundThoughtScheduler` holds every open ``Background_thought``
+in memory:
+
+* an inverted index from keyword to the condition clauses using it;
+* the rank of a thought is ``priority`` (highest first), then ``importance``
+  (highest first), then ``order`` (lowest first): only the ``limit`` best
+  matches are selected (:func:`heapq.nsmallest`), never a full sort.
+
+``conditions`` is read as clauses separated by ``,`` ``;`` or newlines; a
+clause matches a text when all of its words occur in it (accents and case
+ignored), a thought when any of its clauses does. A thought without
+conditions is indexed on the significant words of its ``content``.
+Matching a dialogue turn only visits the postings of the turn's words, so
+its cost does not depend on the number of pending thoughts.
+
+The asyncio worker, started with the application, matches each finished
+turn (:meth:`notify_turn`) and keeps the hits until the next context is
+built (:meth:`surface`); it also reloads the table periodically to pick up
+changes made by other processes.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from app.config import BACKGROUND_MAX_SURFACED, BACKGROUND_REFRESH_INTERVAL
+from app.memory.crud import seek_open_background_thoughts, subscribe
+from app.models.memory import Background_thought
+from app.utils.logger import logger
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+_CLAUSE_SEPARATOR = re.compile(r"[,;\n]+")
+_MIN_CONTENT_WORD = 4  # mots retenus du content quand il n'y a pas de conditions
+
+Clause = FrozenSet[str]
+
+
+def keywords(text: Optional[str]) -> List[str]:
+    """Lowercased, accent-free words of ``text``."""
+    if not text:
+        return []
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return _WORD.findall(folded)
+
+
+def parse_conditions(thought: Background_thought) -> List[Clause]:
+    """Condition clauses of ``thought`` (see the module docstring)."""
+    clauses = [frozenset(keywords(part)) for part in _CLAUSE_SEPARATOR.split(thought.conditions or "")]
+    clauses = [clause for clause in clauses if clause]
+    if clauses:
+        return clauses
+    return [frozenset([word]) for word in dict.fromkeys(keywords(thought.content)) if len(word) >= _MIN_CONTENT_WORD]
+
+
+def _rank(thought: Background_thought) -> Tuple:
+    return (-(thought.priority or 0), -(thought.importance or 0), thought.order or 0, thought.BT_id)
+
+
+class BackgroundThoughtScheduler:
+    """Priority queue and keyword index of the open background thoughts."""
+
+    def __init__(
+        self, refresh_interval: float = BACKGROUND_REFRESH_INTERVAL, max_surfaced: int = BACKGROUND_MAX_SURFACED
+    ) -> None:
+        self.refresh_interval = refresh_interval
+        self.max_surfaced = max_surfaced
+        self._thoughts: Dict[int, Background_thought] = {}
+        self._clauses: Dict[int, List[Clause]] = {}
+        self._postings: Dict[str, Set[Tuple[int, int]]] = defaultdict(set)  # mot -> (BT_id, n° de clause)
+        self._surfaced: Set[int] = set()
+        self._lock = threading.RLock()
+        self._turns: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._thoughts)
+
+    # ----- état en mémoire -----
+
+    def load(self) -> int:
+        """Replace the in-memory state with the open thoughts of the database."""
+        thoughts: List[Background_thought] = []
+        after = None
+        while True:
+            page = seek_open_background_thoughts(limit=1000, after=after)
+            thoughts.extend(page)
+            if len(page) < 1000:
+                break
+            after = page[-1].BT_id
+        with self._lock:
+            self._thoughts.clear()
+            self._clauses.clear()
+            self._postings.clear()
+            for thought in thoughts:
+                self._add(thought)
+            self._surfaced &= self._thoughts.keys()
+        return len(thoughts)
+
+    def upsert(self, thought: Background_thought) -> None:
+        """Add, re-rank or (when ``done`` is set) drop ``thought``."""
+        with self._lock:
+            self._remove(thought.BT_id)
+            if thought.done is None:
+                self._add(thought)
+
+    def remove(self, bt_id: int) -> None:
+        with self._lock:
+            self._remove(bt_id)
+
+    def _add(self, thought: Background_thought) -> None:
+        self._thoughts[thought.BT_id] = thought
+        clauses = parse_conditions(thought)
+        self._clauses[thought.BT_id] = clauses
+        for number, clause in enumerate(clauses):
+            for word in clause:
+                self._postings[word].add((thought.BT_id, number))
+
+    def _remove(self, bt_id: int) -> None:
+        self._thoughts.pop(bt_id, None)
+        self._surfaced.discard(bt_id)
+        for number, clause in enumerate(self._clauses.pop(bt_id, ())):
+            for word in clause:
+                postings = self._postings.get(word)
+                if postings is not None:
+                    postings.discard((bt_id, number))
+                    if not postings:
+                        del self._postings[word]
+
+    # ----- requêtes -----
+
+    def match(self, text: str) -> List[Background_thought]:
+        """Open thoughts whose conditions are met by ``text``, highest priority first."""
+        with self._lock:
+            return sorted((self._thoughts[bt_id] for bt_id in self._matched(text)), key=_rank)
+
+    def _matched(self, text: str) -> Set[int]:
+        """``BT_id`` of the thoughts whose conditions ``text`` meets (lock held)."""
+        hits: Dict[Tuple[int, int], int] = defaultdict(int)
+        for word in set(keywords(text)):
+            for posting in self._postings.get(word, ()):
+                hits[posting] += 1
+        return {
+            bt_id
+            for (bt_id, number), count in hits.items()
+            if bt_id in self._clauses and count == len(self._clauses[bt_id][number])
+        }
+
+    def surface(self, text: str, limit: Optional[int] = None) -> List[Background_thought]:
+        """Thoughts to bring into the context of ``text``.
+
+        Those matching ``text`` plus those surfaced by the previous turns,
+        which are then forgotten; highest priority first.
+        """
+        limit = self.max_surfaced if limit is None else limit
+        with self._lock:
+            chosen = self._matched(text) | (self._surfaced & self._thoughts.keys())
+            self._surfaced.clear()
+            return heapq.nsmallest(limit, (self._thoughts[bt_id] for bt_id in chosen), key=_rank)
+
+    # ----- tâche de fond -----
+
+    def notify_turn(self, text: str) -> None:
+        """Queue a finished dialogue turn for matching, from any thread.
+
+        Does nothing while the worker is stopped.
+        """
+        turns, loop = self._turns, self._loop
+        if turns is not None and loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(turns.put_nowait, text)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        await asyncio.to_thread(self.load)
+        self._turns = asyncio.Queue()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run(), name="background-thoughts")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        self._turns = self._loop = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_refresh = loop.time() + self.refresh_interval
+        turns = self._turns
+        while True:
+            try:
+                text = await asyncio.wait_for(turns.get(), timeout=max(0.0, next_refresh - loop.time()))
+            except asyncio.TimeoutError:
+                try:
+                    await asyncio.to_thread(self.load)
+                except Exception as e:
+                    logger.error(f"Erreur lors du rechargement des pensées de fond : {e}")
+                next_refresh = loop.time() + self.refresh_interval
+                continue
+            matched = self.match(text)
+            if matched:
+                with self._lock:
+                    self._surfaced.update(thought.BT_id for thought in matched)
+
+
+# Partagé par l'application : démarré au startup (cf. app.main), alimenté par les événements du crud
+background_thoughts = BackgroundThoughtScheduler()
+
+
+def _on_thought_updated(thought: Background_thought, **_) -> None:
+    background_thoughts.upsert(thought)
+
+
+def _on_thought_deleted(bt_id: int, **_) -> None:
+    background_thoughts.remove(bt_id)
+
+
+subscribe("background_thought_updated", _on_thought_updated)
+subscribe("background_thought_deleted", _on_thought_deleted)
@@ -2,50 +2,208 @@
 
 from __future__ import annotations
 
+import asyncio
+import weakref
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Optional
-
-from openai import OpenAI
-
-from app.config import OPENAI_API_KEY, OPENAI_MODEL
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI
+
+from app.config import (
+    DIALOGUE_USER,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    OPENAI_BREAKER_COOLDOWN,
+    OPENAI_BREAKER_THRESHOLD,
+    OPENAI_MAX_CONCURRENCY,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_RETRIES,
+    OPENAI_MODEL,
+    OPENAI_QUOTA_COOLDOWN,
+    OPENAI_RPM,
+    OPENAI_TPM,
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ROWS,
+    RESPONSE_CACHE_MEMORY_SIZE,
+    RESPONSE_CACHE_TTL,
+)
+from app.context.working_memory import working_memory
+from app.dialogue.background import background_thoughts
+from app.dialogue.llm_client import CircuitBreaker, LLMClient
+from app.dialogue.response_cache import ResponseCache, completion_key
 from app.models.context import ContextManager
 from app.models.memory import Souvenir
 from app.memory.crud import create_souvenir
 from app.utils.logger import logger  # Import du logger
+from app.utils.metrics import REGISTRY, span
+
+
+def _make_client() -> OpenAI:
+    # max_retries=0 : les nouvelles tentatives sont gérées (et comptées) par LLMClient
+    return OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+
+
+def _make_async_client() -> AsyncOpenAI:
+    # un seul pool de connexions HTTP (keep-alive) pour toutes les requêtes
+    return AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
+        max_retries=0,
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=OPENAI_MAX_CONNECTIONS,
+            )
+        ),
+    )
+
+
+# Clients OpenAI construits au premier appel, pas à l'import (cf. app.bootstrap)
+llm = LLMClient(
+    client_factory=_make_client,
+    async_client_factory=_make_async_client,
+    requests_per_minute=OPENAI_RPM,
+    tokens_per_minute=OPENAI_TPM,
+    max_retries=OPENAI_MAX_RETRIES,
+    breaker=CircuitBreaker(OPENAI_BREAKER_THRESHOLD, OPENAI_BREAKER_COOLDOWN, OPENAI_QUOTA_COOLDOWN),
+)
+
+# compteurs du client (requêtes, retries, tokens...) exportés sur /metrics
+REGISTRY.add_collector(llm.metrics.prometheus)
+
+TEMPERATURE = 0.7
+MAX_TOKENS = 300
+
+response_cache = ResponseCache(RESPONSE_CACHE_MEMORY_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ROWS)
+
+# Partagé entre les requêtes : la bio rendue reste en cache (cf. app.context.bio_manager)
+context_manager = ContextManager()
+context_manager.append_bio(1, cible="arch", user_name=DIALOGUE_USER)
+
+# Complétions en cours par boucle puis par modèle : un sémaphore ne sert
+# que la boucle qui l'a créé (tests, rechargements)
+_model_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+@asynccontextmanager
+async def _model_slot(model: str) -> AsyncIterator[None]:
+    """Wait for one of the ``OPENAI_MAX_CONCURRENCY`` slots of ``model`` in the running loop."""
+    slots = _model_slots.setdefault(asyncio.get_running_loop(), {})
+    if model not in slots:
+        slots[model] = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+    async with slots[model]:
+        yield
+
+
+def _build_messages(prompt: str, reflexion: Optional[str], task: Optional[str] = None) -> List[dict]:
+    if task is not None:
+        working_memory.open_task(task)
+    messages = context_manager.build_context(prompt=prompt, task=task)
+
+    if reflexion:
+        for i in range(2):
+            messages.insert(-1, {"role": "assistant", "content": f"(Réflexion {i+1}) {prompt}"})
+
+    return messages
+
+
+def _prepare(
+    prompt: str, reflexion: Optional[str], cache: bool, task: Optional[str] = None
+) -> Tuple[List[dict], Optional[str], Optional[str]]:
+    """Messages to send, their cache key (``None`` if not cached) and the cached answer."""
+    with span("context"):
+        messages = _build_messages(prompt, reflexion, task)
+    if not (cache and RESPONSE_CACHE_ENABLED):
+        return messages, None, None
+    with span("cache"):
+        key = completion_key(OPENAI_MODEL, messages, TEMPERATURE, MAX_TOKENS)
+        return messages, key, response_cache.get(key)
+
+
+def _dialogue_souvenir(prompt: str, message: str) -> Souvenir:
+    content = f"{prompt}\n→ {message}"
+    return Souvenir(
+        type="dialogue",
+        content=content,
+        full_content=content,
+        user_name=DIALOGUE_USER,
+        time=datetime.utcnow(),
+    )
+
+
+def _record(prompt: str, message: str, key: Optional[str], cached: bool, task: Optional[str] = None) -> None:
+    """Keep the exchange as a souvenir, in the working memory of ``task`` and,
+    if it comes from the API, in the cache."""
+    with span("persist"):
+        if key is not None and not cached:
+            response_cache.put(key, OPENAI_MODEL, message)
+        create_souvenir(_dialogue_souvenir(prompt, message))
+    if task is not None:
+        working_memory.remember(task, f"{prompt}\n→ {message}")
+    background_thoughts.notify_turn(f"{prompt}\n{message}")
+
+
+def generate_response(
+    prompt: str, reflexion: Optional[str] = None, cache: bool = True, task: Optional[str] = None
+) -> str:
+    try:
+        messages, key, message = _prepare(prompt, reflexion, cache, task)
+        cached = message is not None
+
+        if not cached:
+            with span("completion"):
+                response = llm.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    temperature=TEMPERATURE,
+                    max_tokens=MAX_TOKENS,
+                )
 
+            message = response.choices[0].message.content
+            if message is None:
+                return "Erreur : réponse vide du modèle"
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+        _record(prompt, message, key, cached, task)
 
+        return message
 
-def generate_response(prompt: str, reflexion: Optional[str] = None) -> str:
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération de réponse : {e}")  # Enregistre dans le fichier log
+        return f"Erreur : {str(e)}"
+
+
+async def agenerate_response(
+    prompt: str, reflexion: Optional[str] = None, cache: bool = True, task: Optional[str] = None
+) -> str:
+    """Async :func:`generate_response`: the event loop is never blocked.
+
+    SQLite work (context building, cache lookup, souvenir write) runs in a
+    worker thread; the completion itself is awaited on the shared async
+    client, within the per-model concurrency limit.
+    """
     try:
-        context_manager = ContextManager()
-        context_manager.append_bio(1, cible="arch")
-
-        messages = context_manager.build_context(prompt="Parle-moi de la mémoire")
-
-        if reflexion:
-            for i in range(2):
-                messages.insert(-1, {"role": "assistant", "content": f"(Réflexion {i+1}) {prompt}"})
-
-        response = client.chat.completions.create(
-            model=OPENAI_MODEL,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=300,
-        )
-
-        message = response.choices[0].message.content
-        if message is None:
-            return "Erreur : réponse vide du modèle"
-
-        souvenir = Souvenir(
-            type="dialogue",
-            content=f"{prompt}\n→ {message}",
-            author="Noe",
-            time=datetime.utcnow(),
-        )
-        enregistrer_souvenir(souvenir)
+        messages, key, message = await asyncio.to_thread(_prepare, prompt, reflexion, cache, task)
+        cached = message is not None
+
+        if not cached:
+            with span("completion"):  # attente d'une place comprise
+                async with _model_slot(OPENAI_MODEL):
+                    response = await llm.acreate(
+                        model=OPENAI_MODEL,
+                        messages=messages,
+                        temperature=TEMPERATURE,
+                        max_tokens=MAX_TOKENS,
+                    )
+
+            message = response.choices[0].message.content
+            if message is None:
+                return "Erreur : réponse vide du modèle"
+
+        await asyncio.to_thread(_record, prompt, message, key, cached, task)
 
         return message
 
@@ -53,3 +211,44 @@ def generate_response(prompt: str, reflexion: Optional[str] = None) -> str:
         logger.error(f"Erreur lors de la génération de réponse : {e}")  # Enregistre dans le fichier log
         return f"Erreur : {str(e)}"
 
+
+async def stream_response(
+    prompt: str, reflexion: Optional[str] = None, cache: bool = True, task: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Yield the model's text deltas as they arrive.
+
+    The souvenir is written once the stream has completed; a stream cut short
+    (client gone, API error) records nothing. Errors are raised to the caller,
+    which has already started sending its response. A cached answer comes
+    as a single delta.
+    """
+    messages, key, cached = await asyncio.to_thread(_prepare, prompt, reflexion, cache, task)
+    if cached is not None:
+        yield cached
+        await asyncio.to_thread(_record, prompt, cached, key, True, task)
+        return
+
+    parts: List[str] = []
+    with span("completion"):  # jusqu'au dernier morceau
+        async with _model_slot(OPENAI_MODEL):
+            stream = await llm.acreate(
+                model=OPENAI_MODEL,
+                messages=messages,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:  # dernier morceau, sans choix
+                    llm.record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+
+    message = "".join(parts)
+    if message:
+        await asyncio.to_thread(_record, prompt, message, key, False, task)
@@ -0,0 +1,215 @@
+# app/dialogue/fake_server.py
+"""Local stand-in for the OpenAI chat completions endpoint.
+
+Serves scripted answers so that the rate limiter, the retries and the
+circuit breaker can be exercised without an account or network::
+
+    with FakeOpenAIServer([FakeReply.rate_limited(retry_after=1), FakeReply.completion("ok")]) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url, max_retries=0)
+
+Once the script is exhausted every request gets ``default`` (an echo of the
+last user message). ``python -m app.dialogue.fake_server`` runs it in the
+foreground; point ``OPENAI_BASE_URL`` at it to use it from the app.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Iterable, List, Optional
+
+
+@dataclass
+class FakeReply:
+    status: int = 200
+    body: Optional[dict] = None  # None : complétion qui répète le prompt
+    headers: Dict[str, str] = field(default_factory=dict)
+    delay: float = 0.0
+
+    @classmethod
+    def completion(cls, text: str, delay: float = 0.0) -> "FakeReply":
+        return cls(body={"text": text}, delay=delay)
+
+    @classmethod
+    def rate_limited(cls, retry_after: Optional[float] = None) -> "FakeReply":
+        headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+        return cls(429, _error("Rate limit reached for requests", "rate_limit_exceeded", "requests"), headers)
+
+    @classmethod
+    def quota(cls) -> "FakeReply":
+        return cls(
+            429,
+            _error("You exceeded your current quota", "insufficient_quota", "insufficient_quota"),
+        )
+
+    @classmethod
+    def server_error(cls, status: int = 500) -> "FakeReply":
+        return cls(status, _error("The server had an error", None, "server_error"))
+
+
+def _error(message: str, code: Optional[str], type_: str) -> dict:
+    return {"error": {"message": message, "type": type_, "param": None, "code": code}}
+
+
+def _completion(model: str, text: str, prompt_tokens: int) -> dict:
+    completion_tokens = max(1, len(text) // 4)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def _chunk(model: str, delta: dict, finish_reason: Optional[str] = None, usage: Optional[dict] = None) -> bytes:
+    payload = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:  # dernier morceau de stream_options.include_usage : usage seul, sans choix
+        payload["choices"] = []
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address) -> None:
+        # client parti avant la réponse (requête annulée) : rien à signaler
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server answering ``POST .../chat/completions`` from a script."""
+
+    def __init__(
+        self,
+        script: Iterable[FakeReply] = (),
+        default: Optional[FakeReply] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.script: Deque[FakeReply] = deque(script)
+        self.default = default or FakeReply()
+        self.requests: List[dict] = []
+        self._lock = threading.Lock()
+        self._httpd = _HTTPServer((host, port), self._handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _next(self, request: dict) -> FakeReply:
+        with self._lock:
+            self.requests.append(request)
+            return self.script.popleft() if self.script else self.default
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send(404, _error(f"Unknown path {self.path}", None, "invalid_request_error"))
+                    return
+                length = int(self.headers.get("content-length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                reply = server._next(request)
+                if reply.delay:
+                    time.sleep(reply.delay)
+                if reply.status != 200:
+                    self._send(reply.status, reply.body or {}, reply.headers)
+                    return
+
+                model = request.get("model", "fake")
+                messages = request.get("messages") or []
+                if reply.body is None or "text" in reply.body:
+                    text = (reply.body or {}).get("text")
+                    if text is None:
+                        last = next((m for m in reversed(messages) if m.get("role") == "user"), {})
+                        text = f"echo: {last.get('content', '')}"
+                    prompt_tokens = sum(len(str(m.get("content") or "")) // 4 + 4 for m in messages)
+                    if request.get("stream"):
+                        include_usage = (request.get("stream_options") or {}).get("include_usage")
+                        self._stream(model, text, prompt_tokens if include_usage else None)
+                        return
+                    self._send(200, _completion(model, text, prompt_tokens), reply.headers)
+                else:
+                    self._send(200, reply.body, reply.headers)
+
+            def _send(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model: str, text: str, prompt_tokens: Optional[int] = None) -> None:
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.end_headers()
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    self.wfile.write(_chunk(model, {"content": word if i == 0 else " " + word}))
+                self.wfile.write(_chunk(model, {}, "stop"))
+                if prompt_tokens is not None:
+                    self.wfile.write(_chunk(model, {}, usage=_completion(model, text, prompt_tokens)["usage"]))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def log_message(self, format, *args) -> None:  # silencieux
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Faux serveur OpenAI (chat completions)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+    fake = FakeOpenAIServer(host=args.host, port=args.port)
+    print(f"OPENAI_BASE_URL={fake.base_url}")
+    try:
+        fake._httpd.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
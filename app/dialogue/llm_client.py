@@ -0,0 +1,387 @@
+# app/dialogue/llm_client.py
+"""Rate-limited, retrying wrapper around ``chat.completions.create``.
+
+* :class:`RateLimiter` keeps requests and tokens under the per-minute limits
+  of the account (two token buckets), so bursts wait locally instead of
+  coming back as 429.
+* Transient failures (429 rate limit, 5xx, connection errors) are retried
+  with full-jitter exponential backoff, honouring ``Retry-After``.
+* :class:`CircuitBreaker` fails fast: ``insufficient_quota`` opens it at once
+  (retrying cannot help), repeated transient failures open it too. After a
+  cooldown one probe request is let through to decide whether to close it;
+  a probe that ends without a verdict (cancelled, invalid request) is
+  released so that the next call can probe.
+
+The wrapped SDK clients must be built with ``max_retries=0`` so that retries
+are counted and paced here only.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import openai
+
+from app.utils.logger import logger
+from app.utils.tokens import message_tokens
+
+
+class LLMUnavailableError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class TokenBucket:
+    """Bucket of ``capacity`` units refilled at ``rate_per_minute``.
+
+    :meth:`reserve` never refuses: it takes the units (the level may go
+    negative) and returns how long the caller must wait before using them,
+    so concurrent callers are served in arrival order.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity if capacity is not None else rate_per_minute)
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            self._refill()
+            self._level -= min(amount, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back units reserved in excess (estimate above the actual usage)."""
+        if amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits (0 disables one)."""
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float) -> None:
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request and ``tokens`` tokens, return the wait in seconds."""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def refund(self, tokens: int) -> None:
+        if self.tokens is not None:
+            self.tokens.refund(tokens)
+
+
+class CircuitBreaker:
+    """closed → open (fail fast) → half-open (one probe) → closed or open again."""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0, quota_cooldown: float = 300.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.quota_cooldown = quota_cooldown
+        self.state = self.CLOSED
+        self.reason: Optional[str] = None
+        self._failures = 0
+        self._reopen_at = 0.0
+        self._probing = False
+        self._probes = 0  # numéro de la dernière sonde, cf. release
+        self._lock = threading.Lock()
+
+    def before_call(self) -> Optional[int]:
+        """Raise :class:`LLMUnavailableError` unless a request may be sent now.
+
+        Return a ticket when the request is the half-open probe (``None``
+        otherwise), to give to :meth:`release` if it ends without a verdict.
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return None
+            if self.state == self.OPEN and time.monotonic() >= self._reopen_at:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                self._probes += 1
+                return self._probes
+            retry_in = max(0.0, self._reopen_at - time.monotonic())
+            raise LLMUnavailableError(f"API OpenAI indisponible ({self.reason}), nouvel essai dans {retry_in:.0f} s")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state, self.reason = self.CLOSED, None
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, quota: bool = False) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if quota:
+                self._open("insufficient_quota", self.quota_cooldown)
+            elif self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open(f"{self._failures} échecs consécutifs", self.cooldown)
+
+    def release(self, ticket: Optional[int]) -> None:
+        """End the probe ``ticket`` if it is still pending (request error, cancellation).
+
+        A no-op once a success or failure was recorded, so a later probe is
+        never released by mistake.
+        """
+        with self._lock:
+            if ticket is not None and self._probing and self._probes == ticket:
+                self._probing = False
+
+    def _open(self, reason: str, cooldown: float) -> None:
+        if self.state != self.OPEN:
+            logger.error(f"Circuit OpenAI ouvert : {reason}")
+        self.state, self.reason = self.OPEN, reason
+        self._reopen_at = time.monotonic() + cooldown
+
+
+class LLMMetrics:
+    """Thread-safe counters of the client wrapper."""
+
+    FIELDS = (
+        "requests",
+        "successes",
+        "failures",
+        "retries",
+        "rate_limited",
+        "quota_exhausted",
+        "server_errors",
+        "connection_errors",
+        "short_circuited",
+        "prompt_tokens",
+        "completion_tokens",
+    )
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, float] = dict.fromkeys(self.FIELDS, 0)
+        self._values["throttled_seconds"] = 0.0
+
+    def incr(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[name] += amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def prometheus(self, prefix: str = "arch_llm") -> List[str]:
+        """The counters in the Prometheus text format (cf. app.utils.metrics)."""
+        lines = []
+        for name, value in self.snapshot().items():
+            metric = f"{prefix}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        return lines
+
+
+def is_quota_error(error: BaseException) -> bool:
+    """``429 insufficient_quota``: the account is out of credit, not throttled."""
+    if not isinstance(error, openai.RateLimitError):
+        return False
+    if getattr(error, "code", None) == "insufficient_quota":
+        return True
+    body = getattr(error, "body", None)
+    return isinstance(body, dict) and "insufficient_quota" in (body.get("code"), body.get("type"))
+
+
+def is_transient(error: BaseException) -> bool:
+    return isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)) and not (
+        is_quota_error(error)
+    )
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Delay requested by the server (``retry-after-ms`` / ``retry-after``), if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000.0
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:  # date HTTP : on retombe sur le backoff
+        return None
+    return None
+
+
+def estimate_tokens(messages: Iterable[dict], max_tokens: Optional[int]) -> int:
+    """Upper bound of the tokens a completion will be charged for."""
+    prompt = sum(message_tokens(str(m.get("content") or "")) for m in messages)
+    return prompt + (max_tokens or 0)
+
+
+class LLMClient:
+    """``chat.completions.create`` with rate limiting, retries and a circuit breaker."""
+
+    def __init__(
+        self,
+        client: Any = None,
+        async_client: Any = None,
+        *,
+        client_factory: Optional[Callable[[], Any]] = None,
+        async_client_factory: Optional[Callable[[], Any]] = None,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 20.0,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        # clients construits au premier appel quand on ne donne que leur fabrique
+        self._client = client
+        self._async_client = async_client
+        self._client_factory = client_factory
+        self._async_client_factory = async_client_factory
+        self._clients_lock = threading.Lock()
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LLMMetrics()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None and self._client_factory is not None:
+            with self._clients_lock:
+                if self._client is None:
+                    self._client = self._client_factory()
+        return self._client
+
+    @property
+    def async_client(self) -> Any:
+        if self._async_client is None and self._async_client_factory is not None:
+            with self._clients_lock:
+                if self._async_client is None:
+                    self._async_client = self._async_client_factory()
+        return self._async_client
+
+    async def aclose(self) -> None:
+        """Close the HTTP connection pools of the clients built so far."""
+        with self._clients_lock:
+            client, self._client = self._client, None
+            async_client, self._async_client = self._async_client, None
+        if client is not None and self._client_factory is not None:
+            client.close()
+        if async_client is not None and self._async_client_factory is not None:
+            await async_client.close()
+
+    # Chaque tentative, retries compris, passe par le limiteur. Le finally
+    # libère la sonde du disjoncteur quand l'appel se termine sans verdict
+    # (erreur de la requête, annulation pendant un appel ou une attente).
+
+    def create(self, **params: Any) -> Any:
+        ticket, estimate = self._admit(params)
+        try:
+            attempt = 0
+            while True:
+                time.sleep(self._throttle(estimate))
+                try:
+                    response = self.client.chat.completions.create(**params)
+                except Exception as e:
+                    delay = self._on_error(e, attempt)
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                return self._on_success(response, estimate, params)
+        finally:
+            self.breaker.release(ticket)
+
+    async def acreate(self, **params: Any) -> Any:
+        ticket, estimate = self._admit(params)
+        try:
+            attempt = 0
+            while True:
+                await asyncio.sleep(self._throttle(estimate))
+                try:
+                    response = await self.async_client.chat.completions.create(**params)
+                except Exception as e:
+                    delay = self._on_error(e, attempt)
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                return self._on_success(response, estimate, params)
+        finally:
+            self.breaker.release(ticket)
+
+    def _admit(self, params: Dict[str, Any]) -> Tuple[Optional[int], int]:
+        """Probe ticket (cf. :meth:`CircuitBreaker.before_call`) and token estimate of the call."""
+        try:
+            ticket = self.breaker.before_call()
+        except LLMUnavailableError:
+            self.metrics.incr("short_circuited")
+            raise
+        self.metrics.incr("requests")
+        return ticket, estimate_tokens(params.get("messages", ()), params.get("max_tokens"))
+
+    def _throttle(self, tokens: int) -> float:
+        wait = self.limiter.reserve(tokens)
+        if wait > 0:
+            self.metrics.incr("throttled_seconds", wait)
+        return wait
+
+    def _on_error(self, error: Exception, attempt: int) -> float:
+        """Count ``error`` and return the delay before the next attempt, or re-raise."""
+        if is_quota_error(error):
+            self.metrics.incr("quota_exhausted")
+        elif isinstance(error, openai.RateLimitError):
+            self.metrics.incr("rate_limited")
+        elif isinstance(error, openai.InternalServerError):
+            self.metrics.incr("server_errors")
+        elif isinstance(error, openai.APIConnectionError):
+            self.metrics.incr("connection_errors")
+
+        if not is_transient(error) and not is_quota_error(error):
+            # erreur de la requête (400, 401...) : ni retry ni panne de l'API
+            self.metrics.incr("failures")
+            raise error
+        # la requête de sonde (demi-ouvert) ne réessaie pas : elle tranche
+        if is_quota_error(error) or attempt >= self.max_retries or self.breaker.state == CircuitBreaker.HALF_OPEN:
+            self.breaker.record_failure(quota=is_quota_error(error))
+            self.metrics.incr("failures")
+            raise error
+
+        self.metrics.incr("retries")
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        delay = retry_after(error)
+        delay = backoff if delay is None else min(max(delay, backoff), self.max_delay)
+        logger.warning(f"Appel OpenAI en échec ({type(error).__name__}), nouvel essai dans {delay:.2f} s")
+        return delay
+
+    def _on_success(self, response: Any, estimate: int, params: Dict[str, Any]) -> Any:
+        self.breaker.record_success()
+        self.metrics.incr("successes")
+        usage = getattr(response, "usage", None)
+        if usage is not None and not params.get("stream"):
+            self.record_usage(usage)
+            self.limiter.refund(estimate - (usage.total_tokens or 0))
+        return response
+
+    def record_usage(self, usage: Any) -> None:
+        """Count the tokens of a completion (streams report them in their last chunk)."""
+        self.metrics.incr("prompt_tokens", usage.prompt_tokens or 0)
+        self.metrics.incr("completion_tokens", usage.completion_tokens or 0)
@@ -0,0 +1,176 @@
+# app/dialogue/response_cache.py
+"""Content-addressed cache of chat completions.
+
+A completion is keyed by the sha256 of ``(model, messages, temperature,
+max_tokens)``: the same context sent to the same model gets the stored
+answer back without an API call. Two tiers:
+
+* an in-process LRU (``OrderedDict``), answering in microseconds;
+* the ``completion_cache`` SQLite table, shared across workers and restarts,
+  with a TTL and a cap on the number of rows (least recently used first).
+
+Entries past their TTL are ignored on read and purged with the overflow.
+A hit never writes: its ``last_used`` is kept in memory and written with the
+next ``put``/``purge`` (or every ``TOUCH_BATCH`` hits), the LRU order of the
+table only has to be roughly right.
+
+The key covers the whole context, souvenirs and background thoughts
+included: a dialogue turn adds a souvenir, so the next identical prompt is
+usually sent with another context and misses. Hits are thus mostly repeated
+prompts over an unchanged memory (retries, batch jobs, reloads) — keying on
+the prompt alone would serve answers built from a context the model never
+saw.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from app.memory.db import get_session
+from app.models.dialogue import CompletionCache
+
+PURGE_EVERY = 100  # écritures entre deux purges de la table
+TOUCH_BATCH = 256  # hits gardés en mémoire avant d'écrire leur last_used
+
+
+def completion_key(model: str, messages: Iterable[dict], temperature: Any = None, max_tokens: Any = None) -> str:
+    """sha256 of the canonical JSON of the request parameters that shape the answer."""
+    payload = json.dumps(
+        [model, list(messages), temperature, max_tokens],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Two-tier (memory LRU, then SQLite) completion cache."""
+
+    def __init__(self, memory_size: int = 1024, ttl: float = 86400.0, max_rows: int = 10_000) -> None:
+        self.memory_size = memory_size
+        self.ttl = timedelta(seconds=ttl)
+        self.max_rows = max_rows
+        self._memory: "OrderedDict[str, Tuple[str, datetime]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._touched: Dict[str, datetime] = {}  # last_used pas encore écrits
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Stored response for ``key``, or ``None``. Never writes (see the module doc)."""
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] <= now:
+                del self._memory[key]
+                entry = None
+            if entry is not None:
+                self._memory.move_to_end(key)
+
+        if entry is None:
+            with get_session() as session:
+                row = session.get(CompletionCache, key)
+                if row is not None and row.created_at + self.ttl > now:
+                    entry = (row.response, row.created_at + self.ttl)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, *entry)
+            self._touched[key] = now
+            flush = len(self._touched) >= TOUCH_BATCH
+        if flush:
+            self.flush()
+        return entry[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = datetime.utcnow()
+        with self._lock:
+            self._remember(key, response, now + self.ttl)
+            self._touched.pop(key, None)
+            self._writes += 1
+            purge = self._writes % PURGE_EVERY == 0
+            touched = self._take_touched()
+
+        statement = sqlite_insert(CompletionCache).values(
+            key=key, model=model, response=response, created_at=now, last_used=now
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["key"],
+            set_={"response": response, "model": model, "created_at": now, "last_used": now},
+        )
+        with get_session() as session:
+            session.exec(statement)
+            self._write_touched(session, touched)
+            session.commit()
+        if purge:
+            self.purge()
+
+    def purge(self) -> int:
+        """Delete expired rows and the least recently used ones beyond ``max_rows``."""
+        with self._lock:
+            touched = self._take_touched()
+        with get_session() as session:
+            self._write_touched(session, touched)
+            deleted = session.exec(
+                delete(CompletionCache).where(CompletionCache.created_at <= datetime.utcnow() - self.ttl)
+            ).rowcount
+            excess = session.exec(select(func.count()).select_from(CompletionCache)).one() - self.max_rows
+            if excess > 0:
+                oldest = select(CompletionCache.key).order_by(CompletionCache.last_used).limit(excess)
+                deleted += session.exec(delete(CompletionCache).where(CompletionCache.key.in_(oldest))).rowcount
+            session.commit()
+        return deleted
+
+    def flush(self) -> None:
+        """Write the pending ``last_used`` of the hits."""
+        with self._lock:
+            touched = self._take_touched()
+        if touched:
+            with get_session() as session:
+                self._write_touched(session, touched)
+                session.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+        with get_session() as session:
+            session.exec(delete(CompletionCache))
+            session.commit()
+
+    def _take_touched(self) -> Dict[str, datetime]:
+        touched, self._touched = self._touched, {}
+        return touched
+
+    @staticmethod
+    def _write_touched(session, touched: Dict[str, datetime]) -> None:
+        if not touched:
+            return
+        statement = (
+            update(CompletionCache)
+            .where(CompletionCache.key == bindparam("k"))
+            .values(last_used=bindparam("used"))
+            .execution_options(synchronize_session=False)
+        )
+        session.connection().execute(statement, [{"k": k, "used": used} for k, used in touched.items()])
+
+    def _remember(self, key: str, response: str, expires: datetime) -> None:
+        self._memory[key] = (response, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
@@ -1,9 +1,49 @@
+import json
 from fastapi import APIRouter
-from typing import Optional
-from app.dialogue.engine import generate_response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Optional
+from app.context.working_memory import working_memory
+from app.dialogue.engine import agenerate_response, stream_response
+from app.utils.logger import logger
 
+# Pas de session liée à la requête ici : elle garderait une connexion SQLite
+# pendant toute l'attente du modèle.
 dialogue_router = APIRouter()
 
 @dialogue_router.post("/think") #sge si url /think avec une requete POST, fait :
-def think(prompt: str, reflexion: Optional[str] = None):
-    return {"response": generate_response(prompt, reflexion)}
\ No newline at end of file
+async def think(prompt: str, reflexion: Optional[str] = None, cache: bool = True, task: Optional[str] = None):
+    # cache=false : ni lecture ni écriture du cache des réponses
+    # task : mémoire de travail montrée dans le contexte, l'échange y est gardé
+    return {"response": await agenerate_response(prompt, reflexion, cache, task)}
+
+
+@dialogue_router.post("/think/stream")
+async def think_stream(prompt: str, reflexion: Optional[str] = None, cache: bool = True, task: Optional[str] = None):
+    """
+    Variante en flux de /think, en NDJSON (un objet JSON par ligne) :
+    {"delta": "..."} à chaque morceau reçu du modèle, puis
+    {"done": true, "response": "..."} ou {"error": "..."}.
+    """
+
+    async def lignes() -> AsyncIterator[str]:
+        parts = []
+        try:
+            async for delta in stream_response(prompt, reflexion, cache, task):
+                parts.append(delta)
+                yield json.dumps({"delta": delta}, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "response": "".join(parts)}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération de réponse (flux) : {e}")
+            yield json.dumps({"error": str(e)}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(
+        lignes(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@dialogue_router.delete("/think/tasks/{task}")
+def complete_task(task: str):
+    """Tâche terminée : sa mémoire de travail quitte la RAM et la table."""
+    return {"deleted": working_memory.complete_task(task)}
@@ -1,8 +1,17 @@
-from fastapi import APIRouter
-from app.models.memory import Souvenir
-from app.memory.crud import create_souvenir
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 
-router = APIRouter(prefix="/souvenirs", tags=["Souvenirs"])
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.models.memory import Souvenir, SouvenirPage
+from app.memory.crud import create_souvenir, search_souvenirs, seek_souvenirs_page
+from app.memory.db import request_session
+from app.memory.transfer import BATCH_SIZE, Importer, export_chunks
+
+router = APIRouter(prefix="/souvenirs", tags=["Souvenirs"], dependencies=[Depends(request_session)])
+# export / import : leurs propres connexions, pas de session de requête tenue pendant le flux
+transfer_router = APIRouter(prefix="/souvenirs", tags=["Souvenirs"])
 
 @router.post("/", response_model=Souvenir)
 def ajouter_souvenir(souvenir: Souvenir):
@@ -10,3 +19,81 @@ def ajouter_souvenir(souvenir: Souvenir):
     Enregistre un nouveau souvenir dans la base de données.
     """
     return create_souvenir(souvenir)
+
+
+@router.get("/", response_model=SouvenirPage)
+def lister_souvenirs(
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    user_name: Optional[str] = None,
+):
+    """
+    Parcourt les souvenirs du plus récent au plus ancien, page par page.
+    Renvoyer `next_cursor` dans `cursor` pour obtenir la page suivante.
+    """
+    try:
+        items, next_cursor = seek_souvenirs_page(limit, cursor=cursor, user_name=user_name)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return SouvenirPage(items=items, next_cursor=next_cursor)
+
+
+@router.get("/search", response_model=List[Souvenir])
+def rechercher_souvenirs(
+    q: str,
+    user_name: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=100),
+):
+    """
+    Recherche plein texte (FTS5, classement BM25) dans les souvenirs et leurs fragments.
+    """
+    return search_souvenirs(q, user_name=user_name, limit=limit)
+
+
+@transfer_router.get("/export")
+def exporter_memoire():
+    """
+    Exporte toute la mémoire (utilisateurs, émotions, souvenirs, fragments, liens,
+    associations, contextes) en NDJSON, envoyé au fil de la lecture.
+    """
+    filename = f"arch-{datetime.utcnow():%Y%m%d-%H%M%S}.ndjson"
+    return StreamingResponse(
+        export_chunks(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@transfer_router.post("/import")
+async def importer_memoire(request: Request, on_conflict: Literal["skip", "update"] = "skip") -> Dict[str, int]:
+    """
+    Charge un export NDJSON envoyé en corps de requête, par lots, sans le garder en mémoire.
+    `on_conflict=update` remplace les lignes déjà présentes au lieu de les garder.
+    Tout ou rien : un export tronqué ou invalide n'écrit aucune ligne.
+    """
+    importer = Importer(on_conflict=on_conflict, atomic=True)
+    buffer, lines = bytearray(), []
+    try:
+        async for chunk in request.stream():
+            buffer += chunk
+            end = buffer.rfind(b"\n")
+            if end < 0:
+                continue
+            # seule la ligne commencée reste dans le tampon : coût linéaire en la taille du corps
+            lines.extend(bytes(buffer[:end]).split(b"\n"))
+            del buffer[: end + 1]
+            if len(lines) >= BATCH_SIZE:
+                await run_in_threadpool(importer.feed, [line.decode("utf-8") for line in lines])
+                lines = []
+        lines.append(bytes(buffer))
+        await run_in_threadpool(importer.feed, [line.decode("utf-8") for line in lines])
+    except ValueError as exc:  # JSON ou UTF-8 invalide, en-tête absent
+        await run_in_threadpool(importer.abort)
+        raise HTTPException(status_code=400, detail=str(exc))
+    except BaseException:
+        await run_in_threadpool(importer.abort)
+        raise
+    try:
+        return await run_in_threadpool(importer.close)
+    except ValueError as exc:  # export tronqué : rien n'est gardé
+        raise HTTPException(status_code=400, detail=str(exc))
@@ -1,12 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.memory.db import init_db
+from fastapi.responses import PlainTextResponse
+from app.bootstrap import bootstrap
+from app.context.working_memory import working_memory
+from app.dialogue.background import background_thoughts
+from app.dialogue.engine import llm, response_cache
+from app.memory.access_tracker import access_tracker
+from app.memory.vector_index import fragment_vectors
 from app.dialogue.router import dialogue_router
-from app.dialogue.souvenirs_router import router as souvenirs_router
-from sqlmodel import SQLModel
-from app.memory.db import engine
+from app.dialogue.souvenirs_router import router as souvenirs_router, transfer_router
+from app.utils.metrics import REGISTRY, RequestMetricsMiddleware
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Arch.Noesis")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # schéma (une lecture de user_version s'il est à jour) et utilisateurs par défaut
+    await asyncio.to_thread(bootstrap)
+    # index vectoriel des fragments : chargé, complété, puis tenu à jour par les événements crud
+    if fragment_vectors is not None:
+        await asyncio.to_thread(fragment_vectors.start)
+    # tâches dont la mémoire de travail est restée en table
+    await asyncio.to_thread(working_memory.start)
+    # pensées de fond, après la création des tables
+    await background_thoughts.start()
+    try:
+        yield
+    finally:
+        await background_thoughts.stop()
+        # accès aux souvenirs encore en attente d'écriture
+        await asyncio.to_thread(access_tracker.close)
+        await asyncio.to_thread(response_cache.flush)
+        await asyncio.to_thread(working_memory.close)
+        await llm.aclose()
+
+
+app = FastAPI(title="Arch.Noesis", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,24 +45,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# ajouté en dernier : enveloppe les autres, la requête est mesurée en entier
+app.add_middleware(RequestMetricsMiddleware)
 
 """
 if __name__ == "__main__":
-    init_db()
+    bootstrap()
 """
 
-def init_db():
-    SQLModel.metadata.create_all(engine) # cree la db
-
-@app.on_event("startup") # demarre la db a l'event startup
-def on_startup():
-    init_db()
-
-
 app.include_router(souvenirs_router)
+app.include_router(transfer_router)
 app.include_router(dialogue_router, prefix="/dialogue")
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    # format texte de Prometheus
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.get("/")
 def read_root():
     return {"message": "Bienvenue dans Arch.Noesis 🖤"}
@@ -0,0 +1,209 @@
+# app/memory/access_tracker.py
+"""Write-behind tracking of memory accesses.
+
+Using a souvenir or a fragment reinforces it (``w += α·(1 - p)``, see
+:class:`~app.memory.memory_weight.MemoryItem`) and restarts its decay
+(``last_accessed``). Writing a row per access would put a write transaction
+on the path of every dialogue turn; :class:`AccessTracker` keeps the
+accesses in memory instead, one entry per row:
+
+* repeated accesses to a row are coalesced: the pending gain decays with
+  the row between two accesses, so one update carries the same weight as
+  the sequence of reinforcements;
+* pending entries are written every ``flush_interval`` seconds, or as soon
+  as ``max_pending`` rows are waiting, by a daemon thread, in one
+  ``executemany`` UPDATE per table; callers never wait on it;
+* the update is computed by SQLite from the stored ``(w0, t0)``
+  (``decayed_weight`` SQL function, cf. :mod:`app.memory.decay`), so writes
+  made meanwhile by other code are not overwritten;
+* a failed flush puts its entries back; what is pending is written at exit.
+"""
+
+from __future__ import annotations
+
+import atexit
+import math
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, bindparam, func
+
+from app.config import ACCESS_FLUSH_INTERVAL, ACCESS_MAX_PENDING
+from app.memory.db import get_session
+from app.memory.decay import DECAY_LAMBDA, decayed_weight, from_julian, to_julian
+from app.memory.memory_weight import MemoryItem, MemoryModel, WeightTable, softmax
+from app.utils.logger import logger
+
+# (gain en attente à la date du dernier accès, dernier accès en jours julien)
+Pending = Tuple[float, float]
+
+
+class AccessTracker:
+    """Coalescing, write-behind buffer of ``weight`` / ``last_accessed`` updates."""
+
+    def __init__(
+        self,
+        flush_interval: float = ACCESS_FLUSH_INTERVAL,
+        max_pending: int = ACCESS_MAX_PENDING,
+        alpha_gain: float = MemoryItem.alpha_gain,
+        lambda_decay: float = DECAY_LAMBDA,
+    ) -> None:
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.alpha_gain = alpha_gain
+        self.lambda_decay = lambda_decay
+        self._pending: Dict[MemoryModel, Dict[Tuple, Pending]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()  # un flush à la fois
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ----- enregistrement -----
+
+    def record(
+        self, model: MemoryModel, key: Tuple, probability: float = 0.0, when: Optional[datetime] = None
+    ) -> None:
+        """Note an access to the row ``key`` of ``model`` (see ``WeightTable.key_columns``).
+
+        ``probability`` is the ``p_i`` of the reinforcement; never blocks on the database.
+        """
+        self._merge(model, tuple(key), self.alpha_gain * (1.0 - probability), to_julian(when or datetime.utcnow()))
+        if self._count >= self.max_pending:
+            self._wake.set()
+        self._ensure_flusher()
+
+    def record_many(
+        self, model: MemoryModel, accesses: Iterable[Tuple[Tuple, float]], when: Optional[datetime] = None
+    ) -> None:
+        """:meth:`record` for ``(key, probability)`` pairs sharing the same instant."""
+        at = to_julian(when or datetime.utcnow())
+        for key, probability in accesses:
+            self._merge(model, tuple(key), self.alpha_gain * (1.0 - probability), at)
+        if self._count >= self.max_pending:
+            self._wake.set()
+        self._ensure_flusher()
+
+    def record_used(
+        self, model: MemoryModel, candidates: Sequence, used: Iterable, when: Optional[datetime] = None
+    ) -> None:
+        """Record the rows ``used`` among the retrieved ``candidates`` (instances of ``model``).
+
+        ``p_i`` is the softmax of a row's decayed weight among the candidates.
+        """
+        when = when or datetime.utcnow()
+        names = WeightTable.key_columns(model)
+
+        def key(row) -> Tuple:
+            return tuple(getattr(row, name) for name in names)
+
+        weights = np.array([decayed_weight(row.weight or 0.0, row.last_accessed, when) for row in candidates])
+        p = {key(row): float(p_i) for row, p_i in zip(candidates, softmax(weights))}
+        self.record_many(model, ((key(row), p[key(row)]) for row in used), when=when)
+
+    def _merge(self, model: MemoryModel, key: Tuple, gain: float, at: float) -> None:
+        with self._lock:
+            entries = self._pending.setdefault(model, {})
+            previous = entries.get(key)
+            if previous is None:
+                self._count += 1
+            else:
+                # le gain déjà acquis décroît jusqu'au nouvel accès (ou s'y ajoute s'il est plus ancien)
+                pending_gain, last = previous
+                if at >= last:
+                    gain += pending_gain * math.exp(-self.lambda_decay * (at - last))
+                else:
+                    gain = pending_gain + gain * math.exp(-self.lambda_decay * (last - at))
+                    at = last
+            entries[key] = (gain, at)
+
+    def pending(self, model: MemoryModel, key: Tuple) -> Optional[Pending]:
+        """``(gain, julian day)`` waiting to be written for a row, if any."""
+        with self._lock:
+            return self._pending.get(model, {}).get(tuple(key))
+
+    # ----- écriture -----
+
+    @staticmethod
+    def _statement(model: MemoryModel):
+        key_names = WeightTable.key_columns(model)
+        table = model.__table__
+        at = bindparam("accessed_julian")
+        weight = func.decayed_weight(table.c.weight, func.julianday(table.c.last_accessed), at) + bindparam("gain")
+        return (
+            table.update()
+            .where(and_(*[table.c[name] == bindparam(f"key_{name}") for name in key_names]))
+            .values(
+                weight=weight,
+                last_accessed=bindparam("new_last_accessed"),
+                # last_accessed vaut encore l'ancienne date dans le SET : on passe la nouvelle
+                weight_score=func.weight_score(weight, at),
+            )
+        )
+
+    def flush(self) -> int:
+        """Write the pending accesses, one executemany per table; return the rows updated."""
+        with self._io_lock:
+            with self._lock:
+                batches, self._pending, self._count = self._pending, {}, 0
+            if not batches:
+                return 0
+            try:
+                with get_session() as session:
+                    for model, entries in batches.items():
+                        key_names = WeightTable.key_columns(model)
+                        params = []
+                        for key, (gain, at) in entries.items():
+                            row = {f"key_{name}": value for name, value in zip(key_names, key)}
+                            row["gain"] = gain
+                            row["accessed_julian"] = at
+                            row["new_last_accessed"] = from_julian(at)
+                            params.append(row)
+                        session.exec(self._statement(model), params=params)
+                    session.commit()
+            except Exception:
+                # réessayé au prochain flush, fusionné avec les accès arrivés entre-temps
+                for model, entries in batches.items():
+                    for key, (gain, at) in entries.items():
+                        self._merge(model, key, gain, at)
+                raise
+            return sum(len(entries) for entries in batches.values())
+
+    # ----- écriture différée -----
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None or self.flush_interval <= 0:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="access-tracker-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture des accès aux souvenirs : {e}")
+
+    def close(self) -> None:
+        """Stop the flushing thread and write what is pending."""
+        self._stop.set()
+        self._wake.set()
+        self.flush()
+
+
+# Partagé par l'application ; ce qui reste est écrit à la sortie du processus
+access_tracker = AccessTracker()
+atexit.register(access_tracker.close)
@@ -2,9 +2,16 @@
 
 from __future__ import annotations
 
-from typing import Dict, List, Optional
-
-from sqlalchemy import func
+import base64
+import binascii
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, text, tuple_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import select
 
 from app.models.memory import (
@@ -13,69 +20,447 @@ from app.models.memory import (
     EmoLvl2ToLv1,
     Fragment,
     Link,
+    LinkFragment,
     LinkSouvenir,
     Souvenir,
+    SouvenirSequence,
     User,
     Working_memory,
 )
-from app.memory.db import get_session
+from app.memory.db import get_session, open_session
+from app.memory.fragmenter import FragmentDiff, fragment_ids, refragment, refragment_many
+from app.memory.fts import match_expression, ranked_fragment_keys_sql, ranked_souvenir_keys_sql
+
+
+# ----- Notifications de modification -----
+
+_listeners: Dict[str, List[Callable[..., None]]] = defaultdict(list)
+
+
+def subscribe(event: str, callback: Callable[..., None]) -> None:
+    """Call ``callback(**payload)`` after every ``event`` emitted by this module.
+
+    Events: ``souvenir_created``, ``souvenir_updated`` and ``souvenir_deleted``
+    (``souv_id``, ``user_name``); ``link_updated`` (``link_id``, ``weight``, also sent on
+    creation) and ``link_deleted`` (``link_id``); ``link_souvenir_added`` /
+    ``link_souvenir_removed`` (``souv_id``, ``link_id``) and
+    ``link_fragment_added`` / ``link_fragment_removed`` (``frag_id``,
+    ``link_id``, ``souv_id``); ``emotion_updated`` / ``emotion_deleted``
+    (``emo_lvl2``); ``fragments_updated`` (``souv_id``, ``user_name``,
+    ``fragments``: new versions and those they replace or retire, the latter
+    with ``is_last_version = False``); ``background_thought_updated``
+    (``thought``) and ``background_thought_deleted`` (``bt_id``); ``memory_imported``
+    (``tables``, names of the tables bulk-loaded, cf. :func:`bulk_loaded`).
+    Used by in-process caches and indexes to stay current.
+    """
+    _listeners[event].append(callback)
+
+
+def _emit(event: str, **payload) -> None:
+    for callback in _listeners.get(event, ()):
+        callback(**payload)
+
+
+class SouvenirIdAllocator:
+    """Hand out souvenir identifiers from per-user blocks.
+
+    Each block is reserved with a single ``UPDATE ... RETURNING`` on
+    :class:`SouvenirSequence` committed in its own transaction, so concurrent
+    writers (threads or processes) never receive the same allocated
+    identifier and the ``MAX(souv_id)`` scan only runs once per user, to seed
+    the sequence. Identifiers chosen by callers go through :meth:`claim`.
+    Reservations use their own session so they never commit, or roll back,
+    the caller's request-scoped work.
+    """
+
+    def __init__(self, block_size: int = 64) -> None:
+        self.block_size = block_size
+        self._ranges: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def allocate(self, user_name: Optional[str], count: int = 1) -> List[int]:
+        """Return ``count`` unused identifiers for ``user_name``."""
+        key = "" if user_name is None else str(user_name)
+        ids: List[int] = []
+        with self._lock:
+            next_id, end = self._ranges.get(key, (0, 0))
+            while len(ids) < count:
+                if next_id >= end:
+                    size = max(self.block_size, count - len(ids))
+                    next_id, end = self._reserve(key, user_name, size)
+                taken = min(count - len(ids), end - next_id)
+                ids.extend(range(next_id, next_id + taken))
+                next_id += taken
+            self._ranges[key] = (next_id, end)
+        return ids
+
+    def claim(self, user_name: Optional[str], souv_ids: Iterable[int]) -> None:
+        """Keep ``souv_ids``, chosen by the caller, from being handed out.
+
+        Call it before inserting. Ids falling in the block this process holds
+        are skipped there (with the ids before them in the block); the
+        sequence in the database is raised past the highest one, so later
+        reservations, in any process, start above it. A block another process
+        already holds is not affected: an explicit id inside it collides on
+        insert there, so explicit ids are best taken above the sequence.
+        """
+        souv_ids = list(souv_ids)
+        if not souv_ids:
+            return
+        key = "" if user_name is None else str(user_name)
+        highest = max(souv_ids)
+        with self._lock:
+            next_id, end = self._ranges.get(key, (0, 0))
+            held = [souv_id for souv_id in souv_ids if next_id <= souv_id < end]
+            if held:
+                self._ranges[key] = (max(held) + 1, end)
+            if highest < end:
+                # bloc déjà réservé : la séquence en base est déjà plus loin
+                return
+            raise_to = (
+                update(SouvenirSequence)
+                .where(SouvenirSequence.user_name.in_(("", key)))
+                .values(next_id=func.max(SouvenirSequence.next_id, highest + 1))
+                .returning(SouvenirSequence.user_name)
+            )
+            with open_session() as session:
+                if key not in session.exec(raise_to).scalars().all():
+                    seed = (
+                        sqlite_insert(SouvenirSequence)
+                        .values(user_name=key, next_id=max(_next_souvenir_id(session, user_name), highest + 1))
+                        .on_conflict_do_nothing()
+                    )
+                    session.exec(seed)
+                    session.exec(raise_to)  # séquence créée entre-temps par un autre processus
+                session.commit()
+
+    def reset(self) -> None:
+        """Forget the blocks held in memory (their unused ids are lost)."""
+        with self._lock:
+            self._ranges.clear()
+
+    def _reserve(self, key: str, user_name: Optional[str], size: int) -> Tuple[int, int]:
+        """Reserve ``size`` identifiers in the database and return the range."""
+        reserve = (
+            update(SouvenirSequence)
+            .where(SouvenirSequence.user_name == key)
+            .values(next_id=SouvenirSequence.next_id + size)
+            .returning(SouvenirSequence.next_id)
+        )
+        with open_session() as session:
+            end = session.exec(reserve).scalar_one_or_none()
+            if end is None:
+                seed = (
+                    sqlite_insert(SouvenirSequence)
+                    .values(user_name=key, next_id=_next_souvenir_id(session, user_name))
+                    .on_conflict_do_nothing()
+                )
+                session.exec(seed)
+                end = session.exec(reserve).scalar_one()
+            session.commit()
+        return end - size, end
+
+
+souvenir_ids = SouvenirIdAllocator()
+
+
+def bulk_loaded(tables: Iterable[str]) -> None:
+    """Catch up after rows were written around this module (cf. app.memory.transfer).
+
+    Souvenir and fragment sequences are raised above the loaded identifiers
+    and the blocks held in memory are dropped; a single ``memory_imported``
+    event then lets the caches reload instead of replaying one event per row.
+    """
+    tables = frozenset(tables)
+    if "souvenir" in tables:
+        with open_session() as session:
+            # séquence globale ("") : tous les souvenirs ; sinon ceux de l'utilisateur
+            session.exec(
+                text(
+                    "UPDATE souvenir_sequence SET next_id = MAX(next_id, 1 + COALESCE(("
+                    "SELECT MAX(souv_id) FROM souvenir "
+                    "WHERE souvenir_sequence.user_name IN ('', souvenir.user_name)), 0))"
+                )
+            )
+            session.commit()
+        souvenir_ids.reset()
+    if "fragment" in tables:
+        with open_session() as session:
+            session.exec(
+                text(
+                    "UPDATE fragment_sequence SET next_id = MAX(next_id, 1 + "
+                    "(SELECT COALESCE(MAX(frag_id), 0) FROM fragment))"
+                )
+            )
+            session.commit()
+        fragment_ids.reset()
+    _emit("memory_imported", tables=tables)
 
 
 def create_souvenir(souvenir: Souvenir) -> Souvenir:
-    """Persist a new :class:`Souvenir` in the database."""
-    with get_session() as session:
-        if souvenir.souv_id is None:
-            souvenir.souv_id = _next_souvenir_id(session, souvenir.user_name)
+    """Persist a new :class:`Souvenir` in the database, with the fragments of its ``full_content``."""
+    if souvenir.souv_id is None:
+        souvenir.souv_id = souvenir_ids.allocate(souvenir.user_name)[0]
+    else:
+        souvenir_ids.claim(souvenir.user_name, [souvenir.souv_id])
+    with get_session(expire_on_commit=False) as session:
         session.add(souvenir)
+        diff = refragment(souvenir, session) if souvenir.full_content else None
         session.commit()
         session.refresh(souvenir)
-        return souvenir
+    _emit("souvenir_created", souv_id=souvenir.souv_id, user_name=souvenir.user_name)
+    _fragments_updated(souvenir, diff)
+    return souvenir
+
+
+def create_souvenirs(souvenirs: Iterable[Souvenir]) -> List[Souvenir]:
+    """Persist many souvenirs in a single transaction.
+
+    Missing identifiers are drawn per user from :data:`souvenir_ids`, so a
+    batch costs one round-trip per reserved block plus the bulk ``INSERT``;
+    identifiers given by the caller are claimed, all at once per user.
+    Fragments are built as in :func:`create_souvenir`, in the same transaction.
+    """
+    souvenirs = list(souvenirs)
+    pending: Dict[Optional[str], List[Souvenir]] = defaultdict(list)
+    claimed: Dict[Optional[str], List[int]] = defaultdict(list)
+    for souvenir in souvenirs:
+        if souvenir.souv_id is None:
+            pending[souvenir.user_name].append(souvenir)
+        else:
+            claimed[souvenir.user_name].append(souvenir.souv_id)
+    for user_name, souv_ids in claimed.items():
+        souvenir_ids.claim(user_name, souv_ids)
+    for user_name, group in pending.items():
+        for souvenir, souv_id in zip(group, souvenir_ids.allocate(user_name, len(group))):
+            souvenir.souv_id = souv_id
+    with get_session(expire_on_commit=False) as session:
+        session.add_all(souvenirs)
+        # tous les frag_id réservés avant la première écriture de la transaction
+        fragmented = [souvenir for souvenir in souvenirs if souvenir.full_content]
+        diffs = {id(souvenir): diff for souvenir, diff in zip(fragmented, refragment_many(fragmented, session))}
+        session.commit()
+    for souvenir in souvenirs:
+        _emit("souvenir_created", souv_id=souvenir.souv_id, user_name=souvenir.user_name)
+        _fragments_updated(souvenir, diffs.get(id(souvenir)))
+    return souvenirs
+
 
 def _next_souvenir_id(session, user_name: Optional[str]) -> int:
-    """Return the next souvenir identifier for the given user."""
+    """Return the next souvenir identifier for the given user.
+
+    Only used to seed :class:`SouvenirSequence` for users that have none yet.
+    """
     statement = select(func.coalesce(func.max(Souvenir.souv_id), 0) + 1)
     if user_name is not None:
         statement = statement.where(Souvenir.user_name == user_name)
     return session.exec(statement).one()
 
 
-
-def get_souvenir(mem_id: int) -> Optional[Souvenir]:
+def get_souvenir(mem_id: int, user_name: Optional[str] = None) -> Optional[Souvenir]:
     """Fetch a souvenir by its identifier."""
     with get_session() as session:
-        return session.get(Souvenir, mem_id)
+        return _find_souvenir(session, mem_id, user_name)
+
+
+def get_souvenirs_by_ids(ids: Iterable[int], user_name: Optional[str] = None) -> List[Souvenir]:
+    """Fetch several souvenirs in one ``WHERE souv_id IN (...)`` query."""
+    ids = list(ids)
+    if not ids:
+        return []
+    statement = select(Souvenir).where(Souvenir.souv_id.in_(ids))
+    if user_name is not None:
+        statement = statement.where(Souvenir.user_name == user_name)
+    with get_session() as session:
+        return list(session.exec(statement))
+
+
+def get_souvenirs_by_keys(keys: Iterable[Tuple[int, str]]) -> List[Souvenir]:
+    """Fetch several souvenirs by ``(souv_id, user_name)`` in one query."""
+    keys = list(keys)
+    if not keys:
+        return []
+    statement = select(Souvenir).where(tuple_(Souvenir.souv_id, Souvenir.user_name).in_(keys))
+    with get_session() as session:
+        return list(session.exec(statement))
+
+
+def _find_souvenir(session, mem_id: int, user_name: Optional[str]) -> Optional[Souvenir]:
+    """Load a souvenir by ``souv_id``, and by ``user_name`` when it is known.
+
+    The primary key is ``(souv_id, user_name)``; without a user, the first
+    souvenir carrying that id is returned.
+    """
+    if user_name is not None:
+        return session.get(Souvenir, (mem_id, user_name))
+    statement = select(Souvenir).where(Souvenir.souv_id == mem_id).order_by(Souvenir.user_name)
+    return session.exec(statement).first()
+
+
+def seek_souvenirs(
+    limit: int = 10,
+    user_name: Optional[str] = None,
+    before: Optional[str] = None,
+) -> List[Souvenir]:
+    """Return a list of souvenirs ordered by recency.
+
+    ``before`` is a cursor from :func:`souvenir_cursor`: only souvenirs older
+    than the one it designates are returned, so any page costs an index seek.
+    """
+    statement = select(Souvenir)
+    if user_name is not None:
+        statement = statement.where(Souvenir.user_name == user_name)
+    if before is not None:
+        time, souv_id, cursor_user = _decode_cursor(before)
+        if user_name is not None:
+            statement = statement.where(tuple_(Souvenir.time, Souvenir.souv_id) < tuple_(time, souv_id))
+        else:
+            statement = statement.where(
+                tuple_(Souvenir.time, Souvenir.souv_id, Souvenir.user_name)
+                < tuple_(time, souv_id, cursor_user)
+            )
+    statement = statement.order_by(
+        Souvenir.time.desc(), Souvenir.souv_id.desc(), Souvenir.user_name.desc()
+    ).limit(limit)
+    with get_session() as session:
+        return list(session.exec(statement))
+
 
+def seek_souvenirs_by_weight(limit: int = 10, user_name: Optional[str] = None) -> List[Souvenir]:
+    """Return the souvenirs with the highest decayed weight right now.
 
-def seek_souvenirs(limit: int = 10) -> List[Souvenir]:
-    """Return a list of souvenirs ordered by recency."""
+    Ordering by ``weight_score`` is the order of ``weight·exp(-λ·Δt)`` at any
+    instant (see :mod:`app.memory.decay`), so it is a plain index scan.
+    """
+    statement = select(Souvenir)
+    if user_name is not None:
+        statement = statement.where(Souvenir.user_name == user_name)
+    statement = statement.order_by(Souvenir.weight_score.desc()).limit(limit)
     with get_session() as session:
-        statement = select(Souvenir).order_by(Souvenir.time.desc()).limit(limit)
         return list(session.exec(statement))
 
 
-def update_souvenir(mem_id: int, data: Dict) -> Optional[Souvenir]:
-    """Update fields of an existing souvenir."""
+def search_souvenirs(
+    query: str,
+    user_name: Optional[str] = None,
+    limit: int = 10,
+) -> List[Souvenir]:
+    """Return the souvenirs best matching ``query``, ranked by BM25.
+
+    Souvenir text and the text of their current fragments are both searched
+    through the FTS5 index (see :mod:`app.memory.fts`).
+    """
+    match = match_expression(query)
+    if match is None:
+        return []
+    params = {"match": match, "limit": limit}
+    if user_name is not None:
+        params["user_name"] = user_name
+    with get_session() as session:
+        ranked = session.exec(text(ranked_souvenir_keys_sql(user_name is not None)), params=params).all()
+        if not ranked:
+            return []
+        keys = [(row.souv_id, row.user_name) for row in ranked]
+        statement = select(Souvenir).where(tuple_(Souvenir.souv_id, Souvenir.user_name).in_(keys))
+        by_key = {(s.souv_id, s.user_name): s for s in session.exec(statement)}
+    return [by_key[key] for key in keys if key in by_key]
+
+
+def search_fragments(
+    query: str,
+    user_name: Optional[str] = None,
+    limit: int = 10,
+) -> List[Fragment]:
+    """Return the current fragments best matching ``query``, ranked by BM25."""
+    match = match_expression(query)
+    if match is None:
+        return []
+    params = {"match": match, "limit": limit}
+    if user_name is not None:
+        params["user_name"] = user_name
     with get_session() as session:
-        souvenir = session.get(Souvenir, mem_id)
+        ranked = session.exec(text(ranked_fragment_keys_sql(user_name is not None)), params=params).all()
+        if not ranked:
+            return []
+        keys = [(row.frag_id, row.souv_id, row.user_name) for row in ranked]
+        statement = select(Fragment).where(
+            tuple_(Fragment.frag_id, Fragment.souv_id, Fragment.user_name).in_(keys)
+        )
+        by_key = {(f.frag_id, f.souv_id, f.user_name): f for f in session.exec(statement)}
+    return [by_key[key] for key in keys if key in by_key]
+
+
+def seek_souvenirs_page(
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    user_name: Optional[str] = None,
+) -> Tuple[List[Souvenir], Optional[str]]:
+    """Return one page of souvenirs and the cursor of the next page, if any."""
+    souvenirs = seek_souvenirs(limit + 1, user_name=user_name, before=cursor)
+    if len(souvenirs) <= limit:
+        return souvenirs, None
+    souvenirs = souvenirs[:limit]
+    return souvenirs, souvenir_cursor(souvenirs[-1])
+
+
+def souvenir_cursor(souvenir: Souvenir) -> str:
+    """Encode the position of ``souvenir`` in the recency order as an opaque cursor."""
+    raw = json.dumps([souvenir.time.isoformat(), souvenir.souv_id, souvenir.user_name])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int, str]:
+    """Decode a cursor built by :func:`souvenir_cursor`."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        time, souv_id, user_name = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(time), int(souv_id), user_name
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise ValueError(f"Curseur invalide : {cursor!r}") from exc
+
+
+def update_souvenir(mem_id: int, data: Dict, user_name: Optional[str] = None) -> Optional[Souvenir]:
+    """Update fields of an existing souvenir.
+
+    A new ``full_content`` re-fragments the souvenir (only the fragments
+    that changed are written, cf. :func:`app.memory.fragmenter.refragment`)
+    in the same transaction as the souvenir.
+    """
+    with get_session(expire_on_commit=False) as session:
+        souvenir = _find_souvenir(session, mem_id, user_name)
         if not souvenir:
             return None
+        edited = "full_content" in data and data["full_content"] != souvenir.full_content
         for key, value in data.items():
             setattr(souvenir, key, value)
         session.add(souvenir)
+        diff = refragment(souvenir, session) if edited else None
         session.commit()
         session.refresh(souvenir)
-        return souvenir
+    _emit("souvenir_updated", souv_id=souvenir.souv_id, user_name=souvenir.user_name)
+    _fragments_updated(souvenir, diff)
+    return souvenir
+
+
+def _fragments_updated(souvenir: Souvenir, diff: Optional[FragmentDiff]) -> None:
+    """Announce the fragments of ``souvenir`` that a committed ``diff`` changed."""
+    if diff is not None and not diff.unchanged:
+        # nouvelles versions, puis les anciennes passées à is_last_version = False
+        fragments = diff.inserted + [old for old, _ in diff.superseded] + diff.retired
+        _emit("fragments_updated", souv_id=souvenir.souv_id, user_name=souvenir.user_name, fragments=fragments)
 
 
-def delete_souvenir(mem_id: int) -> bool:
+def delete_souvenir(mem_id: int, user_name: Optional[str] = None) -> bool:
     """Remove a souvenir from the database."""
     with get_session() as session:
-        souvenir = session.get(Souvenir, mem_id)
+        souvenir = _find_souvenir(session, mem_id, user_name)
         if not souvenir:
             return False
+        key = (souvenir.souv_id, souvenir.user_name)
         session.delete(souvenir)
         session.commit()
-        return True
+    _emit("souvenir_deleted", souv_id=key[0], user_name=key[1])
+    return True
 
 
 """def save_souvenir(souvenir: Souvenir) -> Souvenir:
@@ -91,7 +476,8 @@ def create_emo_lvl2_to_lv1(mapping: EmoLvl2ToLv1) -> EmoLvl2ToLv1:
         session.add(mapping)
         session.commit()
         session.refresh(mapping)
-        return mapping
+    _emit("emotion_updated", emo_lvl2=mapping.emo_lvl2)
+    return mapping
 
 
 def get_emo_lvl2_to_lv1(emo_lvl2: str) -> Optional[EmoLvl2ToLv1]:
@@ -100,10 +486,16 @@ def get_emo_lvl2_to_lv1(emo_lvl2: str) -> Optional[EmoLvl2ToLv1]:
         return session.get(EmoLvl2ToLv1, emo_lvl2)
 
 
-def seek_emo_lvl2_to_lv1(limit: int = 10) -> List[EmoLvl2ToLv1]:
-    """Retourne une liste de correspondances ordonnées par nom."""
+def seek_emo_lvl2_to_lv1(limit: int = 10, after: Optional[str] = None) -> List[EmoLvl2ToLv1]:
+    """Retourne une liste de correspondances ordonnées par nom.
+
+    ``after`` est le dernier nom de la page précédente (pagination par clé).
+    """
+    statement = select(EmoLvl2ToLv1)
+    if after is not None:
+        statement = statement.where(EmoLvl2ToLv1.emo_lvl2 > after)
+    statement = statement.order_by(EmoLvl2ToLv1.emo_lvl2).limit(limit)
     with get_session() as session:
-        statement = select(EmoLvl2ToLv1).order_by(EmoLvl2ToLv1.emo_lvl2).limit(limit)
         return list(session.exec(statement))
 
 
@@ -120,7 +512,8 @@ def update_emo_lvl2_to_lv1(
         session.add(mapping)
         session.commit()
         session.refresh(mapping)
-        return mapping
+    _emit("emotion_updated", emo_lvl2=emo_lvl2)
+    return mapping
 
 
 def delete_emo_lvl2_to_lv1(emo_lvl2: str) -> bool:
@@ -131,7 +524,8 @@ def delete_emo_lvl2_to_lv1(emo_lvl2: str) -> bool:
             return False
         session.delete(mapping)
         session.commit()
-        return True
+    _emit("emotion_deleted", emo_lvl2=emo_lvl2)
+    return True
 
 
 # ----- CRUD pour les liens -----
@@ -142,7 +536,8 @@ def create_link(link: Link) -> Link:
         session.add(link)
         session.commit()
         session.refresh(link)
-        return link
+    _emit("link_updated", link_id=link.link_id, weight=link.weight)
+    return link
 
 
 def get_link(link_id: int) -> Optional[Link]:
@@ -151,10 +546,16 @@ def get_link(link_id: int) -> Optional[Link]:
         return session.get(Link, link_id)
 
 
-def seek_links(limit: int = 10) -> List[Link]:
-    """Retourne une liste de liens classés par id."""
+def seek_links(limit: int = 10, after: Optional[int] = None) -> List[Link]:
+    """Retourne une liste de liens classés par id.
+
+    ``after`` est le dernier ``link_id`` de la page précédente (pagination par clé).
+    """
+    statement = select(Link)
+    if after is not None:
+        statement = statement.where(Link.link_id > after)
+    statement = statement.order_by(Link.link_id).limit(limit)
     with get_session() as session:
-        statement = select(Link).order_by(Link.link_id).limit(limit)
         return list(session.exec(statement))
 
 
@@ -169,7 +570,8 @@ def update_link(link_id: int, data: Dict) -> Optional[Link]:
         session.add(link)
         session.commit()
         session.refresh(link)
-        return link
+    _emit("link_updated", link_id=link.link_id, weight=link.weight)
+    return link
 
 
 def delete_link(link_id: int) -> bool:
@@ -180,7 +582,8 @@ def delete_link(link_id: int) -> bool:
             return False
         session.delete(link)
         session.commit()
-        return True
+    _emit("link_deleted", link_id=link_id)
+    return True
 
 
 # ----- Gestion des associations lien-souvenir -----
@@ -188,11 +591,12 @@ def delete_link(link_id: int) -> bool:
 def associate_link_souvenir(mem_id: int, link_id: int) -> LinkSouvenir:
     """Crée une association entre un souvenir et un lien."""
     with get_session() as session:
-        association = LinkSouvenir(mem_id=mem_id, link_id=link_id)
+        association = LinkSouvenir(souv_id=mem_id, link_id=link_id)
         session.add(association)
         session.commit()
         session.refresh(association)
-        return association
+    _emit("link_souvenir_added", souv_id=mem_id, link_id=link_id)
+    return association
 
 
 def delete_association_link_souvenir(mem_id: int, link_id: int) -> bool:
@@ -203,7 +607,8 @@ def delete_association_link_souvenir(mem_id: int, link_id: int) -> bool:
             return False
         session.delete(association)
         session.commit()
-        return True
+    _emit("link_souvenir_removed", souv_id=mem_id, link_id=link_id)
+    return True
 
 
 def get_links_pour_souvenir(mem_id: int) -> List[Link]:
@@ -212,6 +617,128 @@ def get_links_pour_souvenir(mem_id: int) -> List[Link]:
         statement = (
             select(Link)
             .join(LinkSouvenir, Link.link_id == LinkSouvenir.link_id)
-            .where(LinkSouvenir.mem_id == mem_id)
+            .where(LinkSouvenir.souv_id == mem_id)
+        )
+        return list(session.exec(statement))
+
+
+def get_links_pour_souvenirs(mem_ids: Iterable[int]) -> Dict[int, List[Link]]:
+    """Liens de plusieurs souvenirs en une seule requête, par ``souv_id``."""
+    ids = list(dict.fromkeys(mem_ids))
+    links: Dict[int, List[Link]] = {mem_id: [] for mem_id in ids}
+    if not ids:
+        return links
+    statement = (
+        select(LinkSouvenir.souv_id, Link)
+        .join(LinkSouvenir, Link.link_id == LinkSouvenir.link_id)
+        .where(LinkSouvenir.souv_id.in_(ids))
+    )
+    with get_session() as session:
+        for souv_id, link in session.exec(statement):
+            links[souv_id].append(link)
+    return links
+
+
+# ----- Gestion des associations lien-fragment -----
+
+def associate_link_fragment(frag_id: int, link_id: int) -> LinkFragment:
+    """Crée une association entre un fragment et un lien."""
+    with get_session() as session:
+        association = LinkFragment(frag_id=frag_id, link_id=link_id)
+        session.add(association)
+        session.commit()
+        session.refresh(association)
+        souv_id = _fragment_souvenir(session, frag_id)
+    _emit("link_fragment_added", frag_id=frag_id, link_id=link_id, souv_id=souv_id)
+    return association
+
+
+def delete_association_link_fragment(frag_id: int, link_id: int) -> bool:
+    """Supprime l'association entre un fragment et un lien."""
+    with get_session() as session:
+        association = session.get(LinkFragment, (frag_id, link_id))
+        if not association:
+            return False
+        session.delete(association)
+        session.commit()
+        souv_id = _fragment_souvenir(session, frag_id)
+    _emit("link_fragment_removed", frag_id=frag_id, link_id=link_id, souv_id=souv_id)
+    return True
+
+
+def get_links_pour_fragment(frag_id: int) -> List[Link]:
+    """Retourne tous les liens associés à un fragment donné."""
+    with get_session() as session:
+        statement = (
+            select(Link)
+            .join(LinkFragment, Link.link_id == LinkFragment.link_id)
+            .where(LinkFragment.frag_id == frag_id)
         )
         return list(session.exec(statement))
+
+
+def _fragment_souvenir(session, frag_id: int) -> Optional[int]:
+    return session.exec(select(Fragment.souv_id).where(Fragment.frag_id == frag_id).limit(1)).first()
+
+
+# ----- CRUD pour les pensées de fond -----
+
+def create_background_thought(thought: Background_thought) -> Background_thought:
+    """Persiste une nouvelle pensée de fond."""
+    with get_session(expire_on_commit=False) as session:
+        session.add(thought)
+        session.commit()
+        session.refresh(thought)
+    _emit("background_thought_updated", thought=thought)
+    return thought
+
+
+def get_background_thought(bt_id: int) -> Optional[Background_thought]:
+    """Récupère une pensée de fond par son identifiant."""
+    with get_session() as session:
+        return session.get(Background_thought, bt_id)
+
+
+def seek_open_background_thoughts(limit: int = 100, after: Optional[int] = None) -> List[Background_thought]:
+    """Pensées de fond non terminées, classées par id.
+
+    ``after`` est le dernier ``BT_id`` de la page précédente (pagination par clé).
+    """
+    statement = select(Background_thought).where(Background_thought.done.is_(None))
+    if after is not None:
+        statement = statement.where(Background_thought.BT_id > after)
+    statement = statement.order_by(Background_thought.BT_id).limit(limit)
+    with get_session() as session:
+        return list(session.exec(statement))
+
+
+def update_background_thought(bt_id: int, data: Dict) -> Optional[Background_thought]:
+    """Met à jour les champs d'une pensée de fond (``done`` pour la clore)."""
+    with get_session(expire_on_commit=False) as session:
+        thought = session.get(Background_thought, bt_id)
+        if not thought:
+            return None
+        for key, value in data.items():
+            setattr(thought, key, value)
+        session.add(thought)
+        session.commit()
+        session.refresh(thought)
+    _emit("background_thought_updated", thought=thought)
+    return thought
+
+
+def complete_background_thought(bt_id: int) -> Optional[Background_thought]:
+    """Marque une pensée de fond comme accomplie."""
+    return update_background_thought(bt_id, {"done": datetime.utcnow()})
+
+
+def delete_background_thought(bt_id: int) -> bool:
+    """Supprime une pensée de fond."""
+    with get_session() as session:
+        thought = session.get(Background_thought, bt_id)
+        if not thought:
+            return False
+        session.delete(thought)
+        session.commit()
+    _emit("background_thought_deleted", bt_id=bt_id)
+    return True
@@ -1,16 +1,212 @@
 # app/memory/db.py
 
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Iterator, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection, Engine, make_url
+from sqlalchemy.pool import StaticPool
 from sqlmodel import SQLModel, create_engine, Session
+from starlette.concurrency import run_in_threadpool
+
+from app.memory import token_counts  # noqa: F401  (tokens_* remplis à l'écriture)
+from app.memory.decay import sql_decayed_weight, sql_weight_score
+from app.memory.fts import ensure_search_index
+from app.config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_SIZE,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_MMAP_SIZE,
+    SQLITE_SYNCHRONOUS,
+    METRICS_ENABLED,
+    SLOW_QUERY_MS,
+)
+from app.utils import metrics
+from app.utils.logger import logger
+
+DB_QUERY_SECONDS = metrics.REGISTRY.histogram(
+    "arch_db_query_duration_seconds", "Durée des requêtes SQL (executemany compte pour une)", ("operation",)
+)
+
+
+def make_engine(
+    url: str = DATABASE_URL,
+    *,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    journal_mode: str = SQLITE_JOURNAL_MODE,
+    synchronous: str = SQLITE_SYNCHRONOUS,
+    cache_size: int = SQLITE_CACHE_SIZE,
+    mmap_size: int = SQLITE_MMAP_SIZE,
+    busy_timeout: float = SQLITE_BUSY_TIMEOUT,
+    echo: bool = False,
+    instrument: bool = METRICS_ENABLED,
+    slow_query_ms: float = SLOW_QUERY_MS,
+) -> Engine:
+    """Build a pooled SQLite engine whose connections share the same pragmas.
+
+    WAL lets readers work while a writer commits, and ``busy_timeout`` makes
+    concurrent writers wait for the lock instead of failing with
+    "database is locked".
+    """
+    connect_args = {"check_same_thread": False, "timeout": busy_timeout}
+    database = make_url(url).database
+    if not database or database == ":memory:":
+        # Une base en mémoire n'existe que sur sa connexion : on la partage.
+        engine = create_engine(url, echo=echo, connect_args=connect_args, poolclass=StaticPool)
+    else:
+        engine = create_engine(
+            url,
+            echo=echo,
+            connect_args=connect_args,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+        )
+
+    pragmas = {
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,
+        "cache_size": cache_size,
+        "mmap_size": mmap_size,
+        "busy_timeout": int(busy_timeout * 1000),
+        "temp_store": "MEMORY",
+    }
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+        # rang du poids décru, cf. app.memory.decay
+        dbapi_connection.create_function("weight_score", 2, sql_weight_score, deterministic=True)
+        dbapi_connection.create_function("decayed_weight", 3, sql_decayed_weight, deterministic=True)
+
+    if instrument or slow_query_ms > 0:
+        _instrument(engine, instrument, slow_query_ms)
+    return engine
+
+
+def _instrument(engine: Engine, observe: bool, slow_query_ms: float) -> None:
+    """Time every statement: histogram per operation, per-request totals, slow-query log."""
+    slow = slow_query_ms / 1000 if slow_query_ms > 0 else None
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        if observe:
+            operation = (statement[:16].split(None, 1) or [""])[0].upper()
+            DB_QUERY_SECONDS.observe(elapsed, operation=operation if operation in _OPERATIONS else "OTHER")
+            stats = metrics.current_request()
+            if stats is not None:
+                stats.add_query(elapsed)
+        if slow is not None and elapsed >= slow:
+            logger.warning(f"Requête SQL lente ({elapsed * 1000:.1f} ms) : {' '.join(statement.split())[:500]}")
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        # la requête a échoué : after_cursor_execute ne viendra pas
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "CREATE", "WITH"}
+
 
 # Base de données dédiée aux souvenirs
-DATABASE_URL = "sqlite:///./arch.db"
-engine = create_engine(DATABASE_URL, echo=False)
+engine = make_engine()
+
+# Session liée à la requête HTTP en cours (voir :func:`request_session`)
+_request_session: ContextVar[Optional[Session]] = ContextVar("request_session", default=None)
+
+
+# Colonnes ajoutées après la création des tables : (table, colonne, type, valeur initiale)
+_ADDED_COLUMNS = (
+    ("souvenir", "weight_score", "FLOAT NOT NULL DEFAULT 0", "weight_score(weight, julianday(last_accessed))"),
+    ("fragment", "weight_score", "FLOAT NOT NULL DEFAULT 0", "weight_score(weight, julianday(last_accessed))"),
+    # calculée en Python à la lecture tant qu'elle est vide (app.memory.fragmenter)
+    ("fragment", "content_hash", "VARCHAR", None),
+    ("user", "is_active", "BOOLEAN DEFAULT 0", None),
+)
+
+
+def init_db(connection: Optional[Connection] = None):
+    """Create the tables, added columns, indexes and FTS index that are missing.
+
+    Idempotent but not free (one ``PRAGMA table_info`` per added column, one
+    probe per index): run it through :func:`app.bootstrap.bootstrap`, which
+    skips it when the schema version is current.
+    """
+    if connection is None:
+        with engine.begin() as connection:
+            init_db(connection)
+        return
+    SQLModel.metadata.create_all(connection)
+    _add_missing_columns(connection)
+    _create_missing_indexes(connection)
+    ensure_search_index(connection)
+
+
+def _add_missing_columns(connection: Connection):
+    """Add columns declared after their table was created, then fill them."""
+    for table, column, ddl, initial in _ADDED_COLUMNS:
+        columns = {row[1] for row in connection.execute(text(f"PRAGMA table_info('{table}')"))}
+        if not columns or column in columns:
+            continue
+        connection.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}'))
+        if initial is not None:
+            connection.execute(text(f'UPDATE "{table}" SET {column} = {initial}'))
+
+
+def _create_missing_indexes(connection: Connection):
+    """Add indexes declared after their table was created (create_all skips them)."""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+@contextmanager
+def get_session(expire_on_commit: bool = True) -> Iterator[Session]:
+    """Yield the session of the current request, or a fresh one outside requests."""
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+    with Session(engine, expire_on_commit=expire_on_commit) as session:
+        yield session
+
+
+def open_session(expire_on_commit: bool = True) -> Session:
+    """Return a new session that never joins the request-scoped one."""
+    return Session(engine, expire_on_commit=expire_on_commit)
 
-def init_db():
-    SQLModel.metadata.create_all(engine)
 
-def get_session():
-    return Session(engine)
+async def request_session() -> AsyncIterator[Session]:
+    """FastAPI dependency binding one session, on one connection, to a request.
 
-# Ensure tables are created on first import
-init_db()
+    Every CRUD helper called while handling the request picks it up through
+    :func:`get_session`. The dependency is async so the binding is made in the
+    request's context, which the threadpool copies for sync endpoints. The
+    connection is checked out in the threadpool: waiting for a free one
+    (``pool_timeout``) must not block the event loop.
+    """
+    connection = await run_in_threadpool(engine.connect)
+    session = Session(bind=connection, expire_on_commit=False)
+    _request_session.set(session)
+    try:
+        yield session
+    finally:
+        # rendre la connexion n'attend jamais : fait ici, même si la requête est annulée
+        _request_session.set(None)
+        session.close()
+        connection.close()
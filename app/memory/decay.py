@@ -0,0 +1,97 @@
+# app/memory/decay.py
+"""Lazy, closed-form weight decay.
+
+A memory stores ``(w0, t0)``: its weight ``weight`` as of ``last_accessed``.
+Its effective weight at ``t`` is ``w0 · exp(-λ·(t - t0))`` and is computed
+when read, so nothing has to rewrite the table to keep weights current; only
+a reinforcement (which resets ``t0``) writes a row.
+
+To rank in SQL, each row also stores ``weight_score = ln(w0) + λ·t0``:
+``ln w(t) = weight_score - λ·t`` and ``λ·t`` is the same for every row, so
+``ORDER BY weight_score DESC`` is the order of the decayed weights at any
+instant. Non-positive weights are mapped below every positive one, keeping
+the order exact for them too.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import event
+
+from app.models.memory import Fragment, Souvenir
+
+DECAY_LAMBDA = 0.01  # oubli par jour, même valeur que MemoryItem.lambda_decay
+
+_EPOCH = datetime(1970, 1, 1)
+UNIX_EPOCH_JULIAN = 2440587.5  # julianday('1970-01-01')
+_NON_POSITIVE_OFFSET = 1e9
+
+
+def epoch_days(moment: datetime) -> float:
+    """Days elapsed since 1970-01-01 for a naive UTC datetime."""
+    return (moment - _EPOCH).total_seconds() / 86400.0
+
+
+def to_julian(moment: datetime) -> float:
+    """Express a naive UTC datetime in days, on SQLite's ``julianday()`` scale."""
+    return epoch_days(moment) + UNIX_EPOCH_JULIAN
+
+
+def from_julian(days: float) -> datetime:
+    return _EPOCH + timedelta(days=float(days) - UNIX_EPOCH_JULIAN)
+
+
+def decayed_weight(
+    w0: float, t0: datetime, now: Optional[datetime] = None, lambda_decay: float = DECAY_LAMBDA
+) -> float:
+    """Effective weight at ``now`` of a memory weighing ``w0`` at ``t0``."""
+    dt = max(epoch_days(now or datetime.utcnow()) - epoch_days(t0), 0.0)
+    return w0 * math.exp(-lambda_decay * dt)
+
+
+def weight_score(w0: float, t0_days: float, lambda_decay: float = DECAY_LAMBDA) -> float:
+    """Rank key of ``(w0, t0)``: ``ln(w0) + λ·t0``, ``t0`` in epoch days."""
+    if w0 > 0:
+        return math.log(w0) + lambda_decay * t0_days
+    if w0 == 0:
+        return -_NON_POSITIVE_OFFSET
+    # poids négatifs (Elo) : ils remontent vers 0, le plus petit |w| passe devant
+    return -_NON_POSITIVE_OFFSET - (math.log(-w0) + lambda_decay * t0_days)
+
+
+def weight_scores(w0: np.ndarray, t0_days: np.ndarray, lambda_decay: float = DECAY_LAMBDA) -> np.ndarray:
+    """Vectorized :func:`weight_score`."""
+    with np.errstate(divide="ignore"):
+        magnitude = np.log(np.abs(w0)) + lambda_decay * t0_days
+    return np.where(
+        w0 > 0, magnitude, np.where(w0 == 0, -_NON_POSITIVE_OFFSET, -_NON_POSITIVE_OFFSET - magnitude)
+    )
+
+
+def sql_weight_score(w0, julian_day) -> Optional[float]:
+    """``weight_score(weight, julianday(last_accessed))`` SQL function (see db.make_engine)."""
+    if w0 is None or julian_day is None:
+        return None
+    return weight_score(float(w0), float(julian_day) - UNIX_EPOCH_JULIAN)
+
+
+def sql_decayed_weight(w0, t0_julian, t_julian) -> Optional[float]:
+    """``decayed_weight(weight, julianday(last_accessed), :now_julian)`` SQL function."""
+    if w0 is None:
+        return None
+    if t0_julian is None or t_julian is None:
+        return float(w0)
+    return float(w0) * math.exp(-DECAY_LAMBDA * max(float(t_julian) - float(t0_julian), 0.0))
+
+
+@event.listens_for(Souvenir, "before_insert")
+@event.listens_for(Souvenir, "before_update")
+@event.listens_for(Fragment, "before_insert")
+@event.listens_for(Fragment, "before_update")
+def _stamp_weight_score(mapper, connection, target) -> None:
+    """Keep ``weight_score`` in step with ``weight`` and ``last_accessed`` on ORM writes."""
+    target.weight_score = weight_score(float(target.weight or 0.0), epoch_days(target.last_accessed))
@@ -0,0 +1,260 @@
+# app/memory/emotions.py
+"""Plutchik vectors of the ``emo_lvl2`` tags of souvenirs and fragments.
+
+The ``emo_lvl2_to_lv1`` table is small and nearly static: :class:`EmotionTable`
+keeps it in memory as one ``(n_tags, 8)`` matrix over :data:`PRIMARY_EMOTIONS`
+and reloads it after any change made through the crud functions.
+
+A tag string is split into tags (words separated by spaces, commas,
+semicolons, ``|`` or ``/``; each emoji is a tag of its own, even glued to a
+word) and its vector is the sum of the rows of the known tags. Many strings
+are turned into a matrix at once, each distinct string being parsed only
+once, so filling ``emo_lvl1`` for the whole history or ranking memories by
+emotional profile is a NumPy operation.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from sqlalchemy import and_, bindparam, tuple_
+from sqlmodel import select
+
+from app.memory.crud import subscribe
+from app.memory.db import get_session
+from app.memory.memory_weight import MemoryModel, WeightTable
+from app.models.memory import EmoLvl2ToLv1, Souvenir
+
+PRIMARY_EMOTIONS = ("joy", "trust", "fear", "surprise", "sadness", "disgust", "anger", "anticipation")
+
+_MODIFIERS = "\U0001F3FB-\U0001F3FF\uFE0F\u20E3"  # teintes de peau, sélecteur emoji, keycap
+_PICTOGRAPHS = "\U0001F000-\U0001FAFF\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF"
+_ZWJ = "\u200D"
+_EMOJI = f"[{_PICTOGRAPHS}][{_MODIFIERS}]*(?:{_ZWJ}[{_PICTOGRAPHS}][{_MODIFIERS}]*)*"
+_TAG = re.compile(f"{_EMOJI}|[^\\s,;|/{_PICTOGRAPHS}{_MODIFIERS}{_ZWJ}]+")
+
+Profile = Union[Mapping[str, float], Sequence[float], np.ndarray]
+
+
+@lru_cache(maxsize=65536)
+def parse_tags(emo_lvl2: Optional[str]) -> Tuple[str, ...]:
+    """Split an ``emo_lvl2`` string into normalised tags (words lowercased, emojis as is)."""
+    if not emo_lvl2:
+        return ()
+    return tuple(_normalise(tag) for tag in _TAG.findall(emo_lvl2))
+
+
+def _normalise(tag: str) -> str:
+    # le sélecteur FE0F est facultatif : "❤️" et "❤" sont la même émotion
+    return tag.replace("\uFE0F", "").strip().lower()
+
+
+def profile_vector(profile: Profile) -> np.ndarray:
+    """8-vector of a profile given as ``{"joy": 1, ...}`` or as a sequence."""
+    if isinstance(profile, Mapping):
+        unknown = set(profile) - set(PRIMARY_EMOTIONS)
+        if unknown:
+            raise ValueError(f"Émotions primaires inconnues : {', '.join(sorted(unknown))}")
+        return np.array([float(profile.get(name, 0.0)) for name in PRIMARY_EMOTIONS])
+    vector = np.asarray(profile, dtype=np.float64)
+    if vector.shape != (len(PRIMARY_EMOTIONS),):
+        raise ValueError(f"Un profil émotionnel a {len(PRIMARY_EMOTIONS)} composantes")
+    return vector
+
+
+class EmotionTable:
+    """In-memory copy of ``emo_lvl2_to_lv1``, loaded on first use."""
+
+    def __init__(self) -> None:
+        self._index: Optional[Dict[str, int]] = None
+        self._matrix = np.zeros((0, len(PRIMARY_EMOTIONS)))
+        self._generation = 0  # incrémenté à chaque invalidation
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._index = None
+            self._generation += 1
+
+    def _load(self) -> Tuple[Dict[str, int], np.ndarray]:
+        with self._lock:
+            if self._index is not None:
+                return self._index, self._matrix
+            generation = self._generation
+        with get_session() as session:
+            rows = session.exec(
+                select(EmoLvl2ToLv1.emo_lvl2, *[getattr(EmoLvl2ToLv1, name) for name in PRIMARY_EMOTIONS])
+            ).all()
+        index: Dict[str, int] = {}
+        matrix = np.zeros((len(rows), len(PRIMARY_EMOTIONS)))
+        for i, row in enumerate(rows):
+            index.setdefault(_normalise(row[0]), i)
+            matrix[i] = [value or 0 for value in row[1:]]
+        with self._lock:
+            # une invalidation pendant la lecture : la table lue est peut-être déjà périmée
+            if self._generation == generation:
+                self._index, self._matrix = index, matrix
+        return index, matrix
+
+    @property
+    def matrix(self) -> np.ndarray:
+        """``(n_tags, 8)`` matrix, rows in the order of :meth:`tags`."""
+        return self._load()[1]
+
+    def tags(self) -> List[str]:
+        index = self._load()[0]
+        return sorted(index, key=index.get)
+
+    def vector(self, emo_lvl2: Optional[str]) -> np.ndarray:
+        """Plutchik vector of one tag string (unknown tags count for nothing)."""
+        return self.vectors([emo_lvl2])[0]
+
+    def vectors(self, tag_strings: Iterable[Optional[str]]) -> np.ndarray:
+        """``(len(tag_strings), 8)`` matrix of the vectors of many tag strings."""
+        index, matrix = self._load()
+        distinct: Dict[Optional[str], int] = {}
+        positions = [distinct.setdefault(s, len(distinct)) for s in tag_strings]
+        rows: List[int] = []
+        columns: List[int] = []
+        for s, row in distinct.items():
+            for tag in parse_tags(s):
+                i = index.get(tag)
+                if i is not None:
+                    rows.append(row)
+                    columns.append(i)
+        per_string = np.zeros((len(distinct), len(PRIMARY_EMOTIONS)))
+        if rows:
+            np.add.at(per_string, np.asarray(rows), matrix[np.asarray(columns)])
+        return per_string[np.asarray(positions, dtype=np.intp)]
+
+    def unknown_tags(self, tag_strings: Iterable[Optional[str]]) -> List[str]:
+        """Tags used in ``tag_strings`` that have no row in the table."""
+        index = self._load()[0]
+        seen = dict.fromkeys(tag for s in set(tag_strings) for tag in parse_tags(s))
+        return [tag for tag in seen if tag not in index]
+
+
+emotion_table = EmotionTable()
+
+
+def _on_emotion_changed(**_) -> None:
+    emotion_table.invalidate()
+
+
+def _on_memory_imported(tables=frozenset(), **_) -> None:
+    if "emo_lvl2_to_lv1" in tables:
+        emotion_table.invalidate()
+
+
+subscribe("emotion_updated", _on_emotion_changed)
+subscribe("emotion_deleted", _on_emotion_changed)
+subscribe("memory_imported", _on_memory_imported)
+
+
+def aggregate(vectors: np.ndarray, normalise: bool = True) -> np.ndarray:
+    """Emotional profile of a set of memories: mean vector, L1-normalised if asked."""
+    if len(vectors) == 0:
+        return np.zeros(len(PRIMARY_EMOTIONS))
+    total = np.asarray(vectors).mean(axis=0)
+    norm = np.abs(total).sum()
+    return total / norm if normalise and norm > 0 else total
+
+
+def lvl1_labels(vectors: np.ndarray, threshold: float = 0.5) -> List[Optional[str]]:
+    """``emo_lvl1`` of each vector: primaries reaching ``threshold`` × its maximum, strongest first."""
+    vectors = np.asarray(vectors)
+    peak = vectors.max(axis=1, keepdims=True)
+    kept = (vectors > 0) & (vectors >= threshold * peak)
+    order = np.argsort(-vectors, axis=1, kind="stable")
+    labels: List[Optional[str]] = []
+    for row in range(len(vectors)):
+        names = [PRIMARY_EMOTIONS[j] for j in order[row] if kept[row, j]]
+        labels.append(",".join(names) or None)
+    return labels
+
+
+def _tagged_rows(model: MemoryModel, user_name: Optional[str] = None) -> List[Tuple]:
+    """``(*key, emo_lvl2, emo_lvl1)`` of every row of ``model`` carrying tags."""
+    key_names = WeightTable.key_columns(model)
+    statement = select(*[getattr(model, name) for name in key_names], model.emo_lvl2, model.emo_lvl1).where(
+        model.emo_lvl2.is_not(None), model.emo_lvl2 != ""
+    )
+    if user_name is not None:
+        statement = statement.where(model.user_name == user_name)
+    with get_session() as session:
+        return list(session.exec(statement))
+
+
+def fill_emo_lvl1(model: MemoryModel = Souvenir, threshold: float = 0.5) -> int:
+    """Derive ``emo_lvl1`` from ``emo_lvl2`` for every row, in one executemany UPDATE.
+
+    Only rows whose label changes are written; returns their count.
+    """
+    rows = _tagged_rows(model)
+    if not rows:
+        return 0
+    key_names = WeightTable.key_columns(model)
+    n_keys = len(key_names)
+    labels = lvl1_labels(emotion_table.vectors(row[n_keys] for row in rows), threshold)
+    params = [
+        {**{f"key_{name}": value for name, value in zip(key_names, row[:n_keys])}, "new_emo_lvl1": label}
+        for row, label in zip(rows, labels)
+        if row[n_keys + 1] != label
+    ]
+    if not params:
+        return 0
+    table = model.__table__
+    statement = (
+        table.update()
+        .where(and_(*[table.c[name] == bindparam(f"key_{name}") for name in key_names]))
+        .values(emo_lvl1=bindparam("new_emo_lvl1"))
+    )
+    with get_session() as session:
+        session.exec(statement, params=params)
+        session.commit()
+    return len(params)
+
+
+def rank_by_profile(
+    profile: Profile,
+    model: MemoryModel = Souvenir,
+    k: int = 20,
+    user_name: Optional[str] = None,
+    min_similarity: float = 0.0,
+) -> List[Tuple[Tuple, float]]:
+    """Keys of the ``k`` memories whose emotions are closest (cosine) to ``profile``."""
+    target = profile_vector(profile)
+    target_norm = np.linalg.norm(target)
+    rows = _tagged_rows(model, user_name)
+    if not rows or target_norm == 0 or k <= 0:
+        return []
+    n_keys = len(WeightTable.key_columns(model))
+    vectors = emotion_table.vectors(row[n_keys] for row in rows)
+    norms = np.linalg.norm(vectors, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        similarity = np.where(norms > 0, vectors @ target / (norms * target_norm), 0.0)
+    candidates = np.flatnonzero(similarity > min_similarity) if min_similarity > 0 else np.flatnonzero(norms > 0)
+    if candidates.size == 0:
+        return []
+    k = min(k, candidates.size)
+    best = candidates[np.argpartition(-similarity[candidates], k - 1)[:k]]
+    best = best[np.argsort(-similarity[best], kind="stable")]
+    return [(tuple(rows[i][:n_keys]), float(similarity[i])) for i in best]
+
+
+def seek_by_profile(profile: Profile, model: MemoryModel = Souvenir, k: int = 20, **options) -> List:
+    """Like :func:`rank_by_profile` but return the rows, closest first."""
+    ranked = rank_by_profile(profile, model, k, **options)
+    if not ranked:
+        return []
+    key_names = WeightTable.key_columns(model)
+    keys = [key for key, _ in ranked]
+    columns = [getattr(model, name) for name in key_names]
+    with get_session() as session:
+        rows = session.exec(select(model).where(tuple_(*columns).in_(keys)))
+        by_key = {tuple(getattr(row, name) for name in key_names): row for row in rows}
+    return [by_key[key] for key in keys if key in by_key]
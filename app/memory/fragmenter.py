@@ -0,0 +1,307 @@
+# app/memory/fragmenter.py
+"""Re-fragmentation of an edited souvenir (see the :class:`Fragment` docstring).
+
+The new ``full_content`` is cut on ``---`` lines and compared with the
+current fragments of the souvenir by content hash:
+
+* the two hash sequences are aligned with :class:`difflib.SequenceMatcher`,
+  fragments in identical blocks are kept as is;
+* outside them, a hash found again elsewhere is a moved fragment, kept too;
+* in what remains of a replaced block the n-th old fragment gets the n-th
+  new one as next version; an old fragment without counterpart is retired,
+  a new one without counterpart is inserted.
+
+Superseded and retired fragments stay in the table with
+``is_last_version = False``; every member of their version chain moves one
+position away from the last version, its weight divided accordingly
+(position ``p`` weighs ``w / p``, e.g. ``0.6 / 3 = 0.2``). Those chains are
+rewritten by one executemany ``UPDATE``; kept fragments are not written.
+
+:func:`app.memory.crud.update_souvenir` calls :func:`refragment` when the
+``full_content`` changes, in the transaction that writes the souvenir. New ``frag_id`` values come from
+:data:`fragment_ids`, by blocks, never from a ``MAX(frag_id)`` scan.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, bindparam, func, or_, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session, select
+
+from app.memory.db import get_session, open_session
+from app.models.memory import Fragment, FragmentSequence, Souvenir
+
+SEPARATOR = re.compile(r"^[ \t]*-{3,}[ \t]*$", re.MULTILINE)
+
+
+class FragmentIdAllocator:
+    """Hand out ``frag_id`` values, unique over the whole table, from reserved blocks.
+
+    Same scheme as :class:`app.memory.crud.SouvenirIdAllocator` on the single
+    row of :class:`FragmentSequence`: one ``UPDATE ... RETURNING`` per block,
+    committed in its own session, and the ``MAX(frag_id)`` scan only to seed
+    the sequence. Concurrent processes never receive the same identifier.
+    """
+
+    def __init__(self, block_size: int = 64) -> None:
+        self.block_size = block_size
+        self._next, self._end = 0, 0
+        self._lock = threading.Lock()
+
+    def allocate(self, count: int = 1) -> List[int]:
+        """Return ``count`` unused identifiers."""
+        ids: List[int] = []
+        with self._lock:
+            while len(ids) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve(max(self.block_size, count - len(ids)))
+                taken = min(count - len(ids), self._end - self._next)
+                ids.extend(range(self._next, self._next + taken))
+                self._next += taken
+        return ids
+
+    def reset(self) -> None:
+        """Forget the block held in memory (its unused ids are lost)."""
+        with self._lock:
+            self._next, self._end = 0, 0
+
+    @staticmethod
+    def _reserve(size: int) -> Tuple[int, int]:
+        reserve = (
+            update(FragmentSequence)
+            .where(FragmentSequence.id == 0)
+            .values(next_id=FragmentSequence.next_id + size)
+            .returning(FragmentSequence.next_id)
+        )
+        with open_session() as session:
+            end = session.exec(reserve).scalar_one_or_none()
+            if end is None:
+                first = session.exec(select(func.coalesce(func.max(Fragment.frag_id), 0) + 1)).one()
+                session.exec(sqlite_insert(FragmentSequence).values(id=0, next_id=first).on_conflict_do_nothing())
+                end = session.exec(reserve).scalar_one()
+            session.commit()
+        return end - size, end
+
+
+fragment_ids = FragmentIdAllocator()
+
+
+def split_fragments(full_content: str) -> List[str]:
+    """Cut ``full_content`` on ``---`` lines, dropping empty pieces."""
+    return [piece.strip() for piece in SEPARATOR.split(full_content or "") if piece.strip()]
+
+
+def content_hash(text_: str) -> str:
+    """Hash of a fragment's text, blind to trailing spaces and line endings."""
+    normalised = "\n".join(line.rstrip() for line in text_.strip().splitlines())
+    return hashlib.blake2b(normalised.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def version_chain(fragment: Fragment) -> List[int]:
+    """frag_ids of the versions of ``fragment``, oldest first, itself last."""
+    chain = json.loads(fragment.versions) if fragment.versions else []
+    return chain if chain and chain[-1] == fragment.frag_id else chain + [fragment.frag_id]
+
+
+@dataclass
+class FragmentDiff:
+    """Outcome of :func:`diff_fragments` / :func:`refragment`."""
+
+    kept: List[Fragment] = field(default_factory=list)
+    added: List[str] = field(default_factory=list)  # textes sans version précédente
+    superseded: List[Tuple[Fragment, str]] = field(default_factory=list)  # (ancienne version, nouveau texte)
+    retired: List[Fragment] = field(default_factory=list)
+    inserted: List[Fragment] = field(default_factory=list)  # lignes écrites par refragment
+
+    @property
+    def unchanged(self) -> bool:
+        return not (self.added or self.superseded or self.retired)
+
+    @property
+    def touched(self) -> int:
+        """Fragments written: new ones plus last versions superseded or retired."""
+        return len(self.added) + 2 * len(self.superseded) + len(self.retired)
+
+
+def diff_fragments(current: Sequence[Fragment], new_texts: Sequence[str]) -> FragmentDiff:
+    """Plan the change from ``current`` (ordered fragments) to ``new_texts``; nothing is written."""
+    diff = FragmentDiff()
+    old_hashes = [f.content_hash or content_hash(f.full_content) for f in current]
+    new_hashes = [content_hash(t) for t in new_texts]
+
+    # 1. alignement : les blocs identiques sont conservés
+    blocks = []
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_hashes, new_hashes, autojunk=False).get_opcodes():
+        if tag == "equal":
+            diff.kept.extend(current[i1:i2])
+        else:
+            blocks.append((list(range(i1, i2)), list(range(j1, j2))))
+
+    # 2. fragments déplacés : même empreinte ailleurs dans le texte
+    moved: Dict[str, List[int]] = {}
+    for olds, _ in blocks:
+        for i in olds:
+            moved.setdefault(old_hashes[i], []).append(i)
+    matched = set()
+    for _, news in blocks:
+        for j in list(news):
+            if moved.get(new_hashes[j]):
+                i = moved[new_hashes[j]].pop(0)
+                matched.add(i)
+                news.remove(j)
+                diff.kept.append(current[i])
+
+    # 3. le reste d'un bloc remplacé : n-ième ancien → n-ième nouveau
+    for olds, news in blocks:
+        olds = [i for i in olds if i not in matched]
+        pairs = min(len(olds), len(news))
+        for i, j in zip(olds[:pairs], news[:pairs]):
+            diff.superseded.append((current[i], new_texts[j]))
+        diff.retired.extend(current[i] for i in olds[pairs:])
+        diff.added.extend(new_texts[j] for j in news[pairs:])
+    return diff
+
+
+def current_fragments(souv_id: int, user_name: str, session: Optional[Session] = None) -> List[Fragment]:
+    """Last versions of the fragments of a souvenir, in frag_id order."""
+    statement = (
+        select(Fragment)
+        .where(Fragment.souv_id == souv_id, Fragment.user_name == user_name)
+        .where(or_(Fragment.is_last_version.is_(None), Fragment.is_last_version == True))  # noqa: E712
+        .order_by(Fragment.frag_id)
+    )
+    if session is not None:
+        with session.no_autoflush:  # pas d'écriture (ni de verrou) avant la réservation des frag_id
+            return list(session.exec(statement))
+    with get_session() as session:
+        return list(session.exec(statement))
+
+
+def refragment(souvenir: Souvenir, session: Optional[Session] = None) -> FragmentDiff:
+    """Bring the fragments of ``souvenir`` in line with its ``full_content``.
+
+    Only new fragments are inserted and only the version chains of
+    superseded or retired fragments are updated. Given a ``session``, the
+    writes join its transaction and the caller commits them with the
+    souvenir; that session must not have written yet, since new ids are
+    reserved in a session of their own first. Otherwise they are committed
+    here.
+    """
+    return refragment_many([souvenir], session)[0]
+
+
+def refragment_many(souvenirs: Sequence[Souvenir], session: Optional[Session] = None) -> List[FragmentDiff]:
+    """:func:`refragment` for several souvenirs, with one id reservation and one write."""
+    diffs = [
+        diff_fragments(current_fragments(s.souv_id, s.user_name, session), split_fragments(s.full_content))
+        for s in souvenirs
+    ]
+    needed = sum(len(diff.superseded) + len(diff.added) for diff in diffs)
+    if all(diff.unchanged for diff in diffs):
+        return diffs
+
+    now = datetime.utcnow()
+    new_ids = iter(fragment_ids.allocate(needed) if needed else ())
+
+    def new_fragment(souvenir: Souvenir, text_: str, chain: List[int]) -> Fragment:
+        frag_id = next(new_ids)
+        return Fragment(
+            frag_id=frag_id,
+            souv_id=souvenir.souv_id,
+            user_name=souvenir.user_name,
+            type=souvenir.type,
+            content=text_,
+            full_content=text_,
+            weight=souvenir.weight,
+            importance=souvenir.importance,
+            time=now,
+            last_accessed=now,
+            is_last_version=True,
+            versions=json.dumps(chain + [frag_id]) if chain else None,
+            content_hash=content_hash(text_),
+        )
+
+    inserted: List[Fragment] = []
+    chains: List[Tuple[Fragment, List[int]]] = []
+    for souvenir, diff in zip(souvenirs, diffs):
+        for old, text_ in diff.superseded:
+            chain = version_chain(old)
+            successor = new_fragment(souvenir, text_, chain)
+            diff.inserted.append(successor)
+            chains.append((old, chain + [successor.frag_id]))
+        for old in diff.retired:
+            chains.append((old, version_chain(old)))
+        diff.inserted.extend(new_fragment(souvenir, text_, []) for text_ in diff.added)
+        inserted.extend(diff.inserted)
+
+    if session is not None:
+        _write_fragments(session, inserted, chains)
+    else:
+        with get_session(expire_on_commit=False) as session:
+            _write_fragments(session, inserted, chains)
+            session.commit()
+
+    for old, _ in chains:
+        # déjà écrit par _shift_versions : ne pas rendre l'objet « dirty »
+        set_committed_value(old, "is_last_version", False)
+    return diffs
+
+
+def _write_fragments(session: Session, inserted: List[Fragment], chains: List[Tuple[Fragment, List[int]]]) -> None:
+    session.add_all(inserted)
+    session.flush()
+    _shift_versions(session, chains)
+
+
+def _shift_versions(session, chains: Sequence[Tuple[Fragment, List[int]]]) -> None:
+    """Move every member of ``chains`` one position down, in one executemany UPDATE.
+
+    ``chains`` pairs the former last version with its new chain; the member
+    at position ``p`` (1 = last version) goes to ``p + 1`` and its weight is
+    scaled by ``p / (p + 1)``, so that an untouched chain weighs ``w / p``.
+    """
+    params = []
+    for old, chain in chains:
+        previous = version_chain(old)
+        for index, frag_id in enumerate(previous):
+            position = len(previous) - index
+            params.append(
+                {
+                    "key_frag_id": frag_id,
+                    "key_souv_id": old.souv_id,
+                    "key_user_name": old.user_name,
+                    "factor": position / (position + 1),
+                    "new_versions": json.dumps(chain),
+                }
+            )
+    if not params:
+        return
+    table = Fragment.__table__
+    scaled = table.c.weight * bindparam("factor")
+    statement = (
+        table.update()
+        .where(
+            and_(
+                table.c.frag_id == bindparam("key_frag_id"),
+                table.c.souv_id == bindparam("key_souv_id"),
+                table.c.user_name == bindparam("key_user_name"),
+            )
+        )
+        .values(
+            weight=scaled,
+            weight_score=func.weight_score(scaled, func.julianday(table.c.last_accessed)),
+            is_last_version=False,
+            versions=bindparam("new_versions"),
+        )
+    )
+    session.exec(statement, params=params)
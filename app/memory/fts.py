@@ -0,0 +1,115 @@
+# app/memory/fts.py
+"""Full-text index (SQLite FTS5) over souvenirs and fragments.
+
+The ``souvenir_fts`` and ``fragment_fts`` tables are *external content*
+indexes: they store only the inverted index and read the text back from
+``souvenir`` / ``fragment`` through their ``rowid``. Triggers keep them in
+sync on every insert, delete and text update.
+
+``VACUUM`` may renumber the rowids of these tables (their primary keys are
+composite), so run :func:`rebuild_search_index` after a ``VACUUM``.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+TOKENIZER = "unicode61 remove_diacritics 2"
+MAX_QUERY_TERMS = 32
+
+_INDEXES = {
+    "souvenir_fts": ("souvenir", ("content", "full_content", "summary")),
+    "fragment_fts": ("fragment", ("full_content",)),
+}
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def _ddl(fts_table: str, source: str, columns) -> List[str]:
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{cols}, content='{source}', content_rowid='rowid', tokenize='{TOKENIZER}')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.rowid, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {cols}) VALUES ('delete', old.rowid, {old}); "
+        f"INSERT INTO {fts_table}(rowid, {cols}) VALUES (new.rowid, {new}); END",
+    ]
+
+
+def ensure_search_index(connection: Connection) -> None:
+    """Create the FTS tables and triggers, indexing existing rows on first creation."""
+    existing = {
+        row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+    }
+    for fts_table, (source, columns) in _INDEXES.items():
+        if source not in existing:
+            continue  # table source pas encore créée (modèles non importés)
+        for statement in _ddl(fts_table, source, columns):
+            connection.execute(text(statement))
+        if fts_table not in existing:
+            connection.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def rebuild_search_index(connection: Connection) -> None:
+    """Rebuild both FTS indexes from their content tables."""
+    for fts_table in _INDEXES:
+        connection.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+
+def match_expression(query: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query matching any of its words.
+
+    Every word is quoted, so FTS5 operators typed by a user (``AND``, ``*``,
+    ``:``...) are searched for literally instead of raising syntax errors.
+    """
+    words = _WORD.findall(query)[:MAX_QUERY_TERMS]
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"' for word in words)
+
+
+def ranked_souvenir_keys_sql(with_user: bool) -> str:
+    """SQL returning ``(souv_id, user_name, score)`` best first (lower BM25 is better).
+
+    A souvenir matches through its own text or through the text of one of its
+    current fragments; it keeps its best score.
+    """
+    souvenir_user = "AND s.user_name = :user_name" if with_user else ""
+    fragment_user = "AND f.user_name = :user_name" if with_user else ""
+    return f"""
+        SELECT souv_id, user_name, MIN(score) AS score FROM (
+            SELECT s.souv_id AS souv_id, s.user_name AS user_name,
+                   bm25(souvenir_fts, 1.0, 1.0, 0.5) AS score
+            FROM souvenir_fts JOIN souvenir AS s ON s.rowid = souvenir_fts.rowid
+            WHERE souvenir_fts MATCH :match {souvenir_user}
+            UNION ALL
+            SELECT f.souv_id, f.user_name, bm25(fragment_fts) AS score
+            FROM fragment_fts JOIN fragment AS f ON f.rowid = fragment_fts.rowid
+            WHERE fragment_fts MATCH :match AND coalesce(f.is_last_version, 1) {fragment_user}
+        )
+        GROUP BY souv_id, user_name
+        ORDER BY score
+        LIMIT :limit
+    """
+
+
+def ranked_fragment_keys_sql(with_user: bool) -> str:
+    """SQL returning ``(frag_id, souv_id, user_name, score)`` of current fragments, best first."""
+    fragment_user = "AND f.user_name = :user_name" if with_user else ""
+    return f"""
+        SELECT f.frag_id, f.souv_id, f.user_name, bm25(fragment_fts) AS score
+        FROM fragment_fts JOIN fragment AS f ON f.rowid = fragment_fts.rowid
+        WHERE fragment_fts MATCH :match AND coalesce(f.is_last_version, 1) {fragment_user}
+        ORDER BY score
+        LIMIT :limit
+    """
@@ -0,0 +1,246 @@
+# app/memory/graph.py
+"""In-memory association graph over ``Link`` / ``LinkSouvenir`` / ``LinkFragment``.
+
+Souvenirs and links are the nodes of a bipartite graph; a souvenir is tied
+to a link directly (``LinkSouvenir``) or through one of its fragments
+(``LinkFragment``). The edges are kept in a dict updated from the crud
+events, and compiled on demand into CSR arrays (``indptr``, ``indices``,
+``data``) holding the row-normalised transition matrix of the random walk.
+
+:meth:`LinkGraph.related` runs a personalized PageRank from a set of seed
+souvenirs: one sparse mat-vec per iteration (``np.bincount``), all souvenirs
+scored at once, instead of one join per souvenir. An edge weighs
+``1 + max(Link.weight, 0)``, so neutral links are still walked.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+from sqlmodel import select
+
+from app.memory.crud import subscribe
+from app.memory.db import get_session
+from app.models.memory import Fragment, Link, LinkFragment, LinkSouvenir
+
+# ("souvenir", souv_id, link_id) ou ("fragment", frag_id, link_id)
+EdgeKey = Tuple[str, int, int]
+
+
+def link_strength(weight: Optional[float]) -> float:
+    return 1.0 + max(float(weight or 0), 0.0)
+
+
+class LinkGraph:
+    """Souvenir–link graph with a personalized PageRank query."""
+
+    def __init__(self) -> None:
+        self._edges: Dict[EdgeKey, int] = {}  # -> souv_id
+        self._strength: Dict[int, float] = {}  # link_id -> poids de ses arêtes
+        self._loaded = False
+        self._compiled: Optional[Tuple[np.ndarray, ...]] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        self._ensure_loaded()
+        return len(self._edges)
+
+    # ----- construction -----
+
+    def load(self) -> int:
+        """(Re)read the link tables and return the number of edges."""
+        with get_session() as session:
+            links = session.exec(select(Link.link_id, Link.weight)).all()
+            direct = session.exec(
+                select(LinkSouvenir.souv_id, LinkSouvenir.link_id).join(Link, Link.link_id == LinkSouvenir.link_id)
+            ).all()
+            through = session.exec(
+                select(LinkFragment.frag_id, Fragment.souv_id, LinkFragment.link_id)
+                .join(Link, Link.link_id == LinkFragment.link_id)
+                .join(Fragment, Fragment.frag_id == LinkFragment.frag_id)
+                .distinct()
+            ).all()
+        with self._lock:
+            self._strength = {link_id: link_strength(weight) for link_id, weight in links}
+            self._edges = {("souvenir", souv_id, link_id): souv_id for souv_id, link_id in direct}
+            self._edges.update(
+                {("fragment", frag_id, link_id): souv_id for frag_id, souv_id, link_id in through}
+            )
+            self._loaded = True
+            self._compiled = None
+            return len(self._edges)
+
+    def invalidate(self) -> None:
+        """Forget the edges; they are read again on next use."""
+        with self._lock:
+            self._edges, self._strength = {}, {}
+            self._loaded = False
+            self._compiled = None
+
+    def add_edge(self, origin: str, origin_id: int, link_id: int, souv_id: int) -> None:
+        with self._lock:
+            if not self._loaded:
+                return  # lu en base au premier usage
+            self._edges[(origin, origin_id, link_id)] = souv_id
+            self._strength.setdefault(link_id, link_strength(None))
+            self._compiled = None
+
+    def remove_edge(self, origin: str, origin_id: int, link_id: int) -> None:
+        with self._lock:
+            if self._edges.pop((origin, origin_id, link_id), None) is not None:
+                self._compiled = None
+
+    def set_link_weight(self, link_id: int, weight: Optional[float]) -> None:
+        with self._lock:
+            if self._loaded:
+                self._strength[link_id] = link_strength(weight)
+                self._compiled = None
+
+    def remove_link(self, link_id: int) -> None:
+        with self._lock:
+            self._strength.pop(link_id, None)
+            for key in [key for key in self._edges if key[2] == link_id]:
+                del self._edges[key]
+            self._compiled = None
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def _compile(self) -> Tuple[np.ndarray, ...]:
+        """CSR of the transition matrix; nodes are souvenirs then links."""
+        self._ensure_loaded()
+        with self._lock:
+            if self._compiled is not None:
+                return self._compiled
+            pairs = set((souv_id, key[2]) for key, souv_id in self._edges.items())
+            souv = np.fromiter((p[0] for p in pairs), dtype=np.int64, count=len(pairs))
+            link = np.fromiter((p[1] for p in pairs), dtype=np.int64, count=len(pairs))
+            souv_ids, souv_index = np.unique(souv, return_inverse=True)
+            link_ids, link_index = np.unique(link, return_inverse=True)
+            strength = np.fromiter(
+                (self._strength.get(int(l), 1.0) for l in link_ids), dtype=np.float64, count=len(link_ids)
+            )
+            n_souv = len(souv_ids)
+            n = n_souv + len(link_ids)
+
+            # arêtes dans les deux sens : souvenir -> lien et lien -> souvenir
+            src = np.concatenate((souv_index, n_souv + link_index))
+            dst = np.concatenate((n_souv + link_index, souv_index))
+            weight = np.concatenate((strength[link_index], strength[link_index]))
+            order = np.lexsort((dst, src))
+            src, dst, weight = src[order], dst[order], weight[order]
+            out_weight = np.bincount(src, weights=weight, minlength=n)
+            data = weight / out_weight[src]
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n))))
+            self._compiled = (souv_ids, indptr, dst, data, src)
+            return self._compiled
+
+    def csr(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """``(indptr, indices, data)`` of the row-normalised transition matrix."""
+        _, indptr, indices, data, _ = self._compile()
+        return indptr, indices, data
+
+    # ----- requêtes -----
+
+    def related(
+        self,
+        seeds: Union[Iterable[int], Mapping[int, float]],
+        k: int = 10,
+        alpha: float = 0.15,
+        iterations: int = 30,
+        tol: float = 1e-6,
+        include_seeds: bool = False,
+    ) -> List[Tuple[int, float]]:
+        """Top ``k`` souvenirs by personalized PageRank from ``seeds``.
+
+        ``seeds`` are souv_ids, or a mapping souv_id -> initial activation;
+        ``alpha`` is the probability of jumping back to the seeds at each
+        step. Returns ``(souv_id, score)``, best first.
+        """
+        souv_ids, indptr, indices, data, rows = self._compile()
+        if not isinstance(seeds, Mapping):
+            seeds = {souv_id: 1.0 for souv_id in seeds}
+        if len(souv_ids) == 0 or not seeds or k <= 0:
+            return []
+        wanted = np.fromiter(seeds.keys(), dtype=np.int64, count=len(seeds))
+        mass = np.fromiter(seeds.values(), dtype=np.float64, count=len(seeds))
+        positions = np.searchsorted(souv_ids, wanted)
+        positions = np.minimum(positions, len(souv_ids) - 1)
+        found = (souv_ids[positions] == wanted) & (mass > 0)
+        if not found.any():
+            return []
+
+        n = len(indptr) - 1
+        personal = np.zeros(n)
+        np.add.at(personal, positions[found], mass[found])
+        personal /= personal.sum()
+        dangling = np.diff(indptr) == 0
+
+        score = personal.copy()
+        for _ in range(iterations):
+            spread = np.bincount(indices, weights=data * score[rows], minlength=n)
+            # masse des nœuds sans arête : renvoyée vers les graines
+            spread += score[dangling].sum() * personal
+            updated = alpha * personal + (1 - alpha) * spread
+            done = np.abs(updated - score).sum() < tol
+            score = updated
+            if done:
+                break
+
+        souvenir_scores = score[: len(souv_ids)]
+        if not include_seeds:
+            souvenir_scores = souvenir_scores.copy()
+            souvenir_scores[positions[found]] = 0.0
+        candidates = np.flatnonzero(souvenir_scores > 0)
+        if candidates.size == 0:
+            return []
+        k = min(k, candidates.size)
+        best = candidates[np.argpartition(-souvenir_scores[candidates], k - 1)[:k]]
+        best = best[np.argsort(-souvenir_scores[best], kind="stable")]
+        return [(int(souv_ids[i]), float(souvenir_scores[i])) for i in best]
+
+
+# Graphe partagé, chargé au premier usage puis tenu à jour par les événements du crud
+link_graph = LinkGraph()
+
+
+def _on_link_souvenir_added(souv_id: int, link_id: int, **_) -> None:
+    link_graph.add_edge("souvenir", souv_id, link_id, souv_id)
+
+
+def _on_link_souvenir_removed(souv_id: int, link_id: int, **_) -> None:
+    link_graph.remove_edge("souvenir", souv_id, link_id)
+
+
+def _on_link_fragment_added(frag_id: int, link_id: int, souv_id: Optional[int] = None, **_) -> None:
+    if souv_id is not None:
+        link_graph.add_edge("fragment", frag_id, link_id, souv_id)
+
+
+def _on_link_fragment_removed(frag_id: int, link_id: int, **_) -> None:
+    link_graph.remove_edge("fragment", frag_id, link_id)
+
+
+def _on_link_updated(link_id: int, weight: Optional[float] = None, **_) -> None:
+    link_graph.set_link_weight(link_id, weight)
+
+
+def _on_link_deleted(link_id: int, **_) -> None:
+    link_graph.remove_link(link_id)
+
+
+def _on_memory_imported(tables=frozenset(), **_) -> None:
+    if tables & {"link", "linksouvenir", "linkfragment", "fragment"}:
+        link_graph.invalidate()
+
+
+subscribe("link_souvenir_added", _on_link_souvenir_added)
+subscribe("link_souvenir_removed", _on_link_souvenir_removed)
+subscribe("link_fragment_added", _on_link_fragment_added)
+subscribe("link_fragment_removed", _on_link_fragment_removed)
+subscribe("link_updated", _on_link_updated)
+subscribe("link_deleted", _on_link_deleted)
+subscribe("memory_imported", _on_memory_imported)
@@ -7,9 +7,10 @@
 
 # Key ideas implemented:
 # - Softmax probability calculation for a set of weights.
-# - Temporal decay of weights:   w *= exp(-λ * Δt)
+# - Temporal decay of weights:   w *= exp(-λ * Δt)  (computed lazily, see app.memory.decay)
 # - Reinforcement on usage:      w += α * (1 - p_i)
-# - Pairwise comparison update via Elo ranking.
+# - Pairwise comparison update via Elo ranking, one pair or whole tournaments.
+# - WeightTable: the same rules applied to a whole table at once with NumPy.
 
 # Author: Noesis (generated for Nemo)
 # """
@@ -18,7 +19,23 @@ from __future__ import annotations
 from dataclasses import dataclass, field
 from math import exp
 from datetime import datetime
-from typing import Iterable, Dict
+from itertools import chain
+from typing import Iterable, Dict, List, Literal, Optional, Sequence, Tuple, Type, Union
+
+import numpy as np
+from sqlalchemy import and_, bindparam, func, tuple_
+from sqlmodel import select
+
+from app.memory.db import get_session
+from app.memory.decay import (
+    DECAY_LAMBDA,
+    UNIX_EPOCH_JULIAN,
+    decayed_weight,
+    from_julian,
+    to_julian,
+    weight_scores,
+)
+from app.models.memory import Fragment, Souvenir
 
 
 @dataclass
@@ -30,7 +47,7 @@ class MemoryItem:
     last_used: datetime = field(default_factory=datetime.utcnow)
 
     # Defaults (can be tuned)
-    lambda_decay: float = 0.01   # forgetting rate per day
+    lambda_decay: float = DECAY_LAMBDA   # forgetting rate per day
     alpha_gain: float = 0.1      # reinforcement gain
     elo_k: int = 32              # Elo K-factor
 
@@ -42,8 +59,12 @@ class MemoryItem:
         now = now or datetime.utcnow()
         return (now - self.last_used).total_seconds() / 86400.0
 
+    def weight_at(self, now: datetime | None = None) -> float:
+        """Decayed weight at ``now``, without modifying the item."""
+        return decayed_weight(self.w, self.last_used, now, self.lambda_decay)
+
     def decay(self, now: datetime | None = None) -> None:
-        """Exponential decay of weight with time."""
+        """Exponential decay of weight with time (eager; prefer :meth:`weight_at`)."""
         dt = self.since_last_use_days(now)
         self.w *= exp(-self.lambda_decay * dt)
 
@@ -55,11 +76,19 @@ class MemoryItem:
 
 def softmax_probabilities(items: Iterable[MemoryItem]) -> Dict[MemoryItem, float]:
     items = list(items)
-    exp_ws = [exp(it.w) for it in items]
-    total = sum(exp_ws)
-    if total == 0:
-        return {it: 1 / len(items) for it in items}
-    return {it: ew / total for it, ew in zip(items, exp_ws)}
+    if not items:
+        return {}
+    probabilities = softmax(np.array([it.w for it in items], dtype=np.float64))
+    return {it: float(p) for it, p in zip(items, probabilities)}
+
+
+def softmax(w: np.ndarray) -> np.ndarray:
+    """Numerically stable softmax (log-sum-exp): large weights cannot overflow."""
+    if w.size == 0:
+        return w.astype(np.float64)
+    z = w - np.max(w)
+    e = np.exp(z)
+    return e / e.sum()
 
 
 def elo_update(item_a: MemoryItem, item_b: MemoryItem, score_a: float) -> None:
@@ -70,3 +99,286 @@ def elo_update(item_a: MemoryItem, item_b: MemoryItem, score_a: float) -> None:
     k = (item_a.elo_k + item_b.elo_k) / 2
     item_a.w = wa + k * (score_a - expected_a)
     item_b.w = wb + k * ((1 - score_a) - expected_b)
+
+
+# ----- Vectorized engine over a whole table -----
+
+MemoryModel = Union[Type[Souvenir], Type[Fragment]]
+
+class WeightTable:
+    """Columnar copy of ``weight``, ``last_accessed`` and ``importance`` of a table.
+
+    Rows hold the lazy ``(w0, t0)`` pair of :mod:`app.memory.decay`: decay is
+    computed on read by :meth:`weights_at`, and only reinforced rows are
+    marked dirty, so :meth:`save` writes just those, in one ``executemany``.
+    """
+
+    KEY_CHUNK = 500  # clés par requête quand seules certaines lignes sont lues
+
+    def __init__(
+        self,
+        model: MemoryModel,
+        keys: List[Tuple],
+        weight: np.ndarray,
+        last_accessed: np.ndarray,
+        importance: np.ndarray,
+        lambda_decay: float = MemoryItem.lambda_decay,
+        alpha_gain: float = MemoryItem.alpha_gain,
+    ) -> None:
+        self.model = model
+        self.keys = keys
+        self.w = weight  # w0, poids à la date last_accessed
+        self.last_accessed = last_accessed  # t0, jours julien
+        self.importance = importance
+        self.lambda_decay = lambda_decay
+        self.alpha_gain = alpha_gain
+        self.dirty = np.zeros(len(keys), dtype=bool)
+        self._positions: Optional[Dict[Tuple, int]] = None
+
+    @staticmethod
+    def key_columns(model: MemoryModel) -> Tuple[str, ...]:
+        if model is Fragment:
+            return ("frag_id", "souv_id", "user_name")
+        return ("souv_id", "user_name")
+
+    @classmethod
+    def load(
+        cls, model: MemoryModel = Souvenir, keys: Optional[Iterable[Tuple]] = None, **params
+    ) -> "WeightTable":
+        """Read the weight columns of every row of ``model``, or only of ``keys``.
+
+        ``keys`` are primary keys, fetched by chunks of :attr:`KEY_CHUNK`;
+        unknown keys are left out of the table.
+        """
+        key_names = cls.key_columns(model)
+        columns = [getattr(model, name) for name in key_names]
+        statement = select(*columns, model.weight, func.julianday(model.last_accessed), model.importance)
+        if keys is None:
+            statements = [statement]
+        else:
+            wanted = list(dict.fromkeys(tuple(key) for key in keys))
+            statements = [
+                statement.where(tuple_(*columns).in_(wanted[i : i + cls.KEY_CHUNK]))
+                for i in range(0, len(wanted), cls.KEY_CHUNK)
+            ]
+        rows = []
+        with get_session() as session:
+            # curseur DB-API direct : pas d'objets Row pour des centaines de milliers de lignes
+            cursor = session.connection().connection.cursor()
+            try:
+                for chunk in statements:
+                    sql = str(chunk.compile(compile_kwargs={"literal_binds": True}))
+                    rows.extend(cursor.execute(sql).fetchall())
+            finally:
+                cursor.close()
+        n_keys = len(key_names)
+        keys = [row[:n_keys] for row in rows]
+        values = np.fromiter(
+            chain.from_iterable(row[n_keys:] for row in rows), dtype=np.float64, count=3 * len(rows)
+        ).reshape(len(rows), 3)
+        return cls(model, keys, values[:, 0].copy(), values[:, 1].copy(), values[:, 2].copy(), **params)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def index_of(self, keys: Sequence[Tuple]) -> np.ndarray:
+        """Positions of ``keys`` in the table arrays."""
+        if self._positions is None:
+            self._positions = {key: i for i, key in enumerate(self.keys)}
+        return np.fromiter((self._positions[tuple(key)] for key in keys), dtype=np.intp, count=len(keys))
+
+    def weights_at(self, now: datetime | None = None) -> np.ndarray:
+        """Effective weights ``w0·exp(-λ·(now - t0))`` of every row."""
+        now_days = to_julian(now or datetime.utcnow())
+        dt = np.maximum(now_days - self.last_accessed, 0.0)
+        return self.w * np.exp(-self.lambda_decay * dt)
+
+    def probabilities(self, rows: np.ndarray | None = None, now: datetime | None = None) -> np.ndarray:
+        """Softmax of the effective weights, over the whole table or over ``rows`` only."""
+        weights = self.weights_at(now)
+        return softmax(weights if rows is None else weights[rows])
+
+    def reinforce(
+        self,
+        rows: np.ndarray,
+        probabilities: np.ndarray | None = None,
+        now: datetime | None = None,
+    ) -> None:
+        """Apply ``w += α·(1 - p_i)`` to the used ``rows`` and restart their decay at ``now``.
+
+        ``probabilities`` are the ``p_i`` of those rows; by default their
+        softmax probability over the whole table.
+        """
+        now = now or datetime.utcnow()
+        rows = np.asarray(rows, dtype=np.intp)
+        if probabilities is None:
+            probabilities = self.probabilities(now=now)[rows]
+        unique = np.unique(rows)
+        self.w[unique] = self.weights_at(now)[unique]
+        np.add.at(self.w, rows, self.alpha_gain * (1.0 - np.asarray(probabilities, dtype=np.float64)))
+        self.last_accessed[unique] = to_julian(now)
+        self.dirty[unique] = True
+
+    def set_weights(self, rows: np.ndarray, weights: np.ndarray, now: datetime | None = None) -> None:
+        """Overwrite the effective weight of ``rows`` as of ``now``."""
+        rows = np.asarray(rows, dtype=np.intp)
+        self.w[rows] = weights
+        self.last_accessed[rows] = to_julian(now or datetime.utcnow())
+        self.dirty[rows] = True
+
+    def save(self) -> int:
+        """Write the changed rows back in one bulk ``UPDATE`` and return their count."""
+        changed = np.flatnonzero(self.dirty)
+        if changed.size == 0:
+            return 0
+        key_names = self.key_columns(self.model)
+        table = self.model.__table__
+        statement = (
+            table.update()
+            .where(and_(*[table.c[name] == bindparam(f"key_{name}") for name in key_names]))
+            .values(
+                weight=bindparam("new_weight"),
+                last_accessed=bindparam("new_last_accessed"),
+                weight_score=bindparam("new_weight_score"),
+            )
+        )
+        scores = weight_scores(
+            self.w[changed], self.last_accessed[changed] - UNIX_EPOCH_JULIAN, self.lambda_decay
+        )
+        params = []
+        for i, score in zip(changed, scores):
+            row = {f"key_{name}": value for name, value in zip(key_names, self.keys[i])}
+            row["new_weight"] = float(self.w[i])
+            row["new_last_accessed"] = from_julian(self.last_accessed[i])
+            row["new_weight_score"] = float(score)
+            params.append(row)
+        with get_session() as session:
+            session.exec(statement, params=params)
+            session.commit()
+        self.dirty[changed] = False
+        return int(changed.size)
+
+
+# ----- Elo tournaments -----
+
+_ELO_SCALE = np.log(10.0) / 400.0  # P(a bat b) = sigmoid(_ELO_SCALE * (wa - wb))
+
+
+@dataclass
+class EloStats:
+    """Outcome of :func:`elo_tournament`."""
+
+    mode: str
+    comparisons: int
+    rounds: int  # séquentiel : lots sans item commun ; simultané : itérations
+    converged: bool
+    max_delta: float  # plus grand changement lors du dernier lot / de la dernière itération
+    log_likelihood: float  # moyenne par comparaison, avec les poids finaux
+
+
+def elo_tournament(
+    weights: np.ndarray,
+    a: np.ndarray,
+    b: np.ndarray,
+    score_a: np.ndarray,
+    mode: Literal["sequential", "simultaneous"] = "sequential",
+    k: float = MemoryItem.elo_k,
+    max_iter: int = 500,
+    tol: float = 1e-3,
+    prior_sd: float = 400.0,
+) -> Tuple[np.ndarray, EloStats]:
+    """Apply many comparisons ``(a[i], b[i], score_a[i])`` to ``weights``.
+
+    ``a`` and ``b`` index ``weights``. ``"sequential"`` gives exactly the
+    result of calling :func:`elo_update` pair after pair: comparisons are
+    cut into consecutive runs where no item appears twice, and each run is
+    applied in one vectorized step. ``"simultaneous"`` ignores the order and
+    fits Bradley–Terry ratings on the Elo scale to all comparisons at once,
+    with a Gaussian prior (``prior_sd``) centred on the current weights.
+    """
+    ratings = np.array(weights, dtype=np.float64)
+    a = np.asarray(a, dtype=np.intp)
+    b = np.asarray(b, dtype=np.intp)
+    score_a = np.asarray(score_a, dtype=np.float64)
+    if mode == "sequential":
+        ratings, rounds, max_delta = _elo_sequential(ratings, a, b, score_a, k)
+        converged = True
+    elif mode == "simultaneous":
+        ratings, rounds, max_delta, converged = _bradley_terry(ratings, a, b, score_a, max_iter, tol, prior_sd)
+    else:
+        raise ValueError(f"Mode de tournoi inconnu : {mode!r}")
+    p = 1.0 / (1.0 + np.exp(-_ELO_SCALE * (ratings[a] - ratings[b])))
+    p = np.clip(p, 1e-12, 1 - 1e-12)
+    log_likelihood = float(np.mean(score_a * np.log(p) + (1 - score_a) * np.log(1 - p))) if len(a) else 0.0
+    stats = EloStats(mode, len(a), rounds, converged, max_delta, log_likelihood)
+    return ratings, stats
+
+
+def _elo_sequential(ratings, a, b, score_a, k) -> Tuple[np.ndarray, int, float]:
+    rounds, max_delta, start, seen = 0, 0.0, 0, set()
+    for i in range(len(a) + 1):
+        if i < len(a) and a[i] not in seen and b[i] not in seen:
+            seen.update((a[i], b[i]))
+            continue
+        if i > start:
+            ra, rb, s = a[start:i], b[start:i], score_a[start:i]
+            expected_a = 1 / (1 + 10 ** ((ratings[rb] - ratings[ra]) / 400))
+            delta = k * (s - expected_a)
+            ratings[ra] += delta
+            ratings[rb] -= delta
+            rounds += 1
+            max_delta = float(np.max(np.abs(delta)))
+        if i < len(a):
+            start, seen = i, {a[i], b[i]}
+    return ratings, rounds, max_delta
+
+
+def _bradley_terry(ratings, a, b, score_a, max_iter, tol, prior_sd) -> Tuple[np.ndarray, int, float, bool]:
+    """Maximum a posteriori Bradley–Terry ratings by bounded Newton steps.
+
+    The step uses the curvature bound ``p(1-p) <= 1/4`` (per item, times its
+    number of games, halved for the simultaneous update), which makes every
+    iteration increase the posterior, so no step size has to be tuned.
+    """
+    prior = ratings.copy()
+    tau = 1.0 / prior_sd**2
+    n = len(ratings)
+    games = np.bincount(a, minlength=n) + np.bincount(b, minlength=n)
+    curvature = _ELO_SCALE**2 * games / 2.0 + tau
+    max_delta, iterations = 0.0, 0
+    for iterations in range(1, max_iter + 1):
+        p = 1.0 / (1.0 + np.exp(-_ELO_SCALE * (ratings[a] - ratings[b])))
+        residual = score_a - p
+        gradient = _ELO_SCALE * (np.bincount(a, residual, n) - np.bincount(b, residual, n)) - tau * (ratings - prior)
+        step = gradient / curvature
+        ratings += step
+        max_delta = float(np.max(np.abs(step))) if n else 0.0
+        if max_delta < tol:
+            return ratings, iterations, max_delta, True
+    return ratings, iterations, max_delta, False
+
+
+def apply_elo_tournament(
+    comparisons: Iterable[Tuple[Tuple, Tuple, float]],
+    model: MemoryModel = Souvenir,
+    mode: Literal["sequential", "simultaneous"] = "sequential",
+    now: datetime | None = None,
+    **options,
+) -> EloStats:
+    """Run a tournament over ``(key_a, key_b, score_a)`` and persist the new weights.
+
+    Keys are primary keys of ``model`` rows (``(souv_id, user_name)`` for
+    souvenirs). Only the compared rows are read; ratings start from their
+    effective weights at ``now`` and are written back in a single transaction.
+    """
+    comparisons = list(comparisons)
+    now = now or datetime.utcnow()
+    table = WeightTable.load(model, keys=chain.from_iterable(c[:2] for c in comparisons))
+    a = table.index_of([c[0] for c in comparisons])
+    b = table.index_of([c[1] for c in comparisons])
+    scores = np.fromiter((c[2] for c in comparisons), dtype=np.float64, count=len(comparisons))
+    weights, stats = elo_tournament(table.weights_at(now), a, b, scores, mode=mode, **options)
+    touched = np.unique(np.concatenate([a, b]))
+    table.set_weights(touched, weights[touched], now)
+    table.save()
+    return stats
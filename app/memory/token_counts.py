@@ -0,0 +1,33 @@
+# app/memory/token_counts.py
+"""Fill the ``tokens_*`` columns of souvenirs and fragments when they are written.
+
+The context builder budgets with these columns, so it never has to run the
+tokenizer on the hot path.
+"""
+
+from sqlalchemy import event, inspect
+
+from app.models.memory import Fragment, Souvenir
+from app.utils.tokens import count_tokens
+
+_COUNTED = (
+    ("content", "tokens_content"),
+    ("full_content", "tokens_full_content"),
+    ("summary", "tokens_summary"),
+)
+
+
+@event.listens_for(Souvenir, "before_insert")
+@event.listens_for(Fragment, "before_insert")
+def _count_on_insert(mapper, connection, target) -> None:
+    for text_field, count_field in _COUNTED:
+        setattr(target, count_field, count_tokens(getattr(target, text_field)))
+
+
+@event.listens_for(Souvenir, "before_update")
+@event.listens_for(Fragment, "before_update")
+def _count_on_update(mapper, connection, target) -> None:
+    state = inspect(target)
+    for text_field, count_field in _COUNTED:
+        if state.attrs[text_field].history.has_changes():
+            setattr(target, count_field, count_tokens(getattr(target, text_field)))
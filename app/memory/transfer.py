@@ -0,0 +1,363 @@
+# app/memory/transfer.py
+"""Streaming export and import of the memory store, as NDJSON.
+
+    python -m app.memory.transfer export -o arch.ndjson.gz
+    python -m app.memory.transfer import arch.ndjson.gz [--on-conflict update]
+
+The export is one JSON object per line: a header (format, version, schema
+fingerprint), then ``{"table": ..., "row": {...}}`` for every row of
+:data:`TABLES`, in foreign-key order (users and emotions, souvenirs,
+fragments and their embeddings, links, associations, contexts), then a
+trailer with the row count of each table. It is read inside one SQLite
+transaction, so it is a consistent snapshot, through a streamed cursor
+(``yield_per``): memory stays constant whatever the size of the base.
+
+The import reads lines as they come and writes them with ``executemany``
+``INSERT ... ON CONFLICT`` in batches, one transaction per batch, keeping
+every key as exported (``(souv_id, user_name)`` included). Conflicting rows
+are skipped by default, so an interrupted import can simply be run again;
+``on_conflict="update"`` overwrites them instead. With ``atomic=True`` (the
+HTTP import) all batches share one transaction, committed only once the
+trailer has been checked: a truncated or invalid export leaves nothing
+behind, at the price of holding the write lock for the whole import.
+Derived state is then resynchronised by :func:`app.memory.crud.bulk_loaded`.
+
+Datetimes travel as stored by SQLite, bytes (embeddings) in base64.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import gzip
+import json
+import sys
+from datetime import datetime
+from typing import IO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import LargeBinary, String, select, type_coerce
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Connection, Engine, Transaction
+from sqlalchemy.types import DateTime
+
+from app.bootstrap import bootstrap, schema_version
+from app.memory import db
+from app.memory.access_tracker import access_tracker
+from app.memory.crud import bulk_loaded
+from app.models.memory import (
+    Context,
+    EmoLvl2ToLv1,
+    Fragment,
+    FragmentEmbedding,
+    Link,
+    LinkFragment,
+    LinkSouvenir,
+    Souvenir,
+)
+from app.models.user import User
+from app.utils.logger import logger
+
+FORMAT = "arch-memory"
+VERSION = 1
+BATCH_SIZE = 1000
+
+# ordre des clés étrangères : une table n'arrive qu'après celles qu'elle référence
+TABLES = tuple(
+    model.__table__
+    for model in (User, EmoLvl2ToLv1, Souvenir, Fragment, FragmentEmbedding, Link, LinkSouvenir, LinkFragment, Context)
+)
+_BY_NAME = {table.name: table for table in TABLES}
+_COLUMNS = {table.name: frozenset(table.columns.keys()) for table in TABLES}
+
+
+def _decoders(table) -> Tuple[Tuple[str, Callable], ...]:
+    decoders = []
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            decoders.append((column.name, datetime.fromisoformat))
+        elif isinstance(column.type, LargeBinary):
+            decoders.append((column.name, base64.b64decode))
+    return tuple(decoders)
+
+
+# conversions JSON -> colonne, calculées une fois par table
+_DECODERS = {table.name: _decoders(table) for table in TABLES}
+
+ON_CONFLICT = ("skip", "update")
+
+
+def _dumps(entry: Dict) -> str:
+    return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+
+def _export_columns(table):
+    # dates lues telles que stockées : ni analyse ni reformatage à l'export
+    return [
+        type_coerce(column, String).label(column.name) if isinstance(column.type, DateTime) else column
+        for column in table.columns
+    ]
+
+
+def export_chunks(
+    engine: Optional[Engine] = None, batch_size: int = BATCH_SIZE, counts: Optional[Dict[str, int]] = None
+) -> Iterator[str]:
+    """Yield the export as text chunks of up to ``batch_size`` lines each.
+
+    ``counts``, if given, is filled with the number of rows per table.
+    """
+    engine = engine or db.engine
+    counts = {} if counts is None else counts
+    access_tracker.flush()  # poids et derniers accès encore en attente
+    with engine.connect() as connection:
+        connection.exec_driver_sql("BEGIN")  # instantané : toutes les tables au même état
+        try:
+            yield _dumps(
+                {
+                    "format": FORMAT,
+                    "version": VERSION,
+                    "schema": schema_version(),
+                    "exported_at": datetime.utcnow().isoformat(timespec="seconds"),
+                    "tables": [table.name for table in TABLES],
+                }
+            ) + "\n"
+            for table in TABLES:
+                binary = [c.name for c in table.columns if isinstance(c.type, LargeBinary)]
+                result = connection.execution_options(yield_per=batch_size).execute(
+                    select(*_export_columns(table))
+                )
+                total = 0
+                for rows in result.mappings().partitions():
+                    lines = []
+                    for row in rows:
+                        row = dict(row)
+                        for name in binary:
+                            if row[name] is not None:
+                                row[name] = base64.b64encode(row[name]).decode("ascii")
+                        lines.append(_dumps({"table": table.name, "row": row}))
+                    total += len(lines)
+                    yield "\n".join(lines) + "\n"
+                counts[table.name] = total
+            yield _dumps({"end": counts}) + "\n"
+        finally:
+            connection.rollback()
+
+
+def export(out: IO[str], engine: Optional[Engine] = None, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Write the whole store to ``out``; return the number of rows per table."""
+    counts: Dict[str, int] = {}
+    for chunk in export_chunks(engine, batch_size, counts):
+        out.write(chunk)
+    logger.info(f"Mémoire exportée : {counts}")
+    return counts
+
+
+class Importer:
+    """Feed export lines in order, then :meth:`close`.
+
+    Rows are buffered per table up to ``batch_size`` and written in one
+    transaction per batch (one for the whole import if ``atomic``); nothing
+    else is held in memory, so the lines can come from a file or from a
+    request body as they arrive.
+    """
+
+    def __init__(
+        self,
+        engine: Optional[Engine] = None,
+        on_conflict: str = "skip",
+        batch_size: int = BATCH_SIZE,
+        atomic: bool = False,
+    ) -> None:
+        if on_conflict not in ON_CONFLICT:
+            raise ValueError(f"on_conflict doit valoir {' ou '.join(ON_CONFLICT)}, pas {on_conflict!r}")
+        self.engine = engine or db.engine
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.atomic = atomic
+        self.counts: Dict[str, int] = {}  # lignes lues, par table
+        self.skipped: Dict[str, int] = {}  # lignes de tables inconnues de ce schéma
+        self._header: Optional[Dict] = None
+        self._expected: Optional[Dict[str, int]] = None
+        self._pending: List[Dict] = []
+        self._pending_key: Optional[Tuple[str, Tuple[str, ...]]] = None
+        self._connection: Optional[Connection] = None
+        self._transaction: Optional[Transaction] = None  # mode atomique : ouverte jusqu'à close()
+
+    def feed(self, lines: Iterable[str]) -> None:
+        for line in lines:
+            line = line.strip()
+            if line:
+                self._entry(json.loads(line))
+
+    def _entry(self, entry: Dict) -> None:
+        if self._header is None:
+            if entry.get("format") != FORMAT:
+                raise ValueError("Ce n'est pas un export de la mémoire (en-tête absent)")
+            if entry.get("version", 0) > VERSION:
+                raise ValueError(f"Export en version {entry['version']}, version {VERSION} au plus")
+            self._header = entry
+            return
+        if self._expected is not None:
+            raise ValueError("Lignes après la fin de l'export")
+        if "end" in entry:
+            self._flush()
+            self._expected = entry["end"]
+            return
+        name = entry["table"]
+        if name not in _BY_NAME:
+            self.skipped[name] = self.skipped.get(name, 0) + 1
+            return
+        # colonnes inconnues ignorées : l'export peut venir d'un schéma plus récent
+        row, columns = entry["row"], _COLUMNS[name]
+        if not columns.issuperset(row):
+            row = {key: value for key, value in row.items() if key in columns}
+        key = (name, tuple(row))
+        if key != self._pending_key:
+            self._flush()
+            self._pending_key = key
+        self._pending.append(row)
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        name, columns = self._pending_key
+        table = _BY_NAME[name]
+        decoders = [(column, decode) for column, decode in _DECODERS[name] if column in columns]
+        rows = self._pending
+        for row in rows:
+            for column, decode in decoders:
+                value = row[column]
+                if value is not None:
+                    row[column] = decode(value)
+        statement = sqlite_insert(table)
+        primary = [column.name for column in table.primary_key.columns]
+        updated = {column: statement.excluded[column] for column in columns if column not in primary}
+        if self.on_conflict == "update" and updated:
+            statement = statement.on_conflict_do_update(index_elements=primary, set_=updated)
+        else:
+            statement = statement.on_conflict_do_nothing()
+        if self._connection is None:
+            self._connection = self.engine.connect()
+            if self.atomic:
+                self._transaction = self._connection.begin()
+        if self._transaction is not None:
+            self._connection.execute(statement, rows)
+        else:
+            with self._connection.begin():
+                self._connection.execute(statement, rows)
+        self._pending = []
+
+    def abort(self) -> None:
+        """Stop after an error: drop the pending batch, keep (and resync) those written.
+
+        In ``atomic`` mode nothing was written: everything is rolled back.
+        """
+        self._pending = []
+        self._release(commit=False)
+
+    def _release(self, commit: bool) -> None:
+        transaction, self._transaction = self._transaction, None
+        written = bool(self.counts)
+        if transaction is not None:
+            if commit:
+                transaction.commit()
+            else:
+                transaction.rollback()
+                written = False
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+        if written:
+            bulk_loaded(self.counts)
+
+    def close(self) -> Dict[str, int]:
+        """Write what is left and resync derived state; return the rows read per table.
+
+        Raises ``ValueError`` if the export was truncated: the batches
+        already written stay, and importing the full file again completes
+        them — unless ``atomic``, where the whole import is rolled back.
+        """
+        try:
+            self._flush()
+            self._check()
+        except BaseException:
+            self._release(commit=False)
+            raise
+        self._release(commit=True)
+        logger.info(f"Mémoire importée ({self.on_conflict}) : {self.counts}")
+        return self.counts
+
+    def _check(self) -> None:
+        if self.skipped:
+            logger.warning(f"Import : tables inconnues ignorées {self.skipped}")
+        if self._header is None:
+            raise ValueError("Export vide")
+        if self._expected is None:
+            raise ValueError(f"Export tronqué (pas de fin) après {self.counts}")
+        missing = {
+            name: (self.counts.get(name, 0), total)
+            for name, total in self._expected.items()
+            if self.counts.get(name, 0) + self.skipped.get(name, 0) != total
+        }
+        if missing:
+            raise ValueError(f"Export incomplet (lu, attendu) : {missing}")
+
+
+def import_lines(
+    lines: Iterable[str], engine: Optional[Engine] = None, on_conflict: str = "skip", batch_size: int = BATCH_SIZE
+) -> Dict[str, int]:
+    """Import an export from its lines; return the rows read per table."""
+    importer = Importer(engine, on_conflict, batch_size)
+    try:
+        importer.feed(lines)
+    except Exception:
+        importer.abort()
+        raise
+    return importer.close()
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path == "-":
+        return sys.stdout if "w" in mode else sys.stdin
+    opener = gzip.open if path.endswith(".gz") else open
+    return opener(path, mode + "t", encoding="utf-8")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.memory.transfer", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    out = commands.add_parser("export", help="écrire toute la mémoire en NDJSON")
+    out.add_argument("-o", "--output", default="-", help="fichier (.gz : compressé), - pour la sortie standard")
+    out.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    into = commands.add_parser("import", help="charger un export")
+    into.add_argument("input", help="fichier (.gz : compressé), - pour l'entrée standard")
+    into.add_argument("--on-conflict", choices=ON_CONFLICT, default="skip")
+    into.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    bootstrap()
+    if args.command == "export":
+        stream = _open(args.output, "w")
+        try:
+            counts = export(stream, batch_size=args.batch_size)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+    else:
+        stream = _open(args.input, "r")
+        try:
+            counts = import_lines(stream, on_conflict=args.on_conflict, batch_size=args.batch_size)
+        except ValueError as exc:
+            print(f"Erreur : {exc}", file=sys.stderr)
+            return 1
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+    print(json.dumps(counts, ensure_ascii=False), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,452 @@
+# app/memory/vector_index.py
+"""Semantic retrieval over fragments ("la recherche vectorielle se fait sur les fragments").
+
+Embeddings are stored as raw float32 blobs in ``fragment_embedding`` and
+loaded once into a dense NumPy matrix. Search is an exact brute-force
+dot product (vectors are L2-normalised, so it is the cosine similarity);
+past a few tens of thousands of vectors the index can be partitioned with a
+k-means coarse quantizer (IVF) so that only ``nprobe`` clusters are scanned.
+
+The embedding function is pluggable: :func:`hashing_embedder` is a
+deterministic local stand-in (tests, offline use) and
+:func:`openai_embedder` calls the embeddings API.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, delete, func, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import select
+
+from app.config import (
+    FRAGMENT_EMBEDDER,
+    FRAGMENT_EMBEDDING_DIM,
+    FRAGMENT_EMBEDDING_MODEL,
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+)
+from app.memory.access_tracker import AccessTracker, access_tracker
+from app.memory.crud import subscribe
+from app.memory.db import get_session
+from app.models.memory import Fragment, FragmentEmbedding
+from app.utils.logger import logger
+
+EmbeddingFunction = Callable[[Sequence[str]], np.ndarray]
+FragmentKey = Tuple[int, int, str]  # (frag_id, souv_id, user_name)
+
+IVF_THRESHOLD = 50_000  # en dessous, la recherche exacte est assez rapide
+BACKFILL_BATCH = 256  # fragments embeddés par appel au démarrage
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def hashing_embedder(dim: int = 256) -> EmbeddingFunction:
+    """Return a deterministic bag-of-words embedder based on feature hashing."""
+
+    def embed(texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in _WORD.findall(text.lower()):
+                h = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+                vectors[row, h % dim] += 1.0 if h >> 63 else -1.0
+        return vectors
+
+    return embed
+
+
+def openai_embedder(
+    client=None, model: str = "text-embedding-3-small", dimensions: Optional[int] = None
+) -> EmbeddingFunction:
+    """Return an embedder calling the OpenAI embeddings endpoint with ``client``.
+
+    Without ``client``, one is built from the configuration at the first call.
+    """
+    clients = [client]
+
+    def embed(texts: Sequence[str]) -> np.ndarray:
+        if clients[0] is None:
+            from openai import OpenAI
+
+            clients[0] = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
+        options = {"dimensions": dimensions} if dimensions else {}
+        response = clients[0].embeddings.create(model=model, input=list(texts), **options)
+        return np.asarray([item.embedding for item in response.data], dtype=np.float32)
+
+    return embed
+
+
+def _normalise(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class VectorIndex:
+    """In-memory top-k cosine index with incremental upserts and removals.
+
+    Rows live in one over-allocated matrix; removing a key moves the last row
+    into its slot, so the matrix stays dense and additions are amortised O(1).
+    Once trained, every cluster keeps the list of its rows (and every row its
+    slot in that list), so a search reads only the ``nprobe`` lists it scans.
+    """
+
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._size = 0
+        self._keys: List[Hashable] = []
+        self._rows: Dict[Hashable, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._clusters = np.empty(0, dtype=np.int32)
+        self._members: List[List[int]] = []  # cluster -> ses lignes
+        self._slots = np.empty(0, dtype=np.int64)  # ligne -> position dans la liste de son cluster
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    @property
+    def is_trained(self) -> bool:
+        return self._centroids is not None
+
+    def add(self, keys: Sequence[Hashable], vectors: np.ndarray) -> None:
+        """Insert or replace the vectors of ``keys``."""
+        vectors = _normalise(np.asarray(vectors).reshape(len(keys), self.dim))
+        with self._lock:
+            fresh = [i for i, key in enumerate(keys) if key not in self._rows]
+            for i, key in enumerate(keys):
+                row = self._rows.get(key)
+                if row is not None:
+                    self._matrix[row] = vectors[i]
+                    if self._centroids is not None:
+                        cluster = int(self._nearest_cluster(vectors[i : i + 1])[0])
+                        if cluster != self._clusters[row]:
+                            self._leave(row)
+                            self._join(row, cluster)
+            if not fresh:
+                return
+            self._reserve(self._size + len(fresh))
+            start, stop = self._size, self._size + len(fresh)
+            self._matrix[start:stop] = vectors[fresh]
+            if self._centroids is not None:
+                for row, cluster in enumerate(self._nearest_cluster(vectors[fresh]).tolist(), start):
+                    self._join(row, cluster)
+            for offset, i in enumerate(fresh):
+                self._rows[keys[i]] = start + offset
+                self._keys.append(keys[i])
+            self._size = stop
+
+    def remove(self, keys: Iterable[Hashable]) -> int:
+        """Drop ``keys`` from the index and return how many were present."""
+        removed = 0
+        with self._lock:
+            for key in keys:
+                row = self._rows.pop(key, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                if self._centroids is not None:
+                    self._leave(row)
+                if row != last:
+                    moved = self._keys[last]
+                    self._matrix[row] = self._matrix[last]
+                    if self._centroids is not None:
+                        self._renumber(last, row)
+                    self._keys[row] = moved
+                    self._rows[moved] = row
+                self._keys.pop()
+                self._size = last
+                removed += 1
+        return removed
+
+    def search(
+        self, query: np.ndarray, k: int = 10, nprobe: int = 8
+    ) -> List[Tuple[Hashable, float]]:
+        """Return the ``k`` keys most similar to ``query`` with their cosine score."""
+        query = _normalise(np.asarray(query).reshape(self.dim))
+        with self._lock:
+            if self._size == 0 or k <= 0:
+                return []
+            if self._centroids is not None:
+                probe = np.argsort(self._centroids @ query)[-nprobe:]
+                rows = np.concatenate([np.asarray(self._members[cluster], dtype=np.intp) for cluster in probe.tolist()])
+                scores = self._matrix[rows] @ query
+            else:
+                rows = None
+                scores = self._matrix[: self._size] @ query
+            k = min(k, len(scores))
+            if k == 0:
+                return []
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            if rows is not None:
+                return [(self._keys[rows[i]], float(scores[i])) for i in best]
+            return [(self._keys[i], float(scores[i])) for i in best]
+
+    def train(self, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """Partition the vectors with spherical k-means so searches scan ``nprobe`` clusters."""
+        with self._lock:
+            if self._size == 0:
+                return
+            nlist = min(nlist or max(1, int(np.sqrt(self._size))), self._size)
+            rng = np.random.default_rng(seed)
+            data = self._matrix[: self._size]
+            sample = data[rng.choice(self._size, size=min(self._size, 64 * nlist), replace=False)]
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assigned = np.argmax(sample @ centroids.T, axis=1)
+                counts = np.bincount(assigned, minlength=nlist)
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                empty = counts == 0
+                sums = np.zeros_like(centroids)
+                sums[~empty] = np.add.reduceat(sample[np.argsort(assigned, kind="stable")], starts[~empty], axis=0)
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = _normalise(sums)
+            self._centroids = centroids
+            self._clusters = np.empty(len(self._matrix), dtype=np.int32)
+            for start in range(0, self._size, 65_536):
+                stop = min(start + 65_536, self._size)
+                self._clusters[start:stop] = self._nearest_cluster(data[start:stop])
+            # listes par cluster : lignes triées par cluster, découpées aux frontières
+            clusters = self._clusters[: self._size]
+            order = np.argsort(clusters, kind="stable")
+            bounds = np.cumsum(np.bincount(clusters, minlength=nlist))[:-1]
+            self._members = [part.tolist() for part in np.split(order, bounds)]
+            self._slots = np.empty(len(self._matrix), dtype=np.int64)
+            starts = np.concatenate(([0], bounds))
+            self._slots[order] = np.arange(self._size) - starts[clusters[order]]
+
+    def _join(self, row: int, cluster: int) -> None:
+        members = self._members[cluster]
+        self._clusters[row] = cluster
+        self._slots[row] = len(members)
+        members.append(row)
+
+    def _leave(self, row: int) -> None:
+        members = self._members[self._clusters[row]]
+        slot = self._slots[row]
+        last = members.pop()
+        if last != row:
+            members[slot] = last
+            self._slots[last] = slot
+
+    def _renumber(self, old: int, new: int) -> None:
+        """Row ``old`` now lives at ``new`` (after a removal)."""
+        cluster, slot = self._clusters[old], self._slots[old]
+        self._members[cluster][slot] = new
+        self._clusters[new], self._slots[new] = cluster, slot
+
+    def _nearest_cluster(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _reserve(self, capacity: int) -> None:
+        if capacity <= len(self._matrix):
+            return
+        capacity = max(capacity, 2 * len(self._matrix), 1024)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[: self._size] = self._matrix[: self._size]
+        clusters = np.zeros(capacity, dtype=np.int32)
+        clusters[: self._size] = self._clusters[: self._size]
+        slots = np.zeros(capacity, dtype=np.int64)
+        slots[: min(self._size, len(self._slots))] = self._slots[: self._size]
+        self._matrix, self._clusters, self._slots = matrix, clusters, slots
+
+
+class FragmentVectorStore:
+    """Embeddings of the current fragment versions, persisted and searchable.
+
+    Only fragments whose ``is_last_version`` is not ``False`` are indexed;
+    re-versioned fragments are dropped from the index when passed to
+    :meth:`index_fragments`, which :meth:`follow` does for every souvenir
+    edited through :func:`app.memory.crud.update_souvenir`.
+    """
+
+    def __init__(
+        self,
+        embed: EmbeddingFunction,
+        dim: Optional[int] = None,
+        accesses: Optional[AccessTracker] = access_tracker,
+    ) -> None:
+        self.embed = embed
+        self.dim = dim or int(np.asarray(embed(["dimension"])).shape[-1])
+        self.index = VectorIndex(self.dim)
+        self.accesses = accesses
+        self._started = False
+        self._following = False
+        self._start_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Whether :meth:`start` has loaded the store (searches are meaningful)."""
+        return self._started
+
+    def start(self, ivf_threshold: int = IVF_THRESHOLD) -> None:
+        """Load the stored embeddings, embed the fragments that have none, then :meth:`follow`.
+
+        Called once by the application lifespan; later calls do nothing.
+        """
+        with self._start_lock:
+            if self._started:
+                return
+            self.follow()
+            loaded = self.load(ivf_threshold=ivf_threshold)
+            embedded = self.backfill()
+            self._started = True
+        logger.info(f"Index vectoriel des fragments : {loaded} chargés, {embedded} calculés")
+
+    def backfill(self, batch_size: int = BACKFILL_BATCH) -> int:
+        """Embed the current fragments that have no stored embedding; return how many."""
+        missing = (
+            select(Fragment)
+            .outerjoin(
+                FragmentEmbedding,
+                and_(
+                    FragmentEmbedding.frag_id == Fragment.frag_id,
+                    FragmentEmbedding.souv_id == Fragment.souv_id,
+                    FragmentEmbedding.user_name == Fragment.user_name,
+                ),
+            )
+            .where(FragmentEmbedding.frag_id.is_(None), func.coalesce(Fragment.is_last_version, True))
+            .limit(batch_size)
+        )
+        total = 0
+        while True:
+            with get_session() as session:
+                fragments = list(session.exec(missing))
+            if not fragments:
+                return total
+            self.index_fragments(fragments)
+            total += len(fragments)
+
+    def load(self, ivf_threshold: int = IVF_THRESHOLD) -> int:
+        """Load every stored embedding in memory and return how many were loaded."""
+        keys: List[FragmentKey] = []
+        blobs: List[bytes] = []
+        skipped = 0
+        expected = self.dim * 4
+        with get_session() as session:
+            for row in session.exec(select(FragmentEmbedding)):
+                if len(row.vector) != expected:
+                    skipped += 1
+                    continue
+                keys.append((row.frag_id, row.souv_id, row.user_name))
+                blobs.append(row.vector)
+        if skipped:
+            logger.warning(f"{skipped} embeddings de fragments ignorés : dimension différente de {self.dim}")
+        if keys:
+            vectors = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(keys), self.dim)
+            self.index.add(keys, vectors)
+        if len(self.index) >= ivf_threshold and not self.index.is_trained:
+            self.index.train()
+        return len(keys)
+
+    def follow(self) -> "FragmentVectorStore":
+        """Keep the store current from the crud events (new or re-fragmented souvenirs, imports)."""
+        if not self._following:
+            self._following = True
+            subscribe("fragments_updated", self._on_fragments_updated)
+            subscribe("memory_imported", self._on_memory_imported)
+        return self
+
+    def _on_fragments_updated(self, fragments: Sequence[Fragment], **_) -> None:
+        self.index_fragments(fragments)
+
+    def _on_memory_imported(self, tables=frozenset(), **_) -> None:
+        if "fragment_embedding" in tables:
+            self.load()
+
+    def index_fragments(self, fragments: Iterable[Fragment]) -> None:
+        """Embed and upsert current fragments, drop superseded ones."""
+        current: List[Fragment] = []
+        superseded: List[FragmentKey] = []
+        for fragment in fragments:
+            if fragment.is_last_version is False:
+                superseded.append(_key(fragment))
+            else:
+                current.append(fragment)
+        if superseded:
+            self.remove(superseded)
+        if not current:
+            return
+        vectors = _normalise(self.embed([f.full_content for f in current]))
+        rows = [
+            {"frag_id": f.frag_id, "souv_id": f.souv_id, "user_name": f.user_name, "vector": v.tobytes()}
+            for f, v in zip(current, vectors)
+        ]
+        statement = sqlite_insert(FragmentEmbedding)
+        statement = statement.on_conflict_do_update(
+            index_elements=["frag_id", "souv_id", "user_name"],
+            set_={"vector": statement.excluded.vector},
+        )
+        with get_session() as session:
+            session.exec(statement, params=rows)
+            session.commit()
+        self.index.add([_key(f) for f in current], vectors)
+
+    def remove(self, keys: Sequence[FragmentKey]) -> None:
+        """Forget the embeddings of ``keys`` (memory and database)."""
+        if not keys:
+            return
+        with get_session() as session:
+            session.exec(
+                delete(FragmentEmbedding).where(
+                    tuple_(FragmentEmbedding.frag_id, FragmentEmbedding.souv_id, FragmentEmbedding.user_name).in_(keys)
+                )
+            )
+            session.commit()
+        self.index.remove(keys)
+
+    def search(self, text: str, k: int = 10, nprobe: int = 8) -> List[Tuple[FragmentKey, float]]:
+        """Return the keys of the ``k`` fragments closest to ``text`` with their score."""
+        return self.index.search(self.embed([text])[0], k=k, nprobe=nprobe)
+
+    def search_fragments(
+        self, text: str, k: int = 10, user_name: Optional[str] = None, record: bool = True
+    ) -> List[Fragment]:
+        """Like :meth:`search` but return the :class:`Fragment` rows, best first.
+
+        With ``record``, the returned fragments count as accessed (cf.
+        :mod:`app.memory.access_tracker`); callers that use only some of them
+        record those themselves.
+        """
+        keys = [key for key, _ in self.search(text, k)]
+        if user_name is not None:
+            keys = [key for key in keys if key[2] == user_name]
+        if not keys:
+            return []
+        statement = select(Fragment).where(tuple_(Fragment.frag_id, Fragment.souv_id, Fragment.user_name).in_(keys))
+        with get_session() as session:
+            by_key = {_key(f): f for f in session.exec(statement)}
+        fragments = [by_key[key] for key in keys if key in by_key]
+        if record and fragments and self.accesses is not None:
+            self.accesses.record_used(Fragment, fragments, fragments)
+        return fragments
+
+
+def _key(fragment: Fragment) -> FragmentKey:
+    return (fragment.frag_id, fragment.souv_id, fragment.user_name)
+
+
+def _default_embedder() -> Optional[EmbeddingFunction]:
+    if FRAGMENT_EMBEDDER == "hashing":
+        return hashing_embedder(FRAGMENT_EMBEDDING_DIM)
+    if FRAGMENT_EMBEDDER == "openai":
+        return openai_embedder(model=FRAGMENT_EMBEDDING_MODEL, dimensions=FRAGMENT_EMBEDDING_DIM)
+    return None
+
+
+# Partagé par l'application : chargé et abonné aux événements crud par le lifespan (cf. app.main).
+# None si FRAGMENT_EMBEDDER=none ; rien n'est lu ni calculé à l'import.
+_embedder = _default_embedder()
+fragment_vectors: Optional[FragmentVectorStore] = (
+    FragmentVectorStore(_embedder, dim=FRAGMENT_EMBEDDING_DIM) if _embedder is not None else None
+)
@@ -1,16 +1,212 @@
 # app/context/context_manager.py
 
-from typing import List
-# from app.context.bio_manager import Bio
-from app.memory.crud import seek_souvenirs
-from .memory import Souvenir
+from typing import Dict, List, Optional, Tuple, Union
+from app.config import CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET
+from app.context.bio_manager import Bio
+from app.context.working_memory import WorkingMemory, working_memory
+from app.dialogue.background import BackgroundThoughtScheduler, background_thoughts
+from app.memory.access_tracker import AccessTracker, access_tracker
+from app.memory.crud import get_souvenirs_by_ids, search_fragments, search_souvenirs, seek_souvenirs_by_weight
+from app.memory.graph import link_graph
+from app.memory.vector_index import FragmentVectorStore, fragment_vectors
+from app.utils.tokens import MESSAGE_OVERHEAD, count_tokens, message_tokens
+from .memory import Fragment, Souvenir
 from openai.types.chat import ChatCompletionMessageParam
 
+SOUVENIR_PREFIX = "[Souvenir] "
+FRAGMENT_PREFIX = "[Fragment] "
+RRF_K = 60  # fusion par rang réciproque : 1 / (RRF_K + rang)
+BACKGROUND_PREFIX = "[Pensée de fond] "
+WORKING_MEMORY_PREFIX = "[Mémoire de travail] "
+
+# Versions d'un souvenir, de la plus riche à la plus courte : (champ texte, champ tokens)
+REPRESENTATIONS = (
+    ("full_content", "tokens_full_content"),
+    ("content", "tokens_content"),
+    ("summary", "tokens_summary"),
+)
+
+
 class ContextManager:
     """
     Gère la construction du contexte complet envoyé à l'API OpenAI.
     Inclut la bio (fixe), les souvenirs pertinents (dynamiques),
-    et le prompt utilisateur.
+    et le prompt utilisateur, le tout dans un budget de tokens.
     """
 
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        candidates: int = CONTEXT_CANDIDATES,
+        user_name: Optional[str] = None,
+        background: Optional[BackgroundThoughtScheduler] = background_thoughts,
+        working: Optional[WorkingMemory] = working_memory,
+        accesses: Optional[AccessTracker] = access_tracker,
+        vectors: Optional[FragmentVectorStore] = fragment_vectors,
+    ):
+        self.bio_arch = Bio("arch", user_name)
+        self.bio_chatgpt = Bio("chatgpt", user_name)
+        self.token_budget = token_budget
+        self.candidates = candidates
+        self.user_name = user_name
+        self.background = background
+        self.working = working
+        self.accesses = accesses
+        self.vectors = vectors
+
+    def build_context(
+        self, prompt: str, cible: str = "arch", task: Optional[str] = None
+    ) -> List[ChatCompletionMessageParam]:
+        """
+        Construit le contexte à envoyer à l'API, selon la cible.
+        Le prompt est toujours inclus, puis la bio, la mémoire de travail de
+        ``task`` (par défaut la tâche en cours, lue en RAM), les pensées de fond que le prompt (ou le
+        tour précédent) fait remonter, puis les souvenirs classés
+        tant qu'ils tiennent dans le budget (version complète, sinon courte,
+        sinon résumé), puis les fragments correspondant au prompt des
+        souvenirs qui n'ont pas pu entrer en entier. Les souvenirs et
+        fragments retenus sont renforcés (écriture différée, cf.
+        app.memory.access_tracker).
+        """
+        remaining = self.token_budget - message_tokens(prompt)
+
+        # 1. Bio de la cible, dans l'ordre, tant qu'elle tient
+        bio = self._bio(cible)
+        messages: List[dict] = []
+        for message in bio.to_context_messages():
+            cost = message_tokens(message["content"])
+            if cost > remaining:
+                break
+            messages.append(message)
+            remaining -= cost
+
+        # 2. Mémoire de travail de la tâche en cours, sans requête SQLite
+        if self.working is not None:
+            for entry in self.working.recall(task):
+                content = WORKING_MEMORY_PREFIX + entry.content
+                cost = message_tokens(content)
+                if cost > remaining:
+                    break
+                messages.append({"role": "system", "content": content})
+                remaining -= cost
+
+        # 3. Pensées de fond liées au prompt, par priorité
+        if self.background is not None:
+            for thought in self.background.surface(prompt):
+                content = BACKGROUND_PREFIX + thought.content
+                cost = message_tokens(content)
+                if cost <= remaining:
+                    messages.append({"role": "system", "content": content})
+                    remaining -= cost
+
+        # 4. Souvenirs classés, dans la meilleure version qui tient encore
+        prefix_tokens = count_tokens(SOUVENIR_PREFIX) + MESSAGE_OVERHEAD
+        candidates = self.rank_souvenirs(prompt)
+        used: List[Souvenir] = []
+        complete = set()  # souvenirs présents en version complète : leurs fragments y sont déjà
+        for souvenir in candidates:
+            if (souvenir.souv_id, souvenir.user_name) in bio:
+                continue
+            choice = self._fit(souvenir, remaining - prefix_tokens)
+            if choice is None:
+                continue
+            text, cost = choice
+            messages.append({"role": "system", "content": SOUVENIR_PREFIX + text})
+            remaining -= cost + prefix_tokens
+            used.append(souvenir)
+            if text == souvenir.full_content:
+                complete.add((souvenir.souv_id, souvenir.user_name))
+        if used and self.accesses is not None:
+            self.accesses.record_used(Souvenir, candidates, used)
+
+        # 5. Fragments correspondant au prompt, pour les souvenirs absents ou abrégés
+        prefix_tokens = count_tokens(FRAGMENT_PREFIX) + MESSAGE_OVERHEAD
+        fragments = self.rank_fragments(prompt)
+        used_fragments: List[Fragment] = []
+        for fragment in fragments:
+            key = (fragment.souv_id, fragment.user_name)
+            if key in bio or key in complete:
+                continue
+            choice = self._fit(fragment, remaining - prefix_tokens)
+            if choice is None:
+                continue
+            text, cost = choice
+            messages.append({"role": "system", "content": FRAGMENT_PREFIX + text})
+            remaining -= cost + prefix_tokens
+            used_fragments.append(fragment)
+        if used_fragments and self.accesses is not None:
+            self.accesses.record_used(Fragment, fragments, used_fragments)
+
+        # 6. Ajout du prompt utilisateur
+        messages.append({"role": "user", "content": prompt})
+
+        return messages
+
+    def rank_souvenirs(self, prompt: str) -> List[Souvenir]:
+        """
+        Souvenirs candidats, les plus pertinents d'abord : correspondances
+        plein texte avec le prompt, souvenirs qui leur sont associés par des
+        liens (PageRank personnalisé sur le graphe des liens), puis souvenirs
+        de plus fort poids actuel.
+        """
+        ranked: Dict[Tuple[int, str], Souvenir] = {}
+        hits = search_souvenirs(prompt, user_name=self.user_name, limit=self.candidates)
+        for souvenir in hits:
+            ranked.setdefault((souvenir.souv_id, souvenir.user_name), souvenir)
+        if hits:
+            # graines pondérées par le rang plein texte
+            seeds: Dict[int, float] = {}
+            for rank, souvenir in enumerate(hits):
+                seeds.setdefault(souvenir.souv_id, 1.0 / (rank + 1))
+            related = [souv_id for souv_id, _ in link_graph.related(seeds, k=self.candidates)]
+            by_id: Dict[int, List[Souvenir]] = {}
+            for souvenir in get_souvenirs_by_ids(related, user_name=self.user_name):
+                by_id.setdefault(souvenir.souv_id, []).append(souvenir)
+            for souv_id in related:
+                for souvenir in by_id.get(souv_id, ()):
+                    ranked.setdefault((souvenir.souv_id, souvenir.user_name), souvenir)
+        for souvenir in seek_souvenirs_by_weight(self.candidates, user_name=self.user_name):
+            ranked.setdefault((souvenir.souv_id, souvenir.user_name), souvenir)
+        return list(ranked.values())
+
+    def rank_fragments(self, prompt: str) -> List[Fragment]:
+        """
+        Fragments (dernières versions) correspondant au prompt, les meilleurs
+        d'abord : correspondances plein texte et, une fois l'index vectoriel
+        chargé, fragments les plus proches, fusionnés par rang réciproque.
+        """
+        hits = search_fragments(prompt, user_name=self.user_name, limit=self.candidates)
+        if self.vectors is None or not self.vectors.ready:
+            return hits
+        near = self.vectors.search_fragments(prompt, k=self.candidates, user_name=self.user_name, record=False)
+        scores: Dict[Tuple[int, int, str], float] = {}
+        fragments: Dict[Tuple[int, int, str], Fragment] = {}
+        for ranking in (hits, near):
+            for rank, fragment in enumerate(ranking):
+                key = (fragment.frag_id, fragment.souv_id, fragment.user_name)
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+                fragments.setdefault(key, fragment)
+        ranked = sorted(scores, key=scores.get, reverse=True)[: self.candidates]
+        return [fragments[key] for key in ranked]
+
+    def append_bio(self, fragment_id: int, cible: str = "arch", user_name: Optional[str] = None):
+        self._bio(cible).append(fragment_id, user_name)
+
+    def remove_bio(self, fragment_id: int, cible: str = "arch", user_name: Optional[str] = None):
+        self._bio(cible).remove(fragment_id, user_name)
+
+    def _bio(self, cible: str) -> Bio:
+        return self.bio_chatgpt if cible == "chatgpt" else self.bio_arch
 
+    @staticmethod
+    def _fit(item: Union[Souvenir, Fragment], available: int) -> Optional[Tuple[str, int]]:
+        """Richest version of ``item`` costing at most ``available`` tokens."""
+        for text_field, tokens_field in REPRESENTATIONS:
+            text = getattr(item, text_field)
+            if not text:
+                continue
+            # colonnes à 0 : lignes écrites avant le comptage à l'écriture
+            cost = getattr(item, tokens_field) or count_tokens(text)
+            if cost <= available:
+                return text, cost
+        return None
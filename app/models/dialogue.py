@@ -0,0 +1,19 @@
+from datetime import datetime
+from sqlalchemy import Index
+from sqlmodel import Field, SQLModel
+
+
+class CompletionCache(SQLModel, table=True):
+    """Réponse du modèle pour un contexte donné (cf. app.dialogue.response_cache).
+
+    ``key`` est le sha256 de (modèle, messages, température, max_tokens).
+    """
+
+    __tablename__ = "completion_cache"
+    __table_args__ = (Index("ix_completion_cache_last_used", "last_used"),)
+
+    key: str = Field(primary_key=True)
+    model: str
+    response: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used: datetime = Field(default_factory=datetime.utcnow)
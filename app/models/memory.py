@@ -1,6 +1,7 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
+from sqlalchemy import Index
 from sqlmodel import Field, SQLModel
 from app.models.user import User
 
@@ -17,6 +18,16 @@ class Souvenir(SQLModel, table=True):
     Les commentaires y sont affichés en résumé court s'ils sont trop longs
     """
 
+    __table_args__ = (
+        # parcours par récence (pagination par curseur), global ou par user
+        Index("ix_souvenir_time", "time", "souv_id", "user_name"),
+        Index("ix_souvenir_user_time", "user_name", "time", "souv_id"),
+        Index("ix_souvenir_type_time", "type", "time"),
+        Index("ix_souvenir_last_accessed", "last_accessed"),
+        Index("ix_souvenir_weight_score", "weight_score"),
+        Index("ix_souvenir_user_weight_score", "user_name", "weight_score"),
+    )
+
     souv_id: Optional[int] = Field(default=None, primary_key=True)
     type: str
     content: str
@@ -33,6 +44,41 @@ class Souvenir(SQLModel, table=True):
     tokens_full_content: int = 0
     tokens_summary: int = 0
     last_accessed: datetime = Field(default_factory=datetime.utcnow)
+    weight_score: float = 0.0 # ln(weight) + λ·last_accessed, tri par poids décru (app.memory.decay)
+
+
+class SouvenirPage(SQLModel):
+    """Page de souvenirs renvoyée par la pagination par curseur."""
+
+    items: List[Souvenir]
+    next_cursor: Optional[str] = None # None quand il n'y a plus rien après
+
+
+class SouvenirSequence(SQLModel, table=True):
+    """Prochain identifiant de souvenir libre pour chaque utilisateur.
+
+    Les identifiants sont réservés par blocs (voir
+    :class:`app.memory.crud.SouvenirIdAllocator`) : un bloc réservé puis
+    inutilisé laisse un trou dans la numérotation, jamais un doublon.
+    """
+
+    __tablename__ = "souvenir_sequence"
+
+    user_name: str = Field(primary_key=True) # "" pour la séquence globale
+    next_id: int
+
+
+class FragmentSequence(SQLModel, table=True):
+    """Prochain ``frag_id`` libre, unique dans toute la table (balises !id:123!).
+
+    Une seule ligne, réservée par blocs comme :class:`SouvenirSequence`
+    (voir :class:`app.memory.fragmenter.FragmentIdAllocator`).
+    """
+
+    __tablename__ = "fragment_sequence"
+
+    id: int = Field(default=0, primary_key=True) # toujours 0
+    next_id: int
 
 
 class Link(SQLModel, table=True):
@@ -49,12 +95,16 @@ class Link(SQLModel, table=True):
 class LinkSouvenir(SQLModel, table=True):
     """Table d'association entre :class:`Souvenir` et :class:`Link`."""
 
+    __table_args__ = (Index("ix_linksouvenir_link", "link_id"),)
+
     souv_id: int = Field(foreign_key="souvenir.souv_id", primary_key=True)
     link_id: int = Field(foreign_key="link.link_id", primary_key=True)
 
 class LinkFragment(SQLModel, table=True):
     """Table d'association entre :class:`Fragment` et :class:`Link`."""
 
+    __table_args__ = (Index("ix_linkfragment_link", "link_id"),)
+
     frag_id: int = Field(foreign_key="fragment.frag_id", primary_key=True)
     link_id: int = Field(foreign_key="link.link_id", primary_key=True)
 
@@ -106,6 +156,13 @@ class Fragment(SQLModel, table=True):
     avec id dans l'ordre + par date. Plus ils sont bas dans la liste des versions, plus leur pondération est divisée
     par leur numéro d'éloignement de la dernière version. exemple : 0.6/3 = 0.2 weight.
     """
+
+    __table_args__ = (
+        Index("ix_fragment_souvenir", "souv_id", "user_name"),
+        Index("ix_fragment_last_accessed", "last_accessed"),
+        Index("ix_fragment_weight_score", "weight_score"),
+    )
+
     frag_id: Optional[int] = Field(default=None, primary_key=True)
     souv_id: int = Field(foreign_key="souvenir.souv_id", primary_key=True)
     type: str # same than Souvenir """
@@ -117,13 +174,29 @@ class Fragment(SQLModel, table=True):
     weight: int # at first same than Souvenir then modified by usage and divided by this version's position w/n """
     importance: int # same than the linked souvenir then eventually modified later by Noe """
     is_last_version: Optional[bool] = True
-    versions : Optional[str] = None 
+    versions : Optional[str] = None # JSON des frag_id de la chaîne de versions, de la plus ancienne à celle-ci
+    content_hash: Optional[str] = None # empreinte du texte, cf. app.memory.fragmenter
     emo_lvl2: Optional[str] = None
     emo_lvl1 : Optional[str] = None
     tokens_content: int = 0
     tokens_full_content: int = 0
     tokens_summary: int = 0
     last_accessed: datetime = Field(default_factory=datetime.utcnow)
+    weight_score: float = 0.0 # ln(weight) + λ·last_accessed, tri par poids décru (app.memory.decay)
+
+
+class FragmentEmbedding(SQLModel, table=True):
+    """Embedding d'un fragment (dernière version seulement), en float32 brut.
+
+    Chargé en mémoire par :class:`app.memory.vector_index.FragmentVectorStore`.
+    """
+
+    __tablename__ = "fragment_embedding"
+
+    frag_id: int = Field(primary_key=True)
+    souv_id: int = Field(primary_key=True)
+    user_name: str = Field(primary_key=True)
+    vector: bytes # numpy float32, normalisé L2
 
 
 class Context(SQLModel, table=True):
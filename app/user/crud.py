@@ -4,11 +4,11 @@ from __future__ import annotations
 
 from typing import Dict, Iterable, List, Optional, Tuple
 
-from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlmodel import select
 
 from app.models.user import User
-from app.memory.db import get_session, init_db
+from app.memory.db import get_session
 
 DEFAULT_USERS: Tuple[Dict[str, object], ...] = (
     {"user_name": "Noesis", "permissions": "user", "type": "AI"},
@@ -66,27 +66,14 @@ def delete_user(user_name: str) -> bool:
 
 
 def ensure_default_users(defaults: Iterable[Dict[str, object]] = DEFAULT_USERS) -> None:
-    """Insert default users when they are missing."""
+    """Insert default users when they are missing (called by app.bootstrap).
+
+    ``INSERT ... ON CONFLICT DO NOTHING``: processes starting together do not
+    collide on the primary key.
+    """
+    rows = [User(**user_data).model_dump() for user_data in defaults]
+    if not rows:
+        return
     with get_session() as session:
-        _ensure_user_schema(session)
-        created = False
-        for user_data in defaults:
-            if session.get(User, user_data["user_name"]):
-                continue
-            session.add(User(**user_data))
-            created = True
-        if created:
-            session.commit()
-
-
-def _ensure_user_schema(session) -> None:
-    """Guarantee that optional columns exist before interacting with data."""
-    columns = {row[1] for row in session.exec(text("PRAGMA table_info('user')"))}
-    if columns and "is_active" not in columns:
-        session.exec(text('ALTER TABLE "user" ADD COLUMN is_active BOOLEAN DEFAULT 0'))
+        session.exec(sqlite_insert(User).values(rows).on_conflict_do_nothing(index_elements=["user_name"]))
         session.commit()
-
-
-# Ensure table exists and defaults are present when the module is imported.
-init_db()
-ensure_default_users()
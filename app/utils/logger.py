@@ -1,21 +1,221 @@
+"""Logger "arch" : écriture non bloquante, fichiers tournants, JSON structuré.
+
+Le logger ne fait aucune E/S sur le thread appelant : un ``QueueHandler``
+pose l'enregistrement dans une file bornée, un ``QueueListener`` (thread)
+l'écrit dans :
+
+* ``logs/errors.log`` : erreurs seulement, texte lisible, rotation par taille ;
+* ``logs/arch.jsonl`` : tout à partir de LOG_LEVEL, un objet JSON par ligne
+  (``request_id``, ``timings`` de la requête en cours, champs ``extra``),
+  rotation par jour.
+
+L'import ne touche pas au disque : la file existe dès l'import, les fichiers
+et le thread d'écriture sont créés par :func:`start_logging`, appelé par
+``bootstrap()`` ; ce qui est journalisé avant attend dans la file.
+
+Avant la mise en file, les enregistrements sous WARNING sont échantillonnés
+(LOG_SAMPLE_RATE, ou ``extra={"sample_rate": ...}`` pour un événement
+précis) et reçoivent l'id et les temps de la requête en cours
+(cf. app.utils.metrics). File pleine : l'enregistrement est abandonné et
+compté, jamais attendu.
+"""
+
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+
+from app.config import (
+    LOG_BACKUP_COUNT,
+    LOG_DIR,
+    LOG_LEVEL,
+    LOG_MAX_BYTES,
+    LOG_QUEUE_SIZE,
+    LOG_ROTATE_WHEN,
+    LOG_SAMPLE_RATE,
+)
+from app.utils.metrics import REGISTRY, current_request
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "arch_log_records_dropped_total", "Enregistrements de log perdus", ("reason",)
+)
+
+STOP_TIMEOUT = 5.0  # secondes d'attente à l'arrêt : place dans la file, puis fin du thread
+
+# Attributs de tout LogRecord : le reste vient de extra={...}
+_STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "timings", "sample_rate"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objet JSON par enregistrement."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "where": f"{record.module}:{record.funcName}:{record.lineno}",
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            entry["request_id"] = request_id
+        timings = getattr(record, "timings", None)
+        if timings:
+            entry["timings_ms"] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+        for key, value in vars(record).items():
+            if key not in _STANDARD and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Garde une fraction des enregistrements sous WARNING ; les autres passent tous."""
+
+    def __init__(self, rate: float = 1.0) -> None:
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample_rate", self.rate)
+        if rate >= 1 or random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class RequestContextFilter(logging.Filter):
+    """Ajoute l'id et les temps de la requête HTTP en cours (lus sur le thread appelant)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        stats = current_request()
+        if stats is not None:
+            if getattr(record, "request_id", None) is None:
+                record.request_id = stats.request_id
+            if getattr(record, "timings", None) is None and stats.timings:
+                record.timings = dict(stats.timings)
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """``QueueHandler`` qui abandonne au lieu d'attendre quand la file est pleine."""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # message et trace figés ici (les args peuvent changer ensuite), mais
+        # la trace reste à part pour le formateur JSON. Modifié sur place comme
+        # le QueueHandler de la bibliothèque : pas de copie sur le thread appelant,
+        # et les autres handlers relisent la trace dans exc_text
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg, record.args, record.exc_info = record.message, None, None
+        return record
+
+
+def _file_handlers():
+    os.makedirs(LOG_DIR, exist_ok=True)
+
+    # Erreurs, lisibles : date | niveau | message
+    errors = logging.handlers.RotatingFileHandler(
+        os.path.join(LOG_DIR, "errors.log"), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    errors.setLevel(logging.ERROR)  # On n'enregistre que les erreurs
+    errors.setFormatter(logging.Formatter("%(asctime)s | %(levelname)s | %(message)s"))
+
+    # Tout, en JSON : un fichier par jour
+    structured = logging.handlers.TimedRotatingFileHandler(
+        os.path.join(LOG_DIR, "arch.jsonl"), when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+    )
+    structured.setLevel(LOG_LEVEL)
+    structured.setFormatter(JsonFormatter())
+    return errors, structured
+
+
+class _Listener(logging.handlers.QueueListener):
+    """``QueueListener`` dont l'arrêt attend une place dans la file pleine au lieu d'échouer,
+    et n'attend la fin du thread que ``STOP_TIMEOUT`` secondes."""
+
+    def enqueue_sentinel(self) -> None:
+        # le thread d'écriture vide la file : une place se libère vite
+        self.queue.put(self._sentinel, timeout=STOP_TIMEOUT)
+
+    def stop(self) -> bool:
+        """``True`` once the thread is over, ``False`` if it is still writing."""
+        thread = self._thread
+        if thread is None:
+            return True
+        self.enqueue_sentinel()
+        thread.join(STOP_TIMEOUT)
+        if thread.is_alive():
+            return False
+        self._thread = None
+        return True
 
-# Créer un dossier "logs" s’il n’existe pas
-if not os.path.exists("logs"):
-    os.makedirs("logs")
 
 # Créer un logger nommé "arch"
 logger = logging.getLogger("arch")
-logger.setLevel(logging.INFO)  # Peut être DEBUG, INFO, WARNING, ERROR, CRITICAL
+logger.setLevel(LOG_LEVEL)  # Peut être DEBUG, INFO, WARNING, ERROR, CRITICAL
+
+# File posée dès l'import : les enregistrements y attendent le démarrage de l'écriture
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+queue_handler = NonBlockingQueueHandler(_queue)
+queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+queue_handler.addFilter(RequestContextFilter())
+logger.addHandler(queue_handler)
+
+_listener: "logging.handlers.QueueListener | None" = None
+_listener_lock = threading.Lock()
+
+
+def start_logging() -> None:
+    """Open the log files and start the writing thread, once per process.
 
-# Créer un gestionnaire de fichier qui enregistre les erreurs dans logs/errors.log
-file_handler = logging.FileHandler("logs/errors.log")
-file_handler.setLevel(logging.ERROR)  # On n'enregistre que les erreurs
+    Called by :func:`app.bootstrap.bootstrap`; importing this module has no
+    side effect on disk. The thread is stopped, queue drained, at exit.
+    """
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        _listener = _Listener(_queue, *_file_handlers(), respect_handler_level=True)
+        _listener.start()
+    atexit.register(stop_logging)
 
-# Définir le format du log (date, niveau, message)
-formatter = logging.Formatter("%(asctime)s | %(levelname)s | %(message)s")
-file_handler.setFormatter(formatter)
 
-# Ajouter ce handler au logger principal
-logger.addHandler(file_handler)
+def stop_logging() -> None:
+    """Write what is queued and stop the writing thread (idempotent)."""
+    global _listener
+    with _listener_lock:
+        listener, _listener = _listener, None
+    if listener is None:
+        return
+    try:
+        stopped = listener.stop()
+    except queue.Full:
+        stopped = False
+    if not stopped:
+        # thread d'écriture bloqué : on n'attend pas plus la fin du processus, et on ne
+        # ferme pas des fichiers dans lesquels il écrit peut-être encore
+        LOG_RECORDS_DROPPED.inc(reason="shutdown")
+        print("arch : le thread d'écriture des logs ne s'est pas arrêté, fichiers laissés ouverts", file=sys.stderr)
+        return
+    for handler in listener.handlers:
+        handler.close()
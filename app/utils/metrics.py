@@ -0,0 +1,317 @@
+# app/utils/metrics.py
+"""In-process metrics, exposed in the Prometheus text format on ``/metrics``.
+
+:class:`Counter` and :class:`Histogram` are plain Python objects guarded by
+a lock: an observation is a dict lookup and a ``bisect``, cheap enough to
+stay on in production. Values that already live elsewhere (the counters of
+:class:`~app.dialogue.llm_client.LLMMetrics`...) are exported by collectors,
+functions called at scrape time.
+
+Each HTTP request gets a :class:`RequestStats` (id, SQL query count and
+time, stage timings) held in a ``ContextVar``; ``asyncio.to_thread`` and
+the threadpool copy the context, so work done in worker threads is counted
+for the request that caused it. :class:`RequestMetricsMiddleware` creates
+it, answers with an ``X-Request-ID`` header, records the request metrics
+and logs one structured line per request.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from app.config import METRICS_ENABLED
+
+# enfant du logger "arch" (app.utils.logger, qui importe ce module)
+_access_log = logging.getLogger("arch.http")
+
+# secondes : de la requête SQLite (~0,1 ms) à l'appel du modèle (dizaines de s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} attend les labels {self.labelnames}, reçu {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic total, per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Cumulative buckets, sum and count of observations, per label set."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List] = {}  # -> [compte par bucket (+Inf en dernier), somme]
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        lines = self.header()
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+# Collecteur : appelé à chaque lecture de /metrics, renvoie des lignes au format texte
+Collector = Callable[[], Iterable[str]]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrique déjà enregistrée : {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Collector) -> None:
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "arch_http_request_duration_seconds", "Durée des requêtes HTTP, jusqu'au dernier octet", ("method", "route", "status")
+)
+HTTP_DB_QUERIES = REGISTRY.histogram(
+    "arch_http_request_db_queries",
+    "Requêtes SQL exécutées par requête HTTP",
+    ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+HTTP_DB_SECONDS = REGISTRY.histogram(
+    "arch_http_request_db_seconds", "Temps passé dans SQLite par requête HTTP", ("route",)
+)
+STAGE_SECONDS = REGISTRY.histogram("arch_stage_duration_seconds", "Durée des étapes du dialogue", ("stage",))
+
+
+# ----- contexte de la requête -----
+
+
+@dataclass
+class RequestStats:
+    request_id: str
+    started: float = field(default_factory=time.perf_counter)
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    timings: Dict[str, float] = field(default_factory=dict)  # étape -> secondes
+
+    def add_query(self, seconds: float) -> None:
+        # += sur des attributs : au pire une requête perdue entre deux threads, pas de verrou à payer
+        self.db_queries += 1
+        self.db_seconds += seconds
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_request() -> Optional[RequestStats]:
+    """Stats of the HTTP request being handled, ``None`` outside requests."""
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """Time a stage: ``arch_stage_duration_seconds{stage=...}`` and the request timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+        stats = _current.get()
+        if stats is not None:
+            stats.timings[stage] = stats.timings.get(stage, 0.0) + elapsed
+
+
+_REQUEST_ID = re.compile(r"^[\w.\-]{1,64}$")
+
+
+def new_request_id(proposed: Optional[str] = None) -> str:
+    """Keep a client-supplied id if it looks sane, else make one."""
+    if proposed and _REQUEST_ID.match(proposed):
+        return proposed
+    return uuid.uuid4().hex[:16]
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware: request id, per-request stats and HTTP metrics.
+
+    Timed up to the last body chunk, so streamed responses count in full.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or ())
+        stats = RequestStats(new_request_id(headers.get(b"x-request-id", b"").decode("latin-1")))
+        token = _current.set(stats)
+        status = [500]
+
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", stats.request_id.encode("latin-1"))
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - stats.started
+            # gabarit de la route (/souvenirs/{souv_id}) : cardinalité bornée
+            path = getattr(scope.get("route"), "path", None) or "unmatched"
+            if METRICS_ENABLED:
+                HTTP_SECONDS.observe(elapsed, method=scope["method"], route=path, status=str(status[0]))
+                HTTP_DB_QUERIES.observe(stats.db_queries, route=path)
+                HTTP_DB_SECONDS.observe(stats.db_seconds, route=path)
+            # une ligne JSON par requête (échantillonnée comme tout ce qui est sous WARNING)
+            _access_log.info(
+                f"{scope['method']} {scope.get('path')} {status[0]} {elapsed * 1000:.1f} ms",
+                extra={
+                    "request_id": stats.request_id,
+                    "timings": stats.timings,
+                    "route": path,
+                    "status": status[0],
+                    "duration_ms": round(elapsed * 1000, 3),
+                    "db_queries": stats.db_queries,
+                    "db_ms": round(stats.db_seconds * 1000, 3),
+                },
+            )
@@ -0,0 +1,44 @@
+"""Comptage de tokens mis en cache, pour budgéter le contexte envoyé au modèle."""
+
+from functools import lru_cache
+from math import ceil
+from typing import Optional
+
+from app.config import OPENAI_MODEL
+from app.utils.logger import logger
+
+# Surcoût approximatif d'un message dans le format chat (rôle, séparateurs)
+MESSAGE_OVERHEAD = 4
+
+CHARS_PER_TOKEN = 4  # estimation utilisée si tiktoken est indisponible
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """Return the tiktoken encoding of ``model``, or None when it cannot be loaded."""
+    try:
+        import tiktoken
+
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:  # tiktoken absent, ou fichiers BPE non téléchargeables
+        logger.warning(f"tiktoken indisponible ({e}), estimation à {CHARS_PER_TOKEN} caractères par token")
+        return None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: Optional[str], model: str = OPENAI_MODEL) -> int:
+    """Number of tokens of ``text`` for ``model``."""
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def message_tokens(content: Optional[str], model: str = OPENAI_MODEL) -> int:
+    """Tokens taken by one chat message whose text is ``content``."""
+    return count_tokens(content, model) + MESSAGE_OVERHEAD
@@ -0,0 +1,224 @@
+# benchmarks/cases.py
+"""The measured operations.
+
+Each case is a ``setup(rng, scale)`` returning the zero-argument callable
+that is timed; setup work (loading a table, picking keys) is not measured.
+Random choices come from ``rng``, seeded by the runner, so every run
+issues the same calls.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from benchmarks.dataset import VOCABULARY, users
+
+Timed = Callable[[], object]
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Callable[[random.Random, int], Timed]
+    max_repeat: Optional[int] = None  # opérations lourdes : moins de répétitions
+
+
+CASES: List[Case] = []
+
+
+def case(name: str, max_repeat: Optional[int] = None):
+    def register(setup: Callable[[random.Random, int], Timed]) -> Callable[[random.Random, int], Timed]:
+        CASES.append(Case(name, setup, max_repeat))
+        return setup
+
+    return register
+
+
+def _query(rng: random.Random, words: int = 3) -> str:
+    return " ".join(rng.choices(VOCABULARY, k=words))
+
+
+def _key(rng: random.Random, scale: int):
+    """A souvenir key of the dataset (cf. benchmarks.dataset.generate)."""
+    owners = users(scale)
+    i = rng.randrange(scale)
+    return i + 1, owners[i % len(owners)]
+
+
+# ----- app.memory.crud -----
+
+
+@case("crud.create_souvenir")
+def _create_souvenir(rng, scale):
+    from app.memory.crud import create_souvenir
+    from app.models.memory import Souvenir
+
+    def run():
+        text = _query(rng, 12)
+        return create_souvenir(Souvenir(type="conversation", content=text, full_content=text, user_name="Nemo"))
+
+    return run
+
+
+@case("crud.create_souvenirs[100]")
+def _create_souvenirs(rng, scale):
+    from app.memory.crud import create_souvenirs
+    from app.models.memory import Souvenir
+
+    def run():
+        return create_souvenirs(
+            Souvenir(type="conversation", content=text, full_content=text, user_name="Noesis")
+            for text in (_query(rng, 12) for _ in range(100))
+        )
+
+    return run
+
+
+@case("crud.get_souvenir")
+def _get_souvenir(rng, scale):
+    from app.memory.crud import get_souvenir
+
+    return lambda: get_souvenir(*_key(rng, scale))
+
+
+@case("crud.get_souvenirs_by_ids[50]")
+def _get_souvenirs_by_ids(rng, scale):
+    from app.memory.crud import get_souvenirs_by_ids
+
+    return lambda: get_souvenirs_by_ids([_key(rng, scale)[0] for _ in range(50)])
+
+
+@case("crud.seek_souvenirs[20]")
+def _seek_souvenirs(rng, scale):
+    from app.memory.crud import seek_souvenirs
+
+    return lambda: seek_souvenirs(20, user_name="Nemo")
+
+
+@case("crud.seek_souvenirs_page.deep[20]")
+def _seek_souvenirs_page(rng, scale):
+    from app.memory.crud import seek_souvenirs_page
+
+    cursor = None
+    for _ in range(10):
+        _, cursor = seek_souvenirs_page(20, cursor)
+    return lambda: seek_souvenirs_page(20, cursor)
+
+
+@case("crud.seek_souvenirs_by_weight[20]")
+def _seek_by_weight(rng, scale):
+    from app.memory.crud import seek_souvenirs_by_weight
+
+    return lambda: seek_souvenirs_by_weight(20)
+
+
+@case("crud.search_souvenirs")
+def _search(rng, scale):
+    from app.memory.crud import search_souvenirs
+
+    return lambda: search_souvenirs(_query(rng), limit=20)
+
+
+@case("crud.update_souvenir")
+def _update(rng, scale):
+    from app.memory.crud import update_souvenir
+
+    def run():
+        souv_id, user_name = _key(rng, scale)
+        return update_souvenir(souv_id, {"importance": rng.random()}, user_name=user_name)
+
+    return run
+
+
+@case("crud.get_links_pour_souvenir")
+def _links(rng, scale):
+    from app.memory.crud import get_links_pour_souvenir
+
+    return lambda: get_links_pour_souvenir(_key(rng, scale)[0])
+
+
+@case("crud.get_links_pour_souvenirs[50]")
+def _links_many(rng, scale):
+    from app.memory.crud import get_links_pour_souvenirs
+
+    return lambda: get_links_pour_souvenirs([_key(rng, scale)[0] for _ in range(50)])
+
+
+@case("graph.related[20]")
+def _related(rng, scale):
+    from app.memory.graph import link_graph
+
+    link_graph.load()
+    link_graph.csr()
+    return lambda: link_graph.related({_key(rng, scale)[0]: 1.0 for _ in range(5)}, k=20)
+
+
+# ----- app.memory.memory_weight -----
+
+
+@case("memory_weight.WeightTable.load", max_repeat=5)
+def _weight_load(rng, scale):
+    from app.memory.memory_weight import WeightTable
+
+    return WeightTable.load
+
+
+@case("memory_weight.probabilities")
+def _probabilities(rng, scale):
+    from app.memory.memory_weight import WeightTable
+
+    table = WeightTable.load()
+    return table.probabilities
+
+
+@case("memory_weight.reinforce_save[100]")
+def _reinforce(rng, scale):
+    from app.memory.memory_weight import WeightTable
+
+    table = WeightTable.load()
+
+    def run():
+        table.reinforce(np.array([rng.randrange(len(table)) for _ in range(100)]))
+        return table.save()
+
+    return run
+
+
+@case("memory_weight.elo_tournament[10k]")
+def _elo(rng, scale):
+    from app.memory.memory_weight import elo_tournament
+
+    np_rng = np.random.default_rng(rng.randrange(2**32))
+    weights = np_rng.uniform(0, 1, scale)
+    a = np_rng.integers(0, scale, 10_000)
+    b = (a + np_rng.integers(1, scale, 10_000)) % scale
+    score = np_rng.integers(0, 2, 10_000).astype(np.float64)
+    return lambda: elo_tournament(weights, a, b, score)
+
+
+# ----- assemblage du contexte -----
+
+
+def _context_manager():
+    from app.models.context import ContextManager
+
+    # ni mémoire de travail, ni pensées de fond, ni écriture des accès : on mesure la lecture
+    manager = ContextManager(background=None, working=None, accesses=None)
+    manager.append_bio(1)
+    return manager
+
+
+@case("context.rank_souvenirs")
+def _rank(rng, scale):
+    manager = _context_manager()
+    return lambda: manager.rank_souvenirs(_query(rng))
+
+
+@case("context.build_context")
+def _build(rng, scale):
+    manager = _context_manager()
+    return lambda: manager.build_context(_query(rng))
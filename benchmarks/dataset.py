@@ -0,0 +1,181 @@
+# benchmarks/dataset.py
+"""Synthetic, reproducible datasets for the benchmarks.
+
+A dataset of scale ``n`` has ``n`` souvenirs spread over a few users, ``n``
+fragments, ``n / 20`` links and ``n / 2`` associations of each kind
+(link–souvenir, link–fragment). Texts are drawn from a fixed French
+vocabulary so the FTS index has realistic posting lists; everything derives
+from ``seed``, so two runs at the same scale measure the same data.
+
+Rows are written with Core ``executemany`` inserts, in chunks: the ORM hooks
+do not run, so ``tokens_*`` and ``weight_score`` are computed here.
+"""
+
+from __future__ import annotations
+
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import numpy as np
+from sqlalchemy import func, select
+
+from app.memory.decay import epoch_days, weight_scores
+from app.memory.db import engine
+from app.models.memory import EmoLvl2ToLv1, Fragment, Link, LinkFragment, LinkSouvenir, Souvenir
+from app.models.user import User
+
+SCALES: Dict[str, int] = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+CHUNK = 10_000
+USERS = ("Nemo", "Noesis")
+
+VOCABULARY = (
+    "souvenir mémoire pensée rêve lumière nuit matin forêt rivière musique silence voix regard main "
+    "maison chemin ville mer ciel étoile feu pluie vent hiver été printemps automne livre lettre "
+    "projet code idée question réponse doute espoir peur joie colère tristesse surprise confiance "
+    "attente ami frère sœur enfant parent voyage retour départ fenêtre porte jardin fleur arbre "
+    "chat chien oiseau montagne neige sable pierre couleur rouge bleu vert noir blanc temps heure"
+).split()
+EMOTIONS = ("joie", "peur", "colère", "tristesse", "surprise", "confiance", "dégoût", "attente", "🖤", "✨")
+TYPES = ("conversation", "doc", "creation", "imaginary")
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, k=words))
+
+
+def _chunks(total: int) -> Iterator[range]:
+    for start in range(0, total, CHUNK):
+        yield range(start, min(start + CHUNK, total))
+
+
+def users(scale: int) -> List[str]:
+    """Owners of the souvenirs: the default users plus one per 10k souvenirs."""
+    return list(USERS) + [f"bench_{i}" for i in range(scale // 10_000)]
+
+
+def generated_scale() -> int:
+    """Scale of the dataset already in the database, 0 if empty.
+
+    Counted on fragments, which no benchmark case creates.
+    """
+    with engine.connect() as connection:
+        return connection.execute(select(func.count()).select_from(Fragment.__table__)).scalar_one()
+
+
+def generate(scale: int, seed: int = 0) -> Dict[str, int]:
+    """Fill the (empty, bootstrapped) database; return the number of rows per table."""
+    rng = random.Random(seed)
+    owners = users(scale)
+    now = datetime.utcnow()
+    n_links = max(scale // 20, 1)
+    n_pairs = scale // 2
+    counts: Dict[str, int] = {}
+
+    with engine.begin() as connection:
+        connection.execute(
+            User.__table__.insert().prefix_with("OR IGNORE"),
+            [{"user_name": name, "permissions": "user", "type": "human", "is_active": True} for name in owners],
+        )
+        connection.execute(
+            EmoLvl2ToLv1.__table__.insert().prefix_with("OR IGNORE"),
+            [
+                {"emo_lvl2": tag, **{name: int(i % 8 == j) for j, name in enumerate(
+                    ("joy", "trust", "fear", "surprise", "sadness", "disgust", "anger", "anticipation"))}}
+                for i, tag in enumerate(EMOTIONS)
+            ],
+        )
+        counts["user"] = len(owners)
+
+        # souvenir i : souv_id = i + 1, propriétaire owners[i % len(owners)]
+        keys = [(i + 1, owners[i % len(owners)]) for i in range(scale)]
+        for chunk in _chunks(scale):
+            rows = []
+            weights = np.array([rng.uniform(0.01, 1.0) for _ in chunk])
+            accessed = [now - timedelta(days=rng.uniform(0, 365)) for _ in chunk]
+            scores = weight_scores(weights, np.array([epoch_days(t) for t in accessed]))
+            for offset, i in enumerate(chunk):
+                content = _text(rng, 12)
+                full_content = content + " " + _text(rng, 40)
+                rows.append(
+                    {
+                        "souv_id": keys[i][0],
+                        "user_name": keys[i][1],
+                        "type": rng.choice(TYPES),
+                        "content": content,
+                        "full_content": full_content,
+                        "summary": _text(rng, 6),
+                        "time": now - timedelta(days=rng.uniform(0, 730)),
+                        "weight": float(weights[offset]),
+                        "importance": rng.random(),
+                        "emo_lvl2": " ".join(rng.sample(EMOTIONS, 2)),
+                        "tokens_content": 14,
+                        "tokens_full_content": 60,
+                        "tokens_summary": 8,
+                        "last_accessed": accessed[offset],
+                        "weight_score": float(scores[offset]),
+                    }
+                )
+            connection.execute(Souvenir.__table__.insert(), rows)
+        counts["souvenir"] = scale
+
+        # fragment j : rattaché à un souvenir tiré au hasard
+        fragment_owner = [keys[rng.randrange(scale)] for _ in range(scale)]
+        for chunk in _chunks(scale):
+            rows = []
+            weights = np.array([rng.uniform(0.01, 1.0) for _ in chunk])
+            scores = weight_scores(weights, np.full(len(chunk), epoch_days(now)))
+            for offset, j in enumerate(chunk):
+                content = _text(rng, 20)
+                souv_id, user_name = fragment_owner[j]
+                rows.append(
+                    {
+                        "frag_id": j + 1,
+                        "souv_id": souv_id,
+                        "user_name": user_name,
+                        "type": "conversation",
+                        "content": content,
+                        "full_content": content,
+                        "weight": float(weights[offset]),
+                        "importance": rng.random(),
+                        "is_last_version": True,
+                        "tokens_content": 24,
+                        "tokens_full_content": 24,
+                        "last_accessed": now,
+                        "weight_score": float(scores[offset]),
+                    }
+                )
+            connection.execute(Fragment.__table__.insert(), rows)
+        counts["fragment"] = scale
+
+        connection.execute(
+            Link.__table__.insert(),
+            [
+                {
+                    "link_id": k + 1,
+                    "type": "theme",
+                    "name": rng.choice(VOCABULARY),
+                    "description": _text(rng, 8),
+                    "weight": rng.uniform(-1, 3),
+                    "total_token": 10,
+                }
+                for k in range(n_links)
+            ],
+        )
+        counts["link"] = n_links
+
+        for table, total, name in (
+            (LinkSouvenir.__table__, scale, "souv_id"),
+            (LinkFragment.__table__, scale, "frag_id"),
+        ):
+            pairs = {(rng.randrange(total) + 1, rng.randrange(n_links) + 1) for _ in range(n_pairs)}
+            pairs = sorted(pairs)
+            for chunk in _chunks(len(pairs)):
+                connection.execute(
+                    table.insert(), [{name: pairs[i][0], "link_id": pairs[i][1]} for i in chunk]
+                )
+            counts[table.name] = len(pairs)
+
+        connection.exec_driver_sql("ANALYZE")
+    return counts
@@ -0,0 +1,196 @@
+# benchmarks/run.py
+"""Benchmark runner.
+
+    python -m benchmarks.run --scale 10k                      # mesure, compare à baseline.json
+    python -m benchmarks.run --scale 10k 100k -o results.json
+    python -m benchmarks.run --scale 10k --save-baseline      # remplace la référence
+    python -m benchmarks.run --scale 1m --db /tmp/bench-1m.db # jeu gardé et réutilisé
+
+Each scale runs in its own process against its own SQLite file (the engine
+is built from ``DATABASE_URL`` at import), generated by
+:mod:`benchmarks.dataset` in a temporary directory unless ``--db`` is given.
+Results are JSON: per scale and case, ``median_ms``, ``p95_ms``, ``min_ms``
+and the number of calls. The comparison flags a case as a regression when
+its median is more than ``--threshold`` slower than the baseline (and by
+more than ``--min-delta-ms``); the exit status is then 1.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASELINE = Path(__file__).with_name("baseline.json")
+
+
+def _stats(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "median_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+        "calls": len(ordered),
+    }
+
+
+def run_scale(scale_name: str, repeat: int, warmup: int, seed: int, only: Optional[List[str]]) -> Dict:
+    """Measure every case at one scale; ``DATABASE_URL`` must already point at the benchmark file."""
+    from app.bootstrap import bootstrap
+    from benchmarks import dataset
+    from benchmarks.cases import CASES
+
+    scale = dataset.SCALES[scale_name]
+    bootstrap()
+    generated = None
+    existing = dataset.generated_scale()
+    if existing != scale:
+        if existing:
+            raise SystemExit(f"La base contient un jeu de taille {existing}, pas {scale} : utiliser une autre --db")
+        started = time.perf_counter()
+        counts = dataset.generate(scale, seed)
+        generated = {"seconds": round(time.perf_counter() - started, 2), "rows": counts}
+
+    results: Dict[str, Dict] = {}
+    for case in CASES:
+        if only and not any(pattern in case.name for pattern in only):
+            continue
+        rng = random.Random(f"{seed}:{case.name}")
+        timed = case.setup(rng, scale)
+        calls = min(repeat, case.max_repeat or repeat)
+        for _ in range(min(warmup, calls)):
+            timed()
+        samples = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            timed()
+            samples.append(time.perf_counter() - started)
+        results[case.name] = _stats(samples)
+        print(f"  {scale_name:>5} {case.name:<40} {results[case.name]['median_ms']:>10.3f} ms", file=sys.stderr)
+    return {"generated": generated, "cases": results}
+
+
+def _metadata(args) -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "created": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.platform(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+    }
+
+
+def _child(args, scale_name: str, db_path: Path) -> Dict:
+    """Run one scale in a fresh interpreter bound to ``db_path``."""
+    with tempfile.NamedTemporaryFile("r", suffix=".json", delete=False) as out:
+        output = Path(out.name)
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--worker", str(output),
+        "--scale", scale_name, "--repeat", str(args.repeat), "--warmup", str(args.warmup), "--seed", str(args.seed),
+    ]
+    if args.only:
+        command += ["--only", *args.only]
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+    try:
+        subprocess.run(command, env=env, check=True, cwd=Path(__file__).resolve().parent.parent)
+        return json.loads(output.read_text())
+    finally:
+        output.unlink(missing_ok=True)
+
+
+def compare(results: Dict, baseline: Dict, threshold: float, min_delta_ms: float) -> List[str]:
+    """Lines describing each case against the baseline; regressions start with ``REGRESSION``."""
+    lines = []
+    for scale_name, scale in results["scales"].items():
+        reference = baseline.get("scales", {}).get(scale_name, {}).get("cases", {})
+        for name, current in scale["cases"].items():
+            if name not in reference:
+                lines.append(f"new         {scale_name:>5} {name:<40} {current['median_ms']:>10.3f} ms")
+                continue
+            before, after = reference[name]["median_ms"], current["median_ms"]
+            ratio = after / before if before else float("inf")
+            regression = ratio > 1 + threshold and after - before > min_delta_ms
+            label = "REGRESSION" if regression else ("faster" if ratio < 1 - threshold else "ok")
+            lines.append(
+                f"{label:<11} {scale_name:>5} {name:<40} {before:>10.3f} -> {after:>10.3f} ms  ({ratio:.2f}x)"
+            )
+    return lines
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", nargs="+", default=["10k"], choices=["10k", "100k", "1m"])
+    parser.add_argument("--repeat", type=int, default=50, help="appels mesurés par cas")
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="+", help="ne garder que les cas dont le nom contient un de ces motifs")
+    parser.add_argument("--db", type=Path, help="fichier SQLite à réutiliser (une seule échelle)")
+    parser.add_argument("-o", "--output", type=Path, help="écrire les résultats JSON ici")
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="écrire les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=0.25, help="ralentissement toléré (0.25 = +25 %%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.05, help="écart absolu en dessous duquel on ignore")
+    parser.add_argument("--worker", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        result = run_scale(args.scale[0], args.repeat, args.warmup, args.seed, args.only)
+        args.worker.write_text(json.dumps(result))
+        return 0
+
+    if args.db and len(args.scale) > 1:
+        parser.error("--db ne s'utilise qu'avec une seule échelle")
+
+    results = {"meta": _metadata(args), "scales": {}}
+    for scale_name in args.scale:
+        workdir = None
+        if args.db:
+            db_path = args.db.resolve()
+        else:
+            workdir = Path(tempfile.mkdtemp(prefix=f"arch-bench-{scale_name}-"))
+            db_path = workdir / "bench.db"
+        try:
+            results["scales"][scale_name] = _child(args, scale_name, db_path)
+        finally:
+            if workdir is not None:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    report = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        args.output.write_text(report + "\n")
+    else:
+        print(report)
+
+    if args.save_baseline:
+        args.baseline.write_text(report + "\n")
+        print(f"Référence écrite dans {args.baseline}", file=sys.stderr)
+        return 0
+    if not args.baseline.exists():
+        print(f"Pas de référence ({args.baseline}) : rien à comparer", file=sys.stderr)
+        return 0
+    lines = compare(results, json.loads(args.baseline.read_text()), args.threshold, args.min_delta_ms)
+    print("\n".join(lines), file=sys.stderr)
+    return 1 if any(line.startswith("REGRESSION") for line in lines) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+# Base et logs jetables : l'engine est construit à l'import de app.memory.db,
+# ces variables doivent donc être posées avant tout import de app.
+_tmp = tempfile.mkdtemp(prefix="arch-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/arch.db"
+os.environ["LOG_DIR"] = os.path.join(_tmp, "logs")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    from app.bootstrap import bootstrap
+
+    bootstrap()
+    yield
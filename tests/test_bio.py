@@ -0,0 +1,33 @@
+from app.context.bio_manager import Bio
+from app.memory.crud import create_souvenir, update_souvenir
+from app.models.context import ContextManager
+from app.models.memory import Souvenir
+
+
+def _same_id_for(*users):
+    """Le souvenir 1 de chaque utilisateur, contenu distinct."""
+    for user in users:
+        content = f"souvenir de {user}"
+        create_souvenir(Souvenir(souv_id=1, type="bio", content=content, full_content=content, user_name=user))
+
+
+def test_bio_reads_only_its_user_souvenirs():
+    _same_id_for("bio-autre", "bio-arch")
+    bio = Bio("arch", user_name="bio-arch")
+    bio.append(1)
+    assert [m["content"] for m in bio.to_context_messages()] == ["[Bio-arch] souvenir de bio-arch"]
+
+    update_souvenir(1, {"content": "modifié ailleurs"}, user_name="bio-autre")
+    assert bio._messages is not None  # souvenir d'un autre utilisateur : cache gardé
+    update_souvenir(1, {"content": "je suis Arch"}, user_name="bio-arch")
+    assert [m["content"] for m in bio.to_context_messages()] == ["[Bio-arch] je suis Arch"]
+
+
+def test_context_excludes_only_the_bio_souvenir_of_its_user():
+    _same_id_for("ctx-autre", "ctx-arch")
+    manager = ContextManager(background=None, working=None, accesses=None)
+    manager.append_bio(1, user_name="ctx-arch")
+    contents = [m["content"] for m in manager.build_context("souvenir ctx")]
+    assert "[Bio-arch] souvenir de ctx-arch" in contents
+    assert "[Souvenir] souvenir de ctx-autre" in contents
+    assert "[Souvenir] souvenir de ctx-arch" not in contents
@@ -0,0 +1,19 @@
+from app.memory import emotions
+from app.memory.emotions import EmotionTable
+
+
+def test_invalidation_during_load_is_not_lost(monkeypatch):
+    table = EmotionTable()
+    get_session = emotions.get_session
+
+    def invalidated_while_reading():
+        table.invalidate()  # une écriture arrive entre la lecture et le stockage
+        return get_session()
+
+    monkeypatch.setattr(emotions, "get_session", invalidated_while_reading)
+    table.matrix
+    assert table._index is None  # la copie lue n'est pas gardée
+
+    monkeypatch.setattr(emotions, "get_session", get_session)
+    table.matrix
+    assert table._index is not None
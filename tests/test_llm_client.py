@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+from openai import AsyncOpenAI, OpenAI
+
+from app.dialogue.fake_server import FakeOpenAIServer, FakeReply
+from app.dialogue.llm_client import CircuitBreaker, LLMClient, LLMUnavailableError
+
+MESSAGES = [{"role": "user", "content": "bonjour"}]
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer() as fake:
+        yield fake
+
+
+def _client(server, **options) -> LLMClient:
+    options.setdefault("base_delay", 0.01)
+    options.setdefault("max_delay", 0.05)
+    return LLMClient(
+        client=OpenAI(api_key="test", base_url=server.base_url, max_retries=0),
+        async_client=AsyncOpenAI(api_key="test", base_url=server.base_url, max_retries=0),
+        **options,
+    )
+
+
+def _text(response) -> str:
+    return response.choices[0].message.content
+
+
+def _open(llm: LLMClient) -> None:
+    """Breaker ouvert, cooldown écoulé : le prochain appel est la sonde."""
+    llm.breaker._open("test", 0.0)
+
+
+def test_rate_limited_request_is_retried_and_paced(server, monkeypatch):
+    server.script.extend([FakeReply.rate_limited(retry_after=0), FakeReply.completion("ok")])
+    llm = _client(server, requests_per_minute=60)
+    reserved = []
+    reserve = llm.limiter.reserve
+    monkeypatch.setattr(llm.limiter, "reserve", lambda tokens: reserved.append(tokens) or reserve(tokens))
+    assert _text(llm.create(model="m", messages=MESSAGES)) == "ok"
+    assert len(server.requests) == 2
+    metrics = llm.metrics.snapshot()
+    assert (metrics["rate_limited"], metrics["retries"], metrics["successes"]) == (1, 1, 1)
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+    assert len(reserved) == 2  # chaque tentative passe par le limiteur
+
+
+def test_quota_error_opens_the_breaker_at_once(server):
+    server.script.append(FakeReply.quota())
+    llm = _client(server)
+    with pytest.raises(openai.RateLimitError):
+        llm.create(model="m", messages=MESSAGES)
+    assert llm.breaker.state == CircuitBreaker.OPEN
+    assert llm.breaker.reason == "insufficient_quota"
+    with pytest.raises(LLMUnavailableError):
+        llm.create(model="m", messages=MESSAGES)
+    assert len(server.requests) == 1  # ni retry ni appel une fois ouvert
+    assert llm.metrics.snapshot()["short_circuited"] == 1
+
+
+def test_transient_failures_open_then_probe_closes(server):
+    server.script.extend([FakeReply.server_error(), FakeReply.server_error()])
+    llm = _client(server, max_retries=1, breaker=CircuitBreaker(failure_threshold=1, cooldown=0.1))
+    with pytest.raises(openai.InternalServerError):
+        llm.create(model="m", messages=MESSAGES)
+    assert llm.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(LLMUnavailableError):
+        llm.create(model="m", messages=MESSAGES)
+
+    time.sleep(0.15)
+    server.script.append(FakeReply.completion("sonde", delay=0.3))
+    probe = threading.Thread(target=llm.create, kwargs={"model": "m", "messages": MESSAGES})
+    probe.start()
+    time.sleep(0.1)
+    assert llm.breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(LLMUnavailableError):  # une seule sonde à la fois
+        llm.create(model="m", messages=MESSAGES)
+    probe.join()
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_failed_probe_reopens_without_retry(server):
+    server.script.append(FakeReply.server_error())
+    llm = _client(server)
+    _open(llm)
+    with pytest.raises(openai.InternalServerError):
+        llm.create(model="m", messages=MESSAGES)
+    assert len(server.requests) == 1
+    assert llm.breaker.state == CircuitBreaker.OPEN
+
+
+def test_invalid_request_releases_the_probe(server):
+    server.script.append(FakeReply(400, {"error": {"message": "bad", "type": "invalid_request_error"}}))
+    llm = _client(server)
+    _open(llm)
+    with pytest.raises(openai.BadRequestError):
+        llm.create(model="m", messages=MESSAGES)
+    assert _text(llm.create(model="m", messages=MESSAGES)) == "echo: bonjour"
+    assert llm.breaker.state == CircuitBreaker.CLOSED
+
+
+# la sonde ne réessaie pas : pas d'attente de backoff à annuler
+@pytest.mark.parametrize("where", ["request", "throttle"])
+def test_cancelled_probe_is_released(server, where):
+    llm = _client(server, requests_per_minute=60, max_delay=10)
+    if where == "request":
+        server.script.append(FakeReply.completion("lent", delay=2))
+    else:
+        llm.limiter.requests._level = -60  # limiteur épuisé : l'appel attend avant d'envoyer
+    _open(llm)
+
+    async def scenario():
+        task = asyncio.create_task(llm.acreate(model="m", messages=MESSAGES))
+        await asyncio.sleep(0.2)
+        assert llm.breaker.state == CircuitBreaker.HALF_OPEN
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert not llm.breaker._probing
+    assert llm.breaker.before_call() is not None  # un nouvel appel peut sonder
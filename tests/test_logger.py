@@ -0,0 +1,35 @@
+import logging
+import queue
+import threading
+
+from app.utils import logger as log
+
+
+class _BlockedHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.closed = False
+
+    def emit(self, record):
+        self.unblock.wait()
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+def test_stop_leaves_a_busy_writer_open(monkeypatch, capsys):
+    handler = _BlockedHandler()
+    listener = log._Listener(queue.Queue(), handler)
+    listener.start()
+    listener.queue.put(logging.makeLogRecord({"msg": "lent"}))
+    monkeypatch.setattr(log, "STOP_TIMEOUT", 0.1)
+    monkeypatch.setattr(log, "_listener", listener)
+
+    log.stop_logging()
+    assert not handler.closed  # le thread écrit encore
+    assert "ne s'est pas arrêté" in capsys.readouterr().err
+
+    handler.unblock.set()
+    assert listener.stop()
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+from openai import OpenAI
+
+from app.dialogue import engine
+from app.dialogue.fake_server import FakeOpenAIServer
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with FakeOpenAIServer() as fake:
+        monkeypatch.setattr(engine.llm, "_client", OpenAI(api_key="test", base_url=fake.base_url, max_retries=0))
+        yield fake
+
+
+def test_prompts_never_share_a_cache_entry(server):
+    prompts = ["Parle-moi de la forêt", "Parle-moi de la mer", "Parle-moi de la forêt ?"]
+    keys = set()
+    for prompt in prompts:
+        messages, key, cached = engine._prepare(prompt, None, cache=True)
+        assert messages[-1] == {"role": "user", "content": prompt}
+        assert cached is None
+        keys.add(key)
+        assert engine.generate_response(prompt) == f"echo: {prompt}"
+    assert len(keys) == len(prompts)
+    assert [r["messages"][-1]["content"] for r in server.requests] == prompts
+
+
+def test_same_context_is_answered_from_the_cache(server):
+    prompt = "Que sais-tu des étoiles ?"
+    _, key, cached = engine._prepare(prompt, None, cache=True)
+    assert cached is None
+    engine.response_cache.put(key, engine.OPENAI_MODEL, "réponse gardée")
+    assert engine._prepare(prompt, None, cache=True)[1:] == (key, "réponse gardée")
+    assert engine._prepare(prompt, None, cache=False)[1:] == (None, None)
+    assert server.requests == []
+
+
+def test_model_slots_belong_to_their_event_loop():
+    async def slot():
+        async with engine._model_slot("m"):
+            return engine._model_slots[asyncio.get_running_loop()]["m"]
+
+    first, second = asyncio.run(slot()), asyncio.run(slot())
+    assert first is not second
+
+
+def test_hits_write_last_used_behind(monkeypatch):
+    from app.dialogue.response_cache import ResponseCache
+    from app.memory.db import get_session
+    from app.models.dialogue import CompletionCache
+
+    cache = ResponseCache(memory_size=0)  # chaque hit passe par la table
+    cache.put("k-touch", "m", "r")
+    with get_session() as session:
+        stored = session.get(CompletionCache, "k-touch").last_used
+
+    commits = []
+    monkeypatch.setattr("sqlmodel.Session.commit", lambda self: commits.append(self))
+    assert [cache.get("k-touch") for _ in range(3)] == ["r"] * 3
+    assert commits == []
+    monkeypatch.undo()
+
+    cache.flush()
+    with get_session() as session:
+        assert session.get(CompletionCache, "k-touch").last_used > stored
@@ -0,0 +1,23 @@
+from app.memory.crud import create_souvenir, create_souvenirs, souvenir_ids
+from app.models.memory import Souvenir
+
+
+def _souvenir(user_name, souv_id=None):
+    return Souvenir(souv_id=souv_id, type="t", content="c", full_content="c", user_name=user_name)
+
+
+def test_explicit_ids_mixed_with_allocated_ones():
+    user = "ids-mixed"
+    first = create_souvenir(_souvenir(user)).souv_id
+    create_souvenirs([_souvenir(user, first + 9), _souvenir(user, first + 499)])
+    create_souvenir(_souvenir(user, first + 3))
+    ids = [create_souvenir(_souvenir(user)).souv_id for _ in range(600)]
+    assert len(set(ids)) == len(ids)
+    assert not {first, first + 3, first + 9, first + 499} & set(ids)
+
+
+def test_explicit_id_inside_the_held_block_is_skipped():
+    user = "ids-block"
+    first = souvenir_ids.allocate(user)[0]
+    souvenir_ids.claim(user, [first + 5, first + 2])
+    assert souvenir_ids.allocate(user)[0] == first + 6
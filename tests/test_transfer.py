@@ -0,0 +1,48 @@
+import functools
+import json
+
+from fastapi.testclient import TestClient
+
+from app.dialogue import souvenirs_router
+from app.main import app
+from app.memory.crud import create_souvenir, get_souvenir
+from app.memory.transfer import Importer, export_chunks
+from app.models.memory import Souvenir
+
+
+def _export(souvenir: Souvenir, ids):
+    """Export réduit à des copies de ``souvenir`` sous les ``ids`` donnés."""
+    header, *entries = [json.loads(line) for line in "".join(export_chunks()).splitlines()]
+    name = Souvenir.__table__.name
+    row = next(
+        entry["row"]
+        for entry in entries
+        if entry.get("table") == name
+        and (entry["row"]["souv_id"], entry["row"]["user_name"]) == (souvenir.souv_id, souvenir.user_name)
+    )
+    rows = [json.dumps({"table": name, "row": {**row, "souv_id": souv_id}}) for souv_id in ids]
+    return [json.dumps(header), *rows, json.dumps({"end": {name: len(ids)}})]
+
+
+def _chunks(text: str, size: int = 7):
+    data = text.encode("utf-8")
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def test_import_is_all_or_nothing(monkeypatch):
+    monkeypatch.setattr(souvenirs_router, "Importer", functools.partial(Importer, batch_size=1))
+    souvenir = create_souvenir(Souvenir(type="t", content="c", full_content="", user_name="Nemo"))
+    ids = [souvenir.souv_id + 10_000 + i for i in range(3)]
+    lines = _export(souvenir, ids)
+
+    with TestClient(app) as client:
+        truncated = "\n".join(lines[:-1]) + "\n"
+        response = client.post("/souvenirs/import", content=_chunks(truncated))
+        assert response.status_code == 400
+        assert all(get_souvenir(souv_id, user_name="Nemo") is None for souv_id in ids)
+
+        response = client.post("/souvenirs/import", content=_chunks("\n".join(lines) + "\n"))
+        assert response.status_code == 200
+        assert response.json() == {Souvenir.__table__.name: 3}
+        assert all(get_souvenir(souv_id, user_name="Nemo") is not None for souv_id in ids)
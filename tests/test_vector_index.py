@@ -0,0 +1,140 @@
+import random
+
+import numpy as np
+import pytest
+
+from app.memory.crud import create_souvenir, update_souvenir
+from app.memory.fragmenter import current_fragments
+from app.memory.vector_index import FragmentVectorStore, VectorIndex, hashing_embedder
+from app.models.memory import Souvenir
+
+WORDS = (
+    "souvenir mémoire pensée rêve lumière nuit matin forêt rivière musique silence voix regard main "
+    "maison chemin ville mer ciel étoile feu pluie vent hiver été printemps automne livre lettre"
+).split()
+
+
+# vocabulaire assez large pour éviter les ex æquo entre voisins
+VOCABULARY = [f"{word}{n}" for word in WORDS for n in range(20)]
+
+
+def _texts(n, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=12)) for _ in range(n)]
+
+
+def _recall(index, queries, k, nprobe):
+    trained = index._centroids
+    found = [index.search(q, k, nprobe=nprobe) for q in queries]
+    index._centroids = None  # même index, recherche exacte
+    exact = [index.search(q, k) for q in queries]
+    index._centroids = trained
+    # un ex æquo du k-ième voisin exact compte comme trouvé
+    return np.mean([sum(score >= b[-1][1] - 1e-6 for _, score in a) / k for a, b in zip(found, exact)])
+
+
+def test_hashing_embedder_is_deterministic():
+    embed = hashing_embedder(64)
+    a, b = embed(["la forêt la nuit"]), embed(["la forêt la nuit"])
+    assert np.array_equal(a, b)
+    assert not np.array_equal(a, embed(["la mer le matin"]))
+
+
+def test_exact_search_ranks_the_same_text_first():
+    embed = hashing_embedder()
+    texts = _texts(2000)
+    index = VectorIndex(256)
+    index.add(list(range(len(texts))), embed(texts))
+    for i in (0, 17, 1999):
+        (key, score), *_ = index.search(embed([texts[i]])[0], k=5)
+        assert key == i and score == pytest.approx(1.0, abs=1e-5)
+
+
+def test_ivf_recall_and_incremental_updates():
+    embed = hashing_embedder()
+    texts = _texts(5000)
+    index = VectorIndex(256)
+    index.add(list(range(len(texts))), embed(texts))
+    index.train(nlist=32)
+    queries = embed(_texts(100, seed=1))
+    assert _recall(index, queries, k=10, nprobe=32) == pytest.approx(1.0)  # toutes les listes : exact
+    assert _recall(index, queries, k=10, nprobe=8) >= 0.8
+
+    # retraits et ajouts après entraînement : listes par cluster toujours cohérentes
+    removed = list(range(0, 5000, 3))
+    assert index.remove(removed) == len(removed)
+    fresh = _texts(500, seed=2)
+    index.add([("new", i) for i in range(500)], embed(fresh))
+    assert sorted(row for members in index._members for row in members) == list(range(len(index)))
+    for cluster, members in enumerate(index._members):
+        for slot, row in enumerate(members):
+            assert index._clusters[row] == cluster and index._slots[row] == slot
+    (key, _), *_ = index.search(embed([fresh[7]])[0], k=1, nprobe=32)
+    assert key == ("new", 7)
+    assert all(key not in removed for key, _ in index.search(embed([texts[0]])[0], k=50, nprobe=32))
+
+
+def test_store_follows_refragmented_souvenirs():
+    store = FragmentVectorStore(hashing_embedder()).follow()
+    souvenir = create_souvenir(Souvenir(type="doc", content="doc", full_content="", user_name="Nemo"))
+    update_souvenir(
+        souvenir.souv_id, {"full_content": "la forêt la nuit\n---\nla mer le matin"}, user_name="Nemo"
+    )
+    first = current_fragments(souvenir.souv_id, "Nemo")
+    assert {f.full_content for f in store.search_fragments("forêt nuit", k=2)} >= {"la forêt la nuit"}
+
+    update_souvenir(
+        souvenir.souv_id, {"full_content": "la rivière en hiver\n---\nla mer le matin"}, user_name="Nemo"
+    )
+    keys = {(f.frag_id, f.souv_id, f.user_name) for f in first}
+    old = next(f for f in first if f.full_content == "la forêt la nuit")
+    assert (old.frag_id, old.souv_id, old.user_name) not in store.index
+    assert all(key in store.index for key in keys - {(old.frag_id, old.souv_id, old.user_name)})
+    best = store.search_fragments("rivière hiver", k=1)
+    assert best[0].full_content == "la rivière en hiver" and best[0].is_last_version
+
+
+def test_app_store_backfills_follows_and_ranks_fragments():
+    from fastapi.testclient import TestClient
+
+    from app.main import app
+    from app.memory.vector_index import fragment_vectors
+    from app.models.context import ContextManager
+
+    before = create_souvenir(Souvenir(type="doc", content="doc", full_content="la lande sous le givre", user_name="Nemo"))
+    with TestClient(app):
+        assert fragment_vectors.ready
+        (old,) = current_fragments(before.souv_id, "Nemo")
+        assert (old.frag_id, old.souv_id, old.user_name) in fragment_vectors.index  # embeddé au démarrage
+
+        souvenir = create_souvenir(
+            Souvenir(type="doc", content="doc", full_content="le héron cendré pêche\n---\nla lande", user_name="Nemo")
+        )
+        fragments = current_fragments(souvenir.souv_id, "Nemo")
+        assert all((f.frag_id, f.souv_id, f.user_name) in fragment_vectors.index for f in fragments)
+
+        manager = ContextManager(user_name="Nemo", background=None, working=None, accesses=None)
+        assert manager.vectors is fragment_vectors
+        ranked = manager.rank_fragments("héron cendré")
+        assert ranked[0].full_content == "le héron cendré pêche"
+
+
+def test_souvenir_and_fragments_share_one_transaction(monkeypatch):
+    from app.memory import fragmenter
+    from app.memory.crud import create_souvenirs, get_souvenir
+
+    batch = create_souvenirs(
+        [Souvenir(type="doc", content="doc", full_content=f"a{i}\n---\nb{i}", user_name="Nemo") for i in range(3)]
+    )
+    assert [len(current_fragments(s.souv_id, "Nemo")) for s in batch] == [2, 2, 2]
+
+    def broken(session, inserted, chains):
+        session.add_all(inserted)
+        session.flush()
+        raise RuntimeError("écriture interrompue")
+
+    monkeypatch.setattr(fragmenter, "_write_fragments", broken)
+    with pytest.raises(RuntimeError):
+        update_souvenir(batch[0].souv_id, {"full_content": "c0\n---\nb0"}, user_name="Nemo")
+    assert get_souvenir(batch[0].souv_id, user_name="Nemo").full_content == "a0\n---\nb0"
+    assert [f.full_content for f in current_fragments(batch[0].souv_id, "Nemo")] == ["a0", "b0"]
@@ -0,0 +1,64 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from openai import AsyncOpenAI
+
+from app.context import working_memory as wm
+from app.context.working_memory import WorkingMemory, working_memory
+from app.dialogue import engine
+from app.dialogue.fake_server import FakeOpenAIServer
+from app.main import app
+from app.models.context import WORKING_MEMORY_PREFIX
+
+
+@pytest.fixture
+def server(monkeypatch):
+    with FakeOpenAIServer() as fake:
+        client = AsyncOpenAI(api_key="test", base_url=fake.base_url, max_retries=0)
+        monkeypatch.setattr(engine.llm, "_async_client", client)
+        yield fake
+
+
+def test_task_is_shown_kept_and_reloaded(server):
+    with TestClient(app) as client:
+        client.post("/dialogue/think", params={"prompt": "Où sont les clés ?", "task": "ménage"})
+        client.post("/dialogue/think", params={"prompt": "Et le parapluie ?", "task": "ménage"})
+        shown = [m["content"] for m in server.requests[-1]["messages"] if m["role"] == "system"]
+        assert WORKING_MEMORY_PREFIX + "Où sont les clés ?\n→ echo: Où sont les clés ?" in shown
+
+    # arrêt : tout est écrit ; redémarrage : la tâche revient de la table
+    working_memory.clear()
+    with TestClient(app) as client:
+        assert [e.content.split("\n")[0] for e in working_memory.recall("ménage")] == [
+            "Où sont les clés ?",
+            "Et le parapluie ?",
+        ]
+        assert client.delete("/dialogue/think/tasks/ménage").json() == {"deleted": 2}
+    assert working_memory.recall("ménage") == []
+
+
+def test_load_during_a_flush_does_not_duplicate(monkeypatch):
+    memory = WorkingMemory(flush_interval=0)
+    memory.remember("porte", "la clé est sous le pot")
+    get_session = wm.get_session
+    committed = threading.Event()
+
+    @contextmanager
+    def slow_session(*args, **kwargs):
+        with get_session(*args, **kwargs) as session:
+            yield session
+        committed.set()
+        time.sleep(0.2)  # INSERT écrit, BT_id pas encore reporté sur l'entrée
+
+    monkeypatch.setattr(wm, "get_session", slow_session)
+    flush = threading.Thread(target=memory.flush)
+    flush.start()
+    committed.wait()
+    monkeypatch.setattr(wm, "get_session", get_session)
+    memory.load_task("porte")
+    flush.join()
+    assert [e.content for e in memory.recall("porte")] == ["la clé est sous le pot"]
+    memory.complete_task("porte")